@@ -43,16 +43,21 @@ def challengeviewer_submit(request, slug):
     """
         View allows user to submit results
     """
+    if not request.user.is_authenticated():
+        url = reverse('challengeviewer_submit', args=[slug])
+        return HttpResponseRedirect(reverse('challengeviewer_login', args=[slug]) + '?next=' + url)
+
     challenge = Challenge.get_object(slug)
     
-    from repository.views.base import handle_result_form
+    from repository.views.base import handle_result_form, throttled_response
     form = handle_result_form(request)
     if form.added:
         return HttpResponseRedirect(reverse('challengeviewer_results', args=[slug]))
 
-    return render_to_response('challengeviewer/submit.html',
+    response = render_to_response('challengeviewer/submit.html',
                               RequestContext(request,{'challenge': challenge,
                                                       'form': form}))
+    return throttled_response(response, form)
 
 def challengeviewer_login(request, slug):
     """
@@ -32,8 +32,12 @@ class OpenIDMiddleware(object):
         request.openid = request.session.get('openid', None)
         request.openids = request.session.get('openids', [])
         
-        rels = UserAssociation.objects.filter(user__id=request.user.id)
-        request.associated_openids = [rel.openid_url for rel in rels]
+        # anonymous users have none, cached pages shouldn't query
+        if request.user.is_authenticated():
+            rels = UserAssociation.objects.filter(user__id=request.user.id)
+            request.associated_openids = [rel.openid_url for rel in rels]
+        else:
+            request.associated_openids = []
     
     def process_response(self, request, response):
         if response.status_code != 200 or len(response.content) < 200:
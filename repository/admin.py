@@ -70,12 +70,28 @@ admin.site.register(Task, TaskAdmin)
 
 class ChallengeAdmin(admin.ModelAdmin):
     """Admin class for Challenge"""
-    list_display = ('name', 'version', 'pub_date', 'slug', 'is_public', 'is_current')
+    list_display = ('name', 'version', 'pub_date', 'slug', 'is_public', 'is_current', 'max_daily_submissions')
     date_hierarchy = 'pub_date'
     list_filter =['pub_date', 'user', 'is_public', 'is_current', 'tags']
     search_fields = ['name']
 admin.site.register(Challenge, ChallengeAdmin)
 
+class SubmissionCounterAdmin(admin.ModelAdmin):
+    """Admin class for SubmissionCounter"""
+    list_display = ('day', 'user', 'challenge', 'accepted', 'rejected')
+    date_hierarchy = 'day'
+    list_filter =['day', 'challenge']
+    search_fields = ['user__username']
+admin.site.register(SubmissionCounter, SubmissionCounterAdmin)
+
+class ItemStatisticsAdmin(admin.ModelAdmin):
+    """Admin class for ItemStatistics"""
+    list_display = ('day', 'slug', 'format', 'hits', 'downloads')
+    date_hierarchy = 'day'
+    list_filter =['day', 'format']
+    search_fields = ['slug__text']
+admin.site.register(ItemStatistics, ItemStatisticsAdmin)
+
 class LicenseAdmin(admin.ModelAdmin):
     """Admin class for Challenge"""
     list_display = ('name', 'url')
@@ -0,0 +1,11 @@
+"""
+URL patterns for the JSON API
+"""
+
+from django.conf.urls.defaults import *
+import repository.views.api
+
+urlpatterns = patterns('',
+    url(r'^search/?$', repository.views.api.search, name='api_search'),
+    url(r'^(?P<kname>data|task|method|challenge)/$', repository.views.api.search, name='api_index'),
+)
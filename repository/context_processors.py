@@ -0,0 +1,23 @@
+"""
+Context processors for app Repository.
+"""
+
+from settings import FRAGMENT_CACHE_TIMEOUT
+from repository.models import PageCache
+
+
+def fragment_cache(request):
+    """Variables for caching template fragments with the cache tag.
+
+    Fragments are cached per generation of PageCache, so they are rendered
+    again after any change of items, results, comments or ratings.
+
+    @param request: request data
+    @type request: Django request
+    @return: cache_generation and fragment_cache_timeout
+    @rtype: dict
+    """
+    return {
+        'cache_generation': PageCache.get_generation(),
+        'fragment_cache_timeout': FRAGMENT_CACHE_TIMEOUT,
+    }
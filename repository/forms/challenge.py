@@ -20,7 +20,7 @@ class ChallengeForm(RepositoryForm):
         @type exclude: list
         """
         model = Challenge
-        exclude = ('pub_date', 'version', 'slug', 'user',)
+        exclude = ('pub_date', 'version', 'slug', 'user', 'max_daily_submissions',)
 
 
     def __init__(self, *args, **kwargs):
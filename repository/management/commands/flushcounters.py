@@ -0,0 +1,21 @@
+"""
+A management command which writes the buffered view and download counts
+to the database.
+
+Counts are flushed periodically while the site is in use. Run this before
+the cache is stopped or restarted, so the counts since the last flush
+aren't lost.
+"""
+
+from django.core.management.base import NoArgsCommand
+
+from repository.models import ItemCounter
+
+
+class Command(NoArgsCommand):
+    help = "Write buffered view and download counts to the database"
+
+    def handle_noargs(self, **options):
+        updated = ItemCounter.flush()
+        if int(options.get('verbosity', 1)) > 0:
+            print 'Updated counts of %d items' % updated
@@ -0,0 +1,55 @@
+"""
+A management command which imports the Data items listed in a manifest,
+see utils.slurper.bulk for its format.
+
+Prints one line per dataset, telling whether it was imported, and exits
+with status 1 if any dataset failed.
+"""
+
+import sys
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import simplejson
+
+from utils.slurper.bulk import BulkImport, BATCH_SIZE
+
+
+class Command(BaseCommand):
+    help = "Import the Data items listed in a JSON manifest"
+    args = '<manifest>'
+    option_list = BaseCommand.option_list + (
+        make_option('--processes', type='int', default=None,
+            help='Number of processes converting files, default one per CPU'),
+        make_option('--batch-size', type='int', default=BATCH_SIZE,
+            help='Number of items created in one transaction'),
+        make_option('--user', type='int', default=1,
+            help='Id of the user owning the items'),
+    )
+
+    def handle(self, *args, **options):
+        if len(args) != 1:
+            raise CommandError('Usage: importdata %s' % self.args)
+        try:
+            manifest = simplejson.load(open(args[0], 'r'))
+        except (IOError, ValueError), e:
+            raise CommandError('Cannot read manifest %s: %s' % (args[0], e))
+
+        importer = BulkImport(processes=options['processes'],
+            batch_size=options['batch_size'], user_id=options['user'])
+        report = importer.run(manifest)
+
+        verbosity = int(options.get('verbosity', 1))
+        failed = 0
+        for item in report:
+            if item['error']:
+                failed += 1
+                print 'FAILED %s: %s' % (item['name'], item['error'])
+            elif verbosity > 0:
+                print 'OK %s -> %s' % (item['name'], item['slug'])
+                if item['warning']:
+                    print '  WARNING: %s' % item['warning']
+        if verbosity > 0:
+            print 'Imported %d of %d datasets' % (len(report) - failed, len(report))
+        if failed:
+            sys.exit(1)
@@ -0,0 +1,23 @@
+"""
+A management command which reindexes all items for full-text search.
+
+The index is kept up to date when items are saved or deleted, this is only
+needed to fill it initially or after items were changed directly in the
+database.
+"""
+
+from django.core.management.base import NoArgsCommand
+
+from repository.models import Data, Task, Challenge, Method, SearchIndex
+
+
+class Command(NoArgsCommand):
+    help = "Rebuild the full-text search index"
+
+    def handle_noargs(self, **options):
+        SearchIndex.create()
+        if not SearchIndex.is_available():
+            print 'Full-text search is not supported by this database.'
+            return
+        for klass in (Data, Task, Challenge, Method):
+            SearchIndex.rebuild(klass)
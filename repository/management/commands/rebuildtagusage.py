@@ -0,0 +1,19 @@
+"""
+A management command which recounts the tag usage of all item classes.
+
+TagUsage is kept up to date when items are saved or deleted, this is only
+needed to fill the table initially or after items were changed directly in
+the database.
+"""
+
+from django.core.management.base import NoArgsCommand
+
+from repository.models import Data, Task, Challenge, Method, TagUsage
+
+
+class Command(NoArgsCommand):
+    help = "Recount tag usage for the tag clouds"
+
+    def handle_noargs(self, **options):
+        for klass in (Data, Task, Challenge, Method):
+            TagUsage.rebuild(klass)
@@ -0,0 +1,22 @@
+"""
+A management command which recomputes the rating aggregates of all items.
+
+The aggregates are kept up to date on every vote, this is only needed
+after ratings were changed directly in the database.
+"""
+
+from django.core.management.base import NoArgsCommand
+from django.db import transaction
+
+from repository.models import DataRating, TaskRating, MethodRating, ChallengeRating
+
+
+class Command(NoArgsCommand):
+    help = "Recompute rating averages and votes from the ratings"
+
+    @transaction.commit_on_success
+    def handle_noargs(self, **options):
+        for rklass in (DataRating, TaskRating, MethodRating, ChallengeRating):
+            repaired = rklass.repair()
+            if int(options.get('verbosity', 1)) > 0:
+                print '%s: repaired %d items' % (rklass.__name__, repaired)
@@ -0,0 +1,18 @@
+"""
+A management command which reads the shape of Data files which don't have
+one yet, e.g. Data approved before faceted search existed.
+"""
+
+from django.core.management.base import NoArgsCommand
+
+from repository.models import Data, DataShape
+
+
+class Command(NoArgsCommand):
+    help = "Read missing shapes of Data files for faceted search"
+
+    def handle_noargs(self, **options):
+        for data in Data.objects.filter(is_approved=True, is_deleted=False,
+                shape__isnull=True):
+            if not DataShape.update_for(data):
+                print 'Failed to read shape of %s' % data.get_data_filename()
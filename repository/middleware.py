@@ -0,0 +1,147 @@
+"""
+Middleware which measures the work done by a request.
+
+For a sample of requests it records the number of SQL queries and the
+time spent in them, HDF5 files opened, cache lookups and hits, and the
+time spent rendering templates. The figures are logged to the logger
+mldata.instrumentation and, if INSTRUMENTATION_HEADER is set or DEBUG is
+on, sent in the response header X-Request-Stats. Requests which aren't
+sampled cost a flag lookup per cache access, HDF5 open and template
+render.
+"""
+
+import logging
+import random
+import threading
+import time
+
+import h5py
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.template import Template
+
+from settings import INSTRUMENTATION_SAMPLE_RATE, INSTRUMENTATION_HEADER
+
+HEADER = 'X-Request-Stats'
+
+logger = logging.getLogger('mldata.instrumentation')
+
+
+class RequestStats(threading.local):
+    """Figures of the request being processed by the current thread."""
+    active = False
+
+    def start(self):
+        self.active = True
+        self.start_time = time.time()
+        self.view = None
+        self.h5_opens = 0
+        self.cache_gets = 0
+        self.cache_hits = 0
+        self.render_time = 0.0
+        self.render_depth = 0
+
+_stats = RequestStats()
+
+
+def _count_h5_opens(init):
+    def __init__(self, *args, **kwargs):
+        if _stats.active:
+            _stats.h5_opens += 1
+        init(self, *args, **kwargs)
+    return __init__
+
+def _count_cache_get(get):
+    def get_counted(key, default=None, *args, **kwargs):
+        value = get(key, default, *args, **kwargs)
+        if _stats.active:
+            _stats.cache_gets += 1
+            if value is not default:
+                _stats.cache_hits += 1
+        return value
+    return get_counted
+
+def _count_cache_get_many(get_many):
+    def get_many_counted(keys, *args, **kwargs):
+        values = get_many(keys, *args, **kwargs)
+        if _stats.active:
+            _stats.cache_gets += len(keys)
+            _stats.cache_hits += len(values)
+        return values
+    return get_many_counted
+
+def _time_render(render):
+    def render_timed(self, context):
+        if not _stats.active:
+            return render(self, context)
+        # included templates are rendered within their parent
+        _stats.render_depth += 1
+        start = time.time()
+        try:
+            return render(self, context)
+        finally:
+            _stats.render_depth -= 1
+            if not _stats.render_depth:
+                _stats.render_time += time.time() - start
+    return render_timed
+
+_installed = False
+
+def _install():
+    """Wrap the functions whose calls are counted, once per process."""
+    global _installed
+    if _installed:
+        return
+    h5py.File.__init__ = _count_h5_opens(h5py.File.__init__)
+    cache.get = _count_cache_get(cache.get)
+    cache.get_many = _count_cache_get_many(cache.get_many)
+    Template.render = _time_render(Template.render)
+    _installed = True
+
+
+class InstrumentationMiddleware(object):
+    """Record queries, HDF5 opens, cache hits and render time of requests.
+
+    Should be the first middleware, so the total time includes all others.
+    """
+
+    def __init__(self):
+        _install()
+
+    def process_request(self, request):
+        if not (settings.DEBUG or random.random() < INSTRUMENTATION_SAMPLE_RATE):
+            return None
+        _stats.start()
+        _stats.use_debug_cursor = connection.use_debug_cursor
+        connection.use_debug_cursor = True
+        if not settings.DEBUG:
+            connection.queries = []
+        _stats.num_queries = len(connection.queries)
+        return None
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if _stats.active:
+            _stats.view = '%s.%s' % (view_func.__module__,
+                getattr(view_func, '__name__', view_func.__class__.__name__))
+        return None
+
+    def process_response(self, request, response):
+        if not _stats.active:
+            return response
+        _stats.active = False
+        queries = connection.queries[_stats.num_queries:]
+        connection.use_debug_cursor = _stats.use_debug_cursor
+        if not settings.DEBUG:
+            connection.queries = []
+
+        db_time = sum([float(q['time']) for q in queries])
+        stats = 'queries=%d db=%.1fms h5=%d cache=%d/%d render=%.1fms total=%.1fms' % (
+            len(queries), db_time * 1000, _stats.h5_opens, _stats.cache_hits,
+            _stats.cache_gets, _stats.render_time * 1000,
+            (time.time() - _stats.start_time) * 1000)
+        logger.info('%s %s %d %s' % (_stats.view or '-', request.path,
+            response.status_code, stats))
+        if INSTRUMENTATION_HEADER or settings.DEBUG:
+            response[HEADER] = stats
+        return response
@@ -3,3 +3,12 @@ from data import Data, DataRating
 from task import Task, TaskRating
 from challenge import Challenge, ChallengeRating
 from method import Method, MethodRating, Result
+from submission import SubmissionCounter, SubmissionThrottled
+from tagusage import TagUsage
+from searchindex import SearchIndex, SearchHits, SearchResults
+from datashape import DataShape
+from itemstatistics import ItemStatistics
+from counter import ItemCounter
+from recent import RecentFeed
+from pagecache import PageCache
+import indexes # composite indexes are created on syncdb
@@ -5,9 +5,10 @@ Model classes for app Repository
 from datetime import datetime as dt
 from django.contrib.auth.models import User
 from django.contrib.comments.models import Comment
+from django.contrib.contenttypes.models import ContentType
 from django.core.urlresolvers import reverse
 from django.db import models
-from django.db.models import Q
+from django.db.models import Count, F, Q, Sum
 from django.utils.translation import ugettext as _
 import ml2h5.data
 import ml2h5.fileformat
@@ -16,7 +17,10 @@ import random
 from tagging.models import Tag
 from tagging.models import TaggedItem
 from tagging.utils import calculate_cloud
+from tagging.utils import edit_string_for_tags
+from tagging.utils import parse_tag_input
 from utils import slugify
+from settings import SITE_ID
 
 import repository
 
@@ -147,6 +151,10 @@ class Repository(models.Model):
     @type rating_avg_doc: float / models.FloatField
     @cvar rating_votes: item's total number of rating votes
     @type rating_votes: integer / models.IntegerField
+    @cvar rating_sum_interest: sum of item's interesting ratings
+    @type rating_sum_interest: integer / models.IntegerField
+    @cvar rating_sum_doc: sum of item's documentation ratings
+    @type rating_sum_doc: integer / models.IntegerField
     """
     pub_date = models.DateTimeField()
     version = models.IntegerField(default=1)
@@ -165,6 +173,8 @@ class Repository(models.Model):
     rating_avg_interest = models.FloatField(editable=False, default=-1)
     rating_avg_doc = models.FloatField(editable=False, default=-1)
     rating_votes = models.IntegerField(editable=False, default=0)
+    rating_sum_interest = models.IntegerField(editable=False, default=0)
+    rating_sum_doc = models.IntegerField(editable=False, default=0)
     downloads = models.IntegerField(editable=False, default=0)
     hits = models.IntegerField(editable=False, default=0)
 
@@ -189,11 +199,22 @@ class Repository(models.Model):
         return True
 
     def update_current_hits(self):
-        """Update the hits count on the given object.
+        """Count a view of the current version of this item.
+
+        The count is buffered, see ItemCounter.
+
+        @return: current version with counts including the buffered ones
+        @rtype: Repository
         """
-        current = Repository.objects.get(slug=self.slug, is_current=True)
-        current.hits += 1
-        current.save(silent_update=True)
+        if self.is_current:
+            current = self
+        else:
+            current = Repository.objects.get(slug=self.slug_id, is_current=True)
+        counter = repository.models.ItemCounter
+        pending = counter.get_pending(self.slug_id)
+        counter.record(self.slug_id, 'hits')
+        current.hits += pending['hits'] + 1
+        current.downloads += pending['downloads']
         return current
 
     def has_h5(self):
@@ -239,78 +260,35 @@ class Repository(models.Model):
 
             @param user: user to get recent items for
             @type user: auth.models.user
-            @return: list of recently changed items
-            @rtype: list of Repository
+            @return: recently changed items, see RecentFeed
+            @rtype: list of dicts
             """
-        num = 5
-
-        # without if-construct sqlite3 barfs on AnonymousUser
-        if user.id:
-            qs = (Q(user=user) | Q(is_public=True)) & Q(is_current=True)
-            qs_result = (Q(method__user=user) | Q(method__is_public=True)) & Q(method__is_current=True)
-        else:
-            qs = Q(is_public=True) & Q(is_current=True);
-            qs_result = Q(method__is_public=True) & Q(method__is_current=True);
-
-        # slices return max number of elements if num > max
-        recent_data = repository.models.Data.objects.filter(qs).order_by('-pub_date')
-        recent_data = recent_data.filter(is_approved=True)
-        recent_tasks = repository.models.Task.objects.filter(qs).order_by('-pub_date')
-        recent_challenges = repository.models.Challenge.objects.filter(qs).order_by('-pub_date')
-        recent_results = repository.models.Result.objects.filter(qs_result).order_by('-pub_date')
-
-        recent = []
-        if recent_data.count() > 0:
-            data=recent_data[:num]
-            l=list(zip(len(data)*['Data'],data))
-            recent.extend(l)
-        if recent_tasks.count() > 0:
-            tasks=recent_tasks[:num]
-            l=list(zip(len(tasks)*['Task'],tasks))
-            recent.extend(l)
-        if recent_challenges.count() > 0:
-            challenges=recent_challenges[:num]
-            l=list(zip(len(challenges)*['Challenge'],challenges))
-            recent.extend(l)
-        if recent_results.count() > 0:
-            results=recent_results[:num]
-            l=list(zip(len(results)*['Method'],results))
-            recent.extend(l)
-
-        recent.sort(key=lambda r: r[1].pub_date, reverse=True)
-        return recent[:num]
+        return repository.models.RecentFeed.get(user)
 
     @classmethod
     def get_tag_cloud(cls, user):
         """Get current tags available to user.
 
+            The tags of public items are maintained in TagUsage and cached,
+            only the tags of the user's private items are added here.
+
             @param user: user to get current items for
             @type user: auth.models.user
             @return: current tags available to user
             @rtype: list of tagging.Tag
             """
+        current = {}
+        for t in repository.models.TagUsage.get_public_tags(cls):
+            current[t.name] = t
+
         # without if-construct sqlite3 barfs on AnonymousUser
         if user.id:
-            qs = (Q(user=user) | Q(is_public=True)) & Q(is_current=True)
-        else:
-            qs = Q(is_public=True) & Q(is_current=True)
-
-        if cls:
-            tags = Tag.objects.usage_for_queryset(cls.objects.filter(qs), counts=True)
-        else:
-            tags = Tag.objects.usage_for_queryset(
-                                                  repository.models.Data.objects.filter(qs & Q(is_approved=True)), counts=True)
-            tags.extend(Tag.objects.usage_for_queryset(
-                        repository.models.Task.objects.filter(qs), counts=True))
-            tags.extend(Tag.objects.usage_for_queryset(
-                        repository.models.Method.objects.filter(qs), counts=True))
-
-        current = {}
-        for t in tags:
-            if not t.name in current:
-                current[t.name] = t
-            else:
-                current[t.name].count += t.count
+            private = cls.objects.filter(user=user, is_public=False, is_current=True)
+            for t in Tag.objects.usage_for_queryset(private, counts=True):
+                if not t.name in current:
+                    current[t.name] = t
+                else:
+                    current[t.name].count += t.count
 
         tags = current.values()
         if tags:
@@ -330,20 +308,11 @@ class Repository(models.Model):
         @param tag: tag to get tagged items for
         @type tag: tagging.Tag
         @return: current tagged items
-        @rtype: list of Data, Task or Method
+        @rtype: QuerySet of Data, Task or Method
         """
-        # without if-construct sqlite3 barfs on AnonymousUser
         qs = cls().get_public_qs()
-
-        tagged = TaggedItem.objects.filter(tag=tag)
         current = cls.objects.filter(qs).order_by('name')
-        items = []
-        for c in current:
-            for t in tagged:
-                if t.object_id == c.id:
-                    items.append(c)
-                    break
-        return items
+        return TaggedItem.objects.get_by_model(current, tag)
 
     @classmethod
     def get_object(cls, slug_or_id, version=None):
@@ -384,11 +353,24 @@ class Repository(models.Model):
     def set_current(klass, cur):
         """Set the latest version of the item identified by given obj to be the current one.
 
+        The switch is done with a fixed number of UPDATE statements, so it
+        has to run within a transaction, as the views do. Clearing
+        is_current of the previous version comes first and locks its row
+        until the transaction ends, so concurrent switches of the same
+        item wait for each other. The counters and rating sums of the
+        previous version are read only after that, so counts and ratings
+        written before the switch are carried over.
+
             @param cur: item to set
             @type object: repository object
             @return: the current item or None
             @rtype: repository.Data/Task/Method
             """
+        # carried over to the new current version
+        copied = ['rating_avg', 'rating_avg_interest', 'rating_avg_doc',
+            'rating_votes', 'rating_sum_interest', 'rating_sum_doc', 'hits',
+            'downloads']
+        fields = ['id', 'tags', 'is_public'] + copied
 
         # handle deleted case first
         if cur.is_deleted:
@@ -399,47 +381,167 @@ class Repository(models.Model):
                 return obj
 
             # else we are deleting the most current version
-            cur.is_current=False
-            cur.save(silent_update=True)
-
-            new_cur = klass.objects.filter(slug=cur.slug,
-                    is_deleted=False).order_by('-version')
-            if new_cur.count():
-                prev = cur
-                cur=new_cur[0]
-                cur.is_current=True
-                cur.save(silent_update=True)
-            else:
+            prev_id = cur.pk
+            cur.is_current = False
+            new_cur = klass.objects.filter(slug=cur.slug_id,
+                    is_deleted=False).order_by('-version')[:1]
+            if not new_cur:
+                Repository.objects.filter(pk=cur.pk).update(is_current=False)
+                prev = klass.objects.filter(pk=prev_id).values(*fields)[0]
+                klass._update_current_indexes(prev, None)
                 return None
+            cur = new_cur[0]
         else:
-            prev = klass.objects.get(slug=cur.slug, is_current=True)
-
-        rklass = eval('repository.models.' + klass.__name__ + 'Rating')
-        try:
-            rating = rklass.objects.get(user=cur.user, repository=prev)
-            rating.repository = cur
-            rating.save()
-        except rklass.DoesNotExist:
-            pass
-        cur.rating_avg = prev.rating_avg
-        cur.rating_avg_interest = prev.rating_avg_interest
-        cur.rating_avg_doc = prev.rating_avg_doc
-        cur.rating_votes = prev.rating_votes
-        cur.hits = prev.hits
-        cur.downloads = prev.downloads
+            prev_id = None
+            prev_ids = klass.objects.filter(slug=cur.slug_id,
+                is_current=True).values_list('id', flat=True)[:1]
+            if prev_ids:
+                prev_id = prev_ids[0]
+            if prev_id == cur.pk:
+                return cur
+
+        Repository.objects.filter(slug=cur.slug_id, is_current=True).exclude(
+            pk=cur.pk).update(is_current=False)
+        prev = None
+        if prev_id:
+            prev = klass.objects.filter(pk=prev_id).values(*fields)[0]
+        values = {'is_current': True}
+        if prev:
+            values.update([(f, prev[f]) for f in copied])
+        Repository.objects.filter(pk=cur.pk).update(**values)
+        for f, v in values.iteritems():
+            setattr(cur, f, v)
+
+        if prev:
+            # the sums copied above count all ratings of the item, so they
+            # all move along with them
+            rklass = eval('repository.models.' + klass.__name__ + 'Rating')
+            rklass.objects.filter(repository__slug=cur.slug_id).exclude(
+                repository=cur.pk).update(repository=cur.pk)
+            Comment.objects.filter(object_pk=prev['id']).update(object_pk=cur.pk)
+
+        klass._update_current_indexes(prev, cur)
+        return cur
 
-        Comment.objects.filter(object_pk=prev.pk).update(object_pk=cur.pk)
+    @classmethod
+    def _update_current_indexes(klass, prev, cur):
+        """Update what the save signals would after a version switch.
 
-        # this should be atomic:
-        prev.is_current = False
-        prev.save(silent_update=True)
-        cur.is_current = True
-        cur.save(silent_update=True)
+        set_current writes with UPDATE statements, which send no signals.
 
-        return cur
+        @param prev: id, tags and is_public of the previous current version or None
+        @type prev: dict
+        @param cur: new current version or None
+        @type cur: repository.Data/Task/Method
+        """
+        models = repository.models
+        tags = set()
+        if prev:
+            models.SearchIndex.remove_id(prev['id'])
+            if prev['is_public']:
+                tags.update(parse_tag_input(prev['tags'] or ''))
+        if cur:
+            models.SearchIndex.update(cur)
+            if cur.is_public:
+                tags.update(parse_tag_input(cur.tags or ''))
+        if tags:
+            models.TagUsage.update(klass, list(tags))
+        if klass.__name__ == 'Data':
+            models.DataShape.clear_facet_counts()
+        models.RecentFeed.invalidate()
+        models.PageCache.invalidate()
 
     def get_initial_submission(self):
-        return Repository.objects.get(slug__text=self.slug.text, version=1)
+        """Get the first version of this item.
+
+        Set for all items of a listing by prefetch_listing.
+
+        @return: first version, None if it doesn't exist anymore
+        @rtype: Repository
+        """
+        if not hasattr(self, '_initial_submission'):
+            try:
+                self._initial_submission = Repository.objects.select_related(
+                    'user').get(slug=self.slug_id, version=1)
+            except Repository.DoesNotExist:
+                self._initial_submission = None
+        return self._initial_submission
+
+    @classmethod
+    def get_related_counts(cls, ids):
+        """Count related items shown in item listings.
+
+        No-op by default, overwritten in the subclasses.
+
+        @param ids: ids of the items
+        @type ids: list of integers
+        @return: count per item id, per name of the count
+        @rtype: dict of dicts
+        """
+        return {}
+
+    @staticmethod
+    def _count_by(queryset, field, ids):
+        """Count items of queryset per value of field, which is one of ids."""
+        rows = queryset.filter(**{field + '__in': ids}).order_by().values(
+            field).annotate(num=Count('id'))
+        return dict([(row[field], row['num']) for row in rows])
+
+    @classmethod
+    def get_comment_counts(cls, ids):
+        """Count public comments like the get_comment_count template tag.
+
+        @param ids: ids of the items
+        @type ids: list of integers
+        @return: count per item id
+        @rtype: dict
+        """
+        ctype = ContentType.objects.get_for_model(cls)
+        comments = Comment.objects.filter(content_type=ctype,
+            object_pk__in=[unicode(i) for i in ids], site=SITE_ID,
+            is_public=True, is_removed=False)
+        return dict([(int(row['object_pk']), row['num']) for row in
+            comments.order_by().values('object_pk').annotate(num=Count('id'))])
+
+    def get_listing_counts(self):
+        """Get numbers of comments and related items shown in item listings.
+
+        @return: count per name, e.g. comments or tasks
+        @rtype: dict
+        """
+        if not hasattr(self, '_listing_counts'):
+            self.__class__.prefetch_listing([self])
+        return self._listing_counts
+
+    @classmethod
+    def prefetch_listing(cls, items):
+        """Fetch what item listings show of given items with a few queries.
+
+        Instead of querying per item, sets the initial submissions, the tags
+        and the counts of comments and related items of all given items at
+        once.
+
+        @param items: items of a listing page
+        @type items: list of Repository
+        """
+        if not items:
+            return
+        ids = [i.pk for i in items]
+        initial = dict([(r.slug_id, r) for r in
+            Repository.objects.select_related('user').filter(
+                slug__in=set([i.slug_id for i in items]), version=1)])
+        counts = cls.get_related_counts(ids)
+        counts['comments'] = cls.get_comment_counts(ids)
+        tags = dict([(i, []) for i in ids])
+        for tagged in TaggedItem.objects.select_related('tag').filter(
+                content_type=ContentType.objects.get_for_model(cls),
+                object_id__in=ids).order_by('tag__name'):
+            tags[tagged.object_id].append(tagged.tag)
+        for item in items:
+            item._initial_submission = initial.get(item.slug_id)
+            item.tags = edit_string_for_tags(tags[item.pk])
+            item._listing_counts = dict([(name, n.get(item.pk, 0))
+                for name, n in counts.iteritems()])
 
     def __init__(self, * args, ** kwargs):
         super(Repository, self).__init__(*args, ** kwargs)
@@ -518,10 +620,33 @@ class Repository(models.Model):
         @return: if user owns this
         @rtype: boolean
         """
-        if user.is_staff or user.is_superuser or user == self.user:
+        if user.is_staff or user.is_superuser or user.id == self.user_id:
             return True
         return False
 
+    def dependent_entries_exist(self):
+        """Check whether there exists an object which depends on self.
+
+        The result is kept with the object, so the checks of a request
+        query only once. Objects are loaded per request.
+
+        @return: if dependent objects exist
+        @rtype: boolean
+        """
+        if not hasattr(self, '_dependent_entries_exist'):
+            self._dependent_entries_exist = self.check_dependent_entries()
+        return self._dependent_entries_exist
+
+    def check_dependent_entries(self):
+        """Query whether there exists an object which depends on self.
+
+        Overwritten in the subclasses, use dependent_entries_exist.
+
+        @return: if dependent objects exist
+        @rtype: boolean
+        """
+        return False
+
     def can_activate(self, user):
         """Can given user activate this.
 
@@ -605,11 +730,15 @@ class Repository(models.Model):
         return self.can_view(user)
 
 
-    def increase_downloads(self):
-        """Increase hit counter for current version of given item."""
-        obj = self.__class__.objects.get(slug=self.slug, is_current=True)
-        obj.downloads += 1
-        obj.save(silent_update=True)
+    def increase_downloads(self, format='plain'):
+        """Count a download of the current version of this item.
+
+        The count is buffered, see ItemCounter.
+
+        @param format: downloaded format, e.g. csv
+        @type format: string
+        """
+        repository.models.ItemCounter.record(self.slug_id, 'downloads', format)
 
 
     def get_completeness(self):
@@ -638,11 +767,16 @@ class Repository(models.Model):
         @param user: user to get versions for
         @type user: auth.model.User
         @return: viewable versions of this item
-        @rtype: list of Repository
+        @rtype: QuerySet of Repository
         """
-        qs = Q(slug__text=self.slug.text) & Q(is_deleted=False)
-        items = self.__class__.objects.filter(qs).order_by('version')
-        return [i for i in items if i.can_view(user)]
+        items = self.__class__.objects.filter(slug=self.slug_id, is_deleted=False)
+        # same as can_view, but in the database
+        if not (user.is_staff or user.is_superuser):
+            if user.id:
+                items = items.filter(Q(is_public=True) | Q(user=user))
+            else:
+                items = items.filter(is_public=True)
+        return items.order_by('version')
 
     def create_slug(self):
         """Create the slug entry for this object.
@@ -681,32 +815,94 @@ class Rating(models.Model):
     class Meta:
         app_label = 'repository'
 
-    def update(self, interest, doc):
+    @classmethod
+    def get_or_create_for(cls, user, current):
+        """Get a user's rating of an item or a new one.
+
+        Call on a subclass, e.g. DataRating. Ratings belong to the current
+        version. A rating of another version of the item, left over from
+        before all ratings moved on a version switch, is counted in the
+        item's sums already, so it is moved to the current version and
+        not created again.
+
+        @param user: rating user
+        @type user: Django User
+        @param current: current version of the item
+        @type current: Repository
+        @return: the rating and if it was created
+        @rtype: tuple
+        """
+        ratings = cls.objects.filter(user=user,
+            repository__slug=current.slug_id).order_by('-id')[:1]
+        if not ratings:
+            return cls.objects.create(user=user, repository=current), True
+        rating = ratings[0]
+        if rating.repository_id != current.pk:
+            rating.repository = current
+            rating.save()
+        return rating, False
+
+    def update(self, interest, doc, created=False):
         """Update rating for an item.
 
+        The item's running sums are changed by the difference to the
+        previous rating and its averages are computed from them, both by
+        UPDATE statements, so concurrent votes don't overwrite each other.
+        Call within a transaction.
+
         @param interest: interesting value
         @type interest: integer
         @param doc: documentation value
         @type doc: integer
+        @param created: if the rating is new, i.e. not counted yet
+        @type created: boolean
         """
+        if created:
+            votes, old_interest, old_doc = 1, 0, 0
+        else:
+            votes, old_interest, old_doc = 0, self.interest, self.doc
         self.interest = interest
         self.doc = doc
         self.save()
 
-        repo = self.repository
-        ratings = self.__class__.objects.filter(repository=repo)
-        l = float(len(ratings))
-        i = d = 0
+        qs = Repository.objects.filter(pk=self.repository_id)
+        qs.update(rating_votes=F('rating_votes') + votes,
+            rating_sum_interest=F('rating_sum_interest') + interest - old_interest,
+            rating_sum_doc=F('rating_sum_doc') + doc - old_doc)
+        # separate statement, MySQL would use the new sums in the same one
+        qs.filter(rating_votes__gt=0).update(
+            rating_avg=(F('rating_sum_interest') + F('rating_sum_doc')) * 0.5 / F('rating_votes'),
+            rating_avg_interest=F('rating_sum_interest') * 1.0 / F('rating_votes'),
+            rating_avg_doc=F('rating_sum_doc') * 1.0 / F('rating_votes'))
+        repository.models.PageCache.invalidate()
+
+    @classmethod
+    def repair(cls):
+        """Recompute the aggregates of all rated items from their ratings.
+
+        Call on a subclass, e.g. DataRating. The ratings of all versions
+        of an item are aggregated into its current version.
+
+        @return: number of items whose aggregates were wrong
+        @rtype: integer
+        """
+        repaired = 0
+        ratings = cls.objects.values('repository__slug').annotate(Count('id'),
+            Sum('interest'), Sum('doc'))
         for r in ratings:
-            i += r.interest
-            d += r.doc
-
-        num_scores = 2.0
-        repo.rating_avg = float(i + d) / (num_scores * l)
-        repo.rating_avg_interest = float(i) / l
-        repo.rating_avg_doc = float(d) / l
-        repo.rating_votes = l
-        repo.save()
+            votes = r['id__count']
+            interest = r['interest__sum']
+            doc = r['doc__sum']
+            repaired += Repository.objects.filter(slug=r['repository__slug'],
+                is_current=True).exclude(
+                rating_votes=votes, rating_sum_interest=interest,
+                rating_sum_doc=doc).update(
+                rating_votes=votes, rating_sum_interest=interest,
+                rating_sum_doc=doc,
+                rating_avg=float(interest + doc) / (2.0 * votes),
+                rating_avg_interest=float(interest) / votes,
+                rating_avg_doc=float(doc) / votes)
+        return repaired
 
     def __unicode__(self):
         try:
@@ -21,11 +21,14 @@ class Challenge(Repository):
     @type license: FixedLicense
     @cvar tags: item's tags
     @type tags: string / tagging.TagField
+    @cvar max_daily_submissions: daily submissions per user, 0 for the site default
+    @type max_daily_submissions: integer / models.IntegerField
     """
     license = models.ForeignKey(FixedLicense, editable=False)
     track = models.CharField(max_length=255, blank=True)
     task = models.ManyToManyField(Task)
     tags = TagField() # tagging doesn't work anymore if put into base class
+    max_daily_submissions = models.IntegerField(default=0)
 
     class Meta:
         app_label = 'repository'
@@ -48,17 +51,20 @@ class Challenge(Repository):
         return self.task.filter(qs)
 
     def get_related_methods(self):
-        return repository.models.method.Result.objects.filter(method=self.pk)
+        return repository.models.method.Result.objects.filter(challenge=self.pk)
 
-    def dependent_entries_exist(self):
-        """Check whether there exists an object which depends on self.
+    @classmethod
+    def get_related_counts(cls, ids):
+        """Count results submitted to Challenge items."""
+        Result = repository.models.method.Result
+        return {'methods': cls._count_by(Result.objects.all(), 'challenge', ids)}
+
+    def check_dependent_entries(self):
+        """Query whether there exists an object which depends on self.
 
         for Challenge objects, checks whether there exists a Result object.
         """
-        if repository.models.method.Result.objects.filter(challenge__slug=self.slug).count() > 0:
-            return True
-
-        return False
+        return repository.models.method.Result.objects.filter(challenge__slug=self.slug_id).exists()
 
 class ChallengeRating(Rating):
     """Rating for a Challenge item."""
@@ -0,0 +1,201 @@
+"""
+Write-behind counters of item views and downloads.
+
+Counting a view used to load the current version of the item and save the
+whole row on every request. Instead, views and downloads are counted per
+slug in the cache and added to the current version periodically with one
+UPDATE hits = hits + n per item, so concurrent requests neither block each
+other on the row nor lose counts. The items with buffered counts are
+listed in the cache as well, so a flush only touches those. Counts still
+in the cache are lost if the cache is restarted before they are flushed;
+run the flushcounters command before stopping it.
+
+Views are counted per item and downloads per item and format, so the flush
+adds them to the daily ItemStatistics as well.
+"""
+
+from datetime import date
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+
+from settings import COUNTER_FLUSH_INTERVAL
+from base import Repository
+from itemstatistics import ItemStatistics, HITS_FORMAT
+
+FIELDS = ('hits', 'downloads')
+DOWNLOAD_FORMATS = ('plain', 'xml', 'csv', 'arff', 'libsvm', 'matlab',
+    'octave', 'rdata', 'other')
+# buffered counters: field and format
+COUNTERS = [('hits', HITS_FORMAT)] + [('downloads', f) for f in DOWNLOAD_FORMATS]
+FLUSH_KEY = 'item_counter_flush'
+# items with buffered counts are appended to numbered slots, as the cache
+# has no atomic set; the flush reads the slots after the last flushed one
+DIRTY_KEY = 'item_counter_dirty_%d'
+DIRTY_SLOT_KEY = 'item_counter_dirty_slot_%d'
+DIRTY_COUNT_KEY = 'item_counter_dirty_count'
+DIRTY_FLUSHED_KEY = 'item_counter_dirty_flushed'
+# slots counted but not set yet at the last flush, read once more
+DIRTY_MISSING_KEY = 'item_counter_dirty_missing'
+# buffered counts must survive until the next flush
+COUNTER_TIMEOUT = 7*24*60*60
+# number of items whose counters are fetched at once when flushing
+CHUNK_SIZE = 100
+
+
+class ItemCounter(object):
+    """Buffered view and download counters of repository items."""
+
+    @staticmethod
+    def _get_key(slug_id, field, format):
+        return 'item_counter_%s_%s_%d' % (field, format, slug_id)
+
+    @classmethod
+    def get_pending(cls, slug_id):
+        """Get counts of an item which are not flushed yet.
+
+        @param slug_id: id of the item's slug
+        @type slug_id: integer
+        @return: pending count per field
+        @rtype: dict
+        """
+        pending = dict([(f, 0) for f in FIELDS])
+        if not COUNTER_FLUSH_INTERVAL:
+            return pending
+        keys = dict([(cls._get_key(slug_id, f, fmt), f) for f, fmt in COUNTERS])
+        for key, value in cache.get_many(keys.keys()).iteritems():
+            pending[keys[key]] += value
+        return pending
+
+    @classmethod
+    def record(cls, slug_id, field, format=HITS_FORMAT):
+        """Count a view or download of the current version of an item.
+
+        If COUNTER_FLUSH_INTERVAL is 0, the count is written to the database
+        right away, otherwise it is buffered and the buffered counts are
+        flushed by the first request of every interval.
+
+        @param slug_id: id of the item's slug
+        @type slug_id: integer
+        @param field: hits or downloads
+        @type field: string
+        @param format: download format, one of DOWNLOAD_FORMATS
+        @type format: string
+        """
+        if field == 'downloads' and format not in DOWNLOAD_FORMATS:
+            format = 'other'
+        if not COUNTER_FLUSH_INTERVAL:
+            cls._write(slug_id, {(field, format): 1})
+            return
+
+        key = cls._get_key(slug_id, field, format)
+        try:
+            cache.incr(key)
+        except ValueError: # first count since the key expired
+            if not cache.add(key, 1, COUNTER_TIMEOUT):
+                cache.incr(key)
+
+        if cache.add(DIRTY_KEY % slug_id, 1, COUNTER_TIMEOUT):
+            cls._add_dirty(slug_id)
+
+        if cache.add(FLUSH_KEY, 1, COUNTER_FLUSH_INTERVAL):
+            cls.flush()
+
+    @staticmethod
+    def _add_dirty(slug_id):
+        """Append an item to the items with buffered counts.
+
+        @param slug_id: id of the item's slug
+        @type slug_id: integer
+        """
+        try:
+            slot = cache.incr(DIRTY_COUNT_KEY)
+        except ValueError: # first item or the count expired
+            if cache.add(DIRTY_COUNT_KEY, 1, COUNTER_TIMEOUT):
+                slot = 1
+            else:
+                slot = cache.incr(DIRTY_COUNT_KEY)
+        cache.set(DIRTY_SLOT_KEY % slot, slug_id, COUNTER_TIMEOUT)
+
+    @staticmethod
+    def _write(slug_id, counts):
+        """Add counts to the current version and the statistics of today.
+
+        @param slug_id: id of the item's slug
+        @type slug_id: integer
+        @param counts: count per field and format
+        @type counts: dict
+        """
+        totals = {}
+        today = date.today()
+        for (field, format), count in counts.iteritems():
+            totals[field] = totals.get(field, 0) + count
+            ItemStatistics.add(slug_id, today, field, format, count)
+        updates = dict([(f, F(f) + n) for f, n in totals.iteritems()])
+        Repository.objects.filter(slug=slug_id, is_current=True).update(**updates)
+
+    @classmethod
+    def _get_dirty(cls):
+        """Get the items appended since the last flush and unmark them.
+
+        Slots which weren't set yet at the last flush are read once more.
+
+        @return: ids of the items' slugs and number of the last slot read
+        @rtype: tuple
+        """
+        end = cache.get(DIRTY_COUNT_KEY) or 0
+        start = cache.get(DIRTY_FLUSHED_KEY) or 0
+        if start > end: # the count expired and started again
+            start = 0
+        numbers = range(start + 1, end + 1)
+        slots = [DIRTY_SLOT_KEY % n for n in (cache.get(DIRTY_MISSING_KEY) or []) + numbers]
+        found = {}
+        for i in xrange(0, len(slots), CHUNK_SIZE):
+            found.update(cache.get_many(slots[i:i + CHUNK_SIZE]))
+        # a slot may be counted already but not set yet
+        cache.set(DIRTY_MISSING_KEY, [n for n in numbers
+            if DIRTY_SLOT_KEY % n not in found], COUNTER_TIMEOUT)
+        slug_ids = set(found.values())
+        # counts recorded from now on append the items again
+        cache.delete_many([DIRTY_KEY % s for s in slug_ids])
+        cache.delete_many(found.keys())
+        return sorted(slug_ids), end
+
+    @classmethod
+    def flush(cls):
+        """Add the buffered counts to the current versions of the items.
+
+        Only the items counted since the last flush are looked at. Counts
+        are taken from the cache with decr, so counts added while flushing
+        are kept for the next flush. They are added to the statistics of
+        the day of the flush.
+
+        @return: number of items updated
+        @rtype: integer
+        """
+        slug_ids, end = cls._get_dirty()
+        updated = 0
+        for start in xrange(0, len(slug_ids), CHUNK_SIZE):
+            chunk = slug_ids[start:start + CHUNK_SIZE]
+            keys = [cls._get_key(s, f, fmt) for s in chunk for f, fmt in COUNTERS]
+            pending = cache.get_many(keys)
+            if not pending:
+                continue
+            for slug_id in chunk:
+                counts = {}
+                for field, format in COUNTERS:
+                    key = cls._get_key(slug_id, field, format)
+                    count = pending.get(key)
+                    if not count:
+                        continue
+                    try:
+                        cache.decr(key, count)
+                    except ValueError: # expired meanwhile
+                        continue
+                    counts[(field, format)] = count
+                if counts:
+                    cls._write(slug_id, counts)
+                    updated += 1
+        transaction.commit_unless_managed()
+        cache.set(DIRTY_FLUSHED_KEY, end, COUNTER_TIMEOUT)
+        return updated
@@ -146,15 +146,14 @@ class Data(Repository):
             self.file.name = os.path.join(DATAPATH, fname_h5.split(os.path.sep)[-1])
 
         self.save()
+        repository.models.DataShape.update_for(self)
 
-    def dependent_entries_exist(self):
-        """Check whether there exists an object which depends on self.
+    def check_dependent_entries(self):
+        """Query whether there exists an object which depends on self.
 
         For Data objects, checks whether there exists a Task object,
         """
-        if repository.models.Task.objects.filter(data__slug=self.slug).count() > 0:
-            return True
-        return False
+        return repository.models.Task.objects.filter(data__slug=self.slug_id).exists()
 
     def attach_file(self, file_object):
         self.file = file_object
@@ -179,6 +178,20 @@ class Data(Repository):
         from repository.models.challenge import Challenge
         return Challenge.objects.filter(Q(task__data=self.pk) & self.get_public_qs(self))
 
+    @classmethod
+    def get_related_counts(cls, ids):
+        """Count public tasks, results and public challenges of Data items."""
+        from repository.models.task import Task
+        from repository.models.method import Result
+        from repository.models.challenge import Challenge
+        public = cls().get_public_qs()
+        return {
+            'tasks': cls._count_by(Task.objects.filter(public), 'data', ids),
+            'methods': cls._count_by(Result.objects.all(), 'task__data', ids),
+            'challenges': cls._count_by(Challenge.objects.filter(public),
+                'task__data', ids),
+        }
+
     def get_completeness_properties(self):
         return ['tags', 'description', 'license', 'summary', 'urls',
             'publications', 'source', 'measurement_details', 'usage_scenario']
@@ -198,7 +211,8 @@ class Data(Repository):
             try:
                 self.extract = ml2h5.data.get_extract(fname_h5)
                 extr = self.extract
-                self.save(silent_update=True)
+                # no save, its signals would invalidate the page cache
+                Data.objects.filter(pk=self.pk).update(extract=self.extract)
             except Exception, e: # catch exceptions in general, but notify admins
                 subject = 'Failed data extract of %s' % (fname_h5)
                 body = "Hi Admin!" + "\n\n" + subject + ":\n\n" + str(e)
@@ -219,7 +233,7 @@ class Data(Repository):
     def get_attribute_types(self):
         if not self.attribute_types:
             self.attribute_types = ml2h5.data.get_attribute_types(self.get_data_filename())
-            self.save(silent_update=True)
+            Data.objects.filter(pk=self.pk).update(attribute_types=self.attribute_types)
         attr = self.attribute_types
         return attr
 
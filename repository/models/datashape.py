@@ -0,0 +1,304 @@
+"""
+Summary statistics of Data files for faceted search.
+
+Questions like "multiclass data with 5-10 classes and less than 1000
+examples" need the shape of a dataset in the database. It is read from the
+HDF5 file once, when the Data item is approved, and stored in indexed
+columns, so it can be used for range filters. The number of public
+datasets per range of every facet is cached.
+"""
+
+import h5py
+import numpy
+from django.core.cache import cache
+from django.db import models
+from django.db.models import signals
+from django.utils.translation import ugettext_lazy as _
+
+from data import Data
+
+# a label with more distinct values is taken as a regression target
+MAX_CLASSES = 1000
+# number of values read from the HDF5 file at once
+CHUNK_SIZE = 2 ** 20
+FACET_CACHE_KEY = 'data_facets'
+FACET_CACHE_TIMEOUT = 60*60*24
+
+# name, field, label and the ranges [min, max) shown as facets
+FACETS = (
+    ('instances', 'num_instances', _('Instances'), (
+        (1, 100, '< 100'), (100, 1000, '100 - 999'),
+        (1000, 10000, '1000 - 9999'), (10000, 100000, '10000 - 99999'),
+        (100000, None, '>= 100000'))),
+    ('attributes', 'num_attributes', _('Attributes'), (
+        (1, 10, '< 10'), (10, 100, '10 - 99'), (100, 1000, '100 - 999'),
+        (1000, None, '>= 1000'))),
+    ('classes', 'num_classes', _('Classes'), (
+        (2, 3, '2'), (3, 6, '3 - 5'), (6, 11, '6 - 10'), (11, None, '> 10'))),
+    ('missing', 'missing_ratio', _('Missing values'), (
+        (0, 1e-9, _('none')), (1e-9, 0.05, '< 5%'), (0.05, None, '>= 5%'))),
+    ('numeric', 'num_numeric', _('Numeric attributes'), (
+        (1, 10, '< 10'), (10, 100, '10 - 99'), (100, None, '>= 100'))),
+    ('nominal', 'num_nominal', _('Nominal attributes'), (
+        (1, 10, '< 10'), (10, None, '>= 10'))),
+    ('string', 'num_string', _('String attributes'), (
+        (1, None, '>= 1'),)),
+)
+
+
+class DataShape(models.Model):
+    """Shape of a Data item's file.
+
+    Unknown values are -1.
+
+    @cvar data: the Data item
+    @type data: Data
+    @cvar num_instances: number of instances
+    @type num_instances: integer / models.IntegerField
+    @cvar num_attributes: number of attributes
+    @type num_attributes: integer / models.IntegerField
+    @cvar num_classes: number of distinct labels, -1 if there is no label or it is not categorical
+    @type num_classes: integer / models.IntegerField
+    @cvar missing_ratio: ratio of missing values
+    @type missing_ratio: float / models.FloatField
+    @cvar num_numeric: number of numeric attributes
+    @type num_numeric: integer / models.IntegerField
+    @cvar num_nominal: number of nominal attributes
+    @type num_nominal: integer / models.IntegerField
+    @cvar num_string: number of string attributes
+    @type num_string: integer / models.IntegerField
+    """
+    data = models.OneToOneField(Data, primary_key=True, related_name='shape')
+    num_instances = models.IntegerField(default=-1, db_index=True)
+    num_attributes = models.IntegerField(default=-1, db_index=True)
+    num_classes = models.IntegerField(default=-1, db_index=True)
+    missing_ratio = models.FloatField(default=-1, db_index=True)
+    num_numeric = models.IntegerField(default=-1, db_index=True)
+    num_nominal = models.IntegerField(default=-1, db_index=True)
+    num_string = models.IntegerField(default=-1, db_index=True)
+
+    class Meta:
+        app_label = 'repository'
+
+    def __unicode__(self):
+        return unicode(self.data_id)
+
+    @classmethod
+    def update_for(cls, data):
+        """Read shape of given Data item's file and store it.
+
+        @param data: Data item to update shape of
+        @type data: Data
+        @return: the shape or None if the file couldn't be read
+        @rtype: DataShape
+        """
+        if not data.has_h5():
+            return None
+        try:
+            stats = get_statistics(data.get_data_filename(), data.num_instances)
+        except Exception: # broken or missing file, facets are not essential
+            return None
+        shape = cls(data=data, **stats)
+        shape.save()
+        return shape
+
+    @classmethod
+    def copy(cls, prev, next):
+        """Copy shape to a new version which kept the file.
+
+        @param prev: previous version
+        @type prev: Data
+        @param next: new version
+        @type next: Data
+        """
+        try:
+            shape = cls.objects.get(data=prev)
+        except cls.DoesNotExist:
+            return
+        shape.data = next
+        shape.save()
+
+    @staticmethod
+    def get_public_data():
+        return Data.objects.filter(is_public=True, is_current=True,
+            is_approved=True, is_deleted=False)
+
+    @classmethod
+    def get_facet_counts(cls):
+        """Get number of public datasets in the ranges of all facets.
+
+        @return: facets with name, label and ranges with min, max, label and count
+        @rtype: list of dicts
+        """
+        facets = cache.get(FACET_CACHE_KEY)
+        if facets is None:
+            shapes = cls.objects.filter(data__in=cls.get_public_data())
+            facets = []
+            for name, field, label, ranges in FACETS:
+                counts = []
+                for lower, upper, range_label in ranges:
+                    qs = shapes.filter(**{field + '__gte': lower})
+                    if upper is not None:
+                        qs = qs.filter(**{field + '__lt': upper})
+                    counts.append({'min': lower, 'max': upper,
+                        'label': unicode(range_label), 'count': qs.count()})
+                facets.append({'name': name, 'label': unicode(label), 'ranges': counts})
+            cache.set(FACET_CACHE_KEY, facets, FACET_CACHE_TIMEOUT)
+        return facets
+
+    @staticmethod
+    def clear_facet_counts():
+        """Drop the cached facet counts, e.g. after visibility changed."""
+        cache.delete(FACET_CACHE_KEY)
+
+    @staticmethod
+    def get_filters(params):
+        """Get range filters for Data from request parameters.
+
+        Parameters are named like the facets with suffix _min or _max,
+        e.g. classes_min=5&classes_max=10. Ranges include min, exclude max.
+
+        @param params: request parameters
+        @type params: QueryDict
+        @return: lookups for Data.objects.filter, the valid parameters
+        @rtype: tuple of dict and dict
+        """
+        lookups = {}
+        valid = {}
+        for name, field, label, ranges in FACETS:
+            for suffix, op in (('_min', '__gte'), ('_max', '__lt')):
+                value = params.get(name + suffix)
+                if not value:
+                    continue
+                try:
+                    value = float(value)
+                    if field != 'missing_ratio':
+                        value = int(value)
+                except (ValueError, OverflowError):
+                    continue
+                lookups['shape__' + field + op] = value
+                valid[name + suffix] = value
+        return lookups, valid
+
+
+def get_statistics(fname, num_instances):
+    """Compute shape of a Data file in mldata's HDF5 format.
+
+    @param fname: name of the HDF5 file
+    @type fname: string
+    @param num_instances: number of instances, to tell variables from instances
+    @type num_instances: integer
+    @return: statistics named like the fields of DataShape
+    @rtype: dict
+    """
+    h5 = h5py.File(fname, 'r')
+    try:
+        group = h5['data']
+        numeric = nominal = string = 0
+        missing = total = 0
+
+        if 'indptr' in group: # sparse matrix, missing entries are zeros
+            values = group['data']
+            num_variables = len(group['indptr']) - 1
+            numeric = num_variables
+            for block in _iter_blocks(values):
+                missing += _count_missing(block)
+            total = num_variables * num_instances
+        else:
+            for name, ds in group.items():
+                if name == 'label':
+                    continue
+                num_variables = ds.size / max(1, num_instances)
+                for block in _iter_blocks(ds):
+                    missing += _count_missing(block)
+                if ds.dtype.kind in 'biufc':
+                    numeric += num_variables
+                else:
+                    string += num_variables
+                total += ds.size
+
+        # types are known only if the original file was arff
+        types = []
+        if 'data_descr' in h5 and 'types' in h5['data_descr']:
+            types = [str(t) for t in h5['data_descr']['types'][...]]
+        if types:
+            numeric = len([t for t in types if t.startswith('numeric')])
+            nominal = len([t for t in types if t.startswith('nominal')])
+            string = len([t for t in types if t.startswith('string')])
+
+        num_classes = -1
+        if 'label' in group:
+            num_classes = _count_classes(group['label'])
+        elif types and types[-1].startswith('nominal'):
+            # arff convention: the class is the last attribute
+            num_classes = len(types[-1].split(':', 1)[-1].split(','))
+
+        if total:
+            missing_ratio = float(missing) / total
+        else:
+            missing_ratio = -1
+    finally:
+        h5.close()
+
+    return {
+        'num_instances': num_instances,
+        'num_attributes': numeric + nominal + string,
+        'num_classes': num_classes,
+        'missing_ratio': missing_ratio,
+        'num_numeric': numeric,
+        'num_nominal': nominal,
+        'num_string': string,
+    }
+
+def _iter_blocks(ds):
+    """Read a HDF5 dataset in blocks along its first axis."""
+    if not ds.shape:
+        yield numpy.array([ds[...]])
+        return
+    step = max(1, CHUNK_SIZE / max(1, ds.size / max(1, ds.shape[0])))
+    for start in xrange(0, ds.shape[0], step):
+        yield ds[start:start + step]
+
+def _count_missing(block):
+    """Count missing values: NaN in numbers, empty or '?' in strings."""
+    if block.dtype.kind in 'fc':
+        return int(numpy.isnan(block).sum())
+    elif block.dtype.kind in 'biu':
+        return 0
+    return int(((block == '') | (block == '?')).sum())
+
+def _count_classes(ds):
+    """Count distinct labels, -1 if they don't look categorical."""
+    labels = set()
+    for block in _iter_blocks(ds):
+        block = numpy.asarray(block).ravel()
+        if block.dtype.kind in 'fc':
+            block = block[~numpy.isnan(block)]
+            if (block != numpy.round(block)).any():
+                return -1
+        labels.update(block.tolist())
+        if len(labels) > MAX_CLASSES:
+            return -1
+    return len(labels)
+
+
+def _remember_state(sender, instance, **kwargs):
+    instance._facet_state = (instance.is_public, instance.is_current,
+        instance.is_approved, instance.is_deleted)
+
+def _clear_facet_counts(sender, instance, **kwargs):
+    state = (instance.is_public, instance.is_current, instance.is_approved,
+        instance.is_deleted)
+    if kwargs.get('created') or kwargs.get('signal') == signals.post_delete or \
+            getattr(instance, '_facet_state', None) != state:
+        DataShape.clear_facet_counts()
+    instance._facet_state = state
+
+def _shape_changed(sender, **kwargs):
+    DataShape.clear_facet_counts()
+
+signals.post_init.connect(_remember_state, Data, dispatch_uid='data_facet_init')
+signals.post_save.connect(_clear_facet_counts, Data, dispatch_uid='data_facet_save')
+signals.post_delete.connect(_clear_facet_counts, Data, dispatch_uid='data_facet_delete')
+signals.post_save.connect(_shape_changed, DataShape, dispatch_uid='data_shape_save')
+signals.post_delete.connect(_shape_changed, DataShape, dispatch_uid='data_shape_delete')
@@ -0,0 +1,113 @@
+"""
+Composite database indexes for the frequent repository queries.
+
+Django 1.3 can only index single columns, so indexes over several columns
+matching the hot queries are created here: by syncdb for new databases and
+by scripts/upgrade_db.py for existing ones. get_full_scans tells whether a
+query would still read a whole table.
+"""
+
+from django.db import connection, transaction
+from django.db.models import signals
+
+# name, table, columns
+INDEXES = (
+    # Repository.get_object, set_current: current version of a slug
+    ('repository_repository_slug_current', 'repository_repository',
+        ('slug_id', 'is_current', 'is_deleted')),
+    # Repository.get_object, get_versions: versions of a slug
+    ('repository_repository_slug_version', 'repository_repository',
+        ('slug_id', 'version')),
+    # public listings and the API, newest first
+    ('repository_repository_listing', 'repository_repository',
+        ('is_current', 'is_public', 'is_deleted', 'pub_date')),
+    # results of a method, optionally for a task and challenge
+    ('repository_result_method_task', 'repository_result',
+        ('method_id', 'task_id', 'challenge_id')),
+    # results of a challenge per task
+    ('repository_result_challenge_task', 'repository_result',
+        ('challenge_id', 'task_id')),
+)
+
+
+def index_exists(cursor, name, table):
+    """Check whether given index exists.
+
+    @param cursor: database cursor
+    @type cursor: DB-API cursor
+    @param name: name of the index
+    @type name: string
+    @param table: table of the index
+    @type table: string
+    @return: if the index exists
+    @rtype: boolean
+    """
+    if connection.vendor == 'sqlite':
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND name = %s", [name])
+    elif connection.vendor == 'mysql':
+        cursor.execute('SHOW INDEX FROM %s WHERE Key_name = %%s' %
+            connection.ops.quote_name(table), [name])
+    else:
+        cursor.execute('SELECT indexname FROM pg_indexes WHERE indexname = %s', [name])
+    return bool(cursor.fetchall())
+
+
+def create_indexes(verbose=False):
+    """Create the indexes which don't exist yet.
+
+    @param verbose: print the names of created indexes
+    @type verbose: boolean
+    """
+    qn = connection.ops.quote_name
+    cursor = connection.cursor()
+    for name, table, columns in INDEXES:
+        if index_exists(cursor, name, table):
+            continue
+        if verbose:
+            print 'Creating index %s' % name
+        cursor.execute('CREATE INDEX %s ON %s (%s)' % (qn(name), qn(table),
+            ', '.join([qn(c) for c in columns])))
+    transaction.commit_unless_managed()
+
+
+def get_full_scans(queryset):
+    """Get tables a query would read completely.
+
+    Supported for SQLite and MySQL only, no tables are returned for other
+    databases. On SQLite, Python's sqlite3 commits the open transaction
+    before reading the plan.
+
+    @param queryset: query to check
+    @type queryset: QuerySet
+    @return: names of tables read without index
+    @rtype: list of strings
+    """
+    sql, params = queryset.query.get_compiler(using=queryset.db).as_sql()
+    cursor = connection.cursor()
+    tables = []
+    if connection.vendor == 'sqlite':
+        cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+        for row in cursor.fetchall():
+            # e.g. SCAN TABLE repository_data or SCAN repository_data
+            detail = row[-1].split()
+            if detail[0] == 'SCAN' and 'USING' not in detail:
+                if detail[1] == 'TABLE':
+                    tables.append(detail[2])
+                else:
+                    tables.append(detail[1])
+    elif connection.vendor == 'mysql':
+        cursor.execute('EXPLAIN ' + sql, params)
+        columns = [c[0] for c in cursor.description]
+        for row in cursor.fetchall():
+            row = dict(zip(columns, row))
+            if row['type'] == 'ALL':
+                tables.append(row['table'])
+    return tables
+
+
+def _create_indexes(sender, **kwargs):
+    # the app is installed as mldata.repository
+    if sender.__name__.endswith('repository.models'):
+        create_indexes(kwargs.get('verbosity', 1) > 1)
+
+signals.post_syncdb.connect(_create_indexes, dispatch_uid='repository_indexes_create')
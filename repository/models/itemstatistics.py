@@ -0,0 +1,134 @@
+"""
+Daily view and download statistics of repository items.
+
+Hits and downloads of an item are lifetime totals, copied forward to every
+new version. To see load over time and which items drive it, the counts
+are also added to one row per item, day and download format whenever the
+buffered counters are flushed, see ItemCounter.
+"""
+
+from datetime import date, timedelta
+from django.db import models, IntegrityError
+from django.db.models import F, Sum
+
+from base import Slug
+
+# views are counted with an empty format
+HITS_FORMAT = ''
+
+
+class ItemStatistics(models.Model):
+    """Views and downloads of an item on a day.
+
+    Views are counted in the row with an empty format, downloads in the
+    rows of the downloaded format.
+
+    @cvar slug: slug of the item, i.e. all of its versions
+    @type slug: Slug
+    @cvar day: day of the views and downloads
+    @type day: models.DateField
+    @cvar format: download format, e.g. csv, empty for views
+    @type format: string / models.CharField
+    @cvar hits: number of views
+    @type hits: integer / models.IntegerField
+    @cvar downloads: number of downloads
+    @type downloads: integer / models.IntegerField
+    """
+    slug = models.ForeignKey(Slug)
+    day = models.DateField(db_index=True)
+    format = models.CharField(max_length=16, blank=True)
+    hits = models.IntegerField(default=0)
+    downloads = models.IntegerField(default=0)
+
+    class Meta:
+        app_label = 'repository'
+        # the unique index on (slug, day, format) serves lookups by item and day
+        unique_together = ('slug', 'day', 'format')
+        ordering = ('-day', )
+        verbose_name_plural = 'item statistics'
+
+    def __unicode__(self):
+        return unicode("%s %s %s" % (self.slug_id, self.day, self.format))
+
+    @classmethod
+    def add(cls, slug_id, day, field, format, count):
+        """Add views or downloads of an item.
+
+        @param slug_id: id of the item's slug
+        @type slug_id: integer
+        @param day: day of the views or downloads
+        @type day: datetime.date
+        @param field: hits or downloads
+        @type field: string
+        @param format: download format, HITS_FORMAT for views
+        @type format: string
+        @param count: number to add
+        @type count: integer
+        """
+        qs = cls.objects.filter(slug=slug_id, day=day, format=format)
+        if not qs.update(**{field: F(field) + count}):
+            try:
+                cls.objects.create(slug_id=slug_id, day=day, format=format,
+                    **{field: count})
+            except IntegrityError: # created concurrently
+                qs.update(**{field: F(field) + count})
+
+    @classmethod
+    def get_daily(cls, days, slug_id=None):
+        """Get views and downloads per day.
+
+        Days without any are included with zeros.
+
+        @param days: number of days up to today
+        @type days: integer
+        @param slug_id: id of the item's slug, all items if None
+        @type slug_id: integer
+        @return: day, views and downloads, oldest first
+        @rtype: list of tuples
+        """
+        since = date.today() - timedelta(days=days - 1)
+        qs = cls.objects.filter(day__gte=since)
+        if slug_id is not None:
+            qs = qs.filter(slug=slug_id)
+        totals = dict([(row['day'], (row['hits__sum'], row['downloads__sum']))
+            for row in qs.values('day').annotate(Sum('hits'), Sum('downloads'))])
+
+        daily = []
+        for i in xrange(days):
+            day = since + timedelta(days=i)
+            hits, downloads = totals.get(day, (0, 0))
+            daily.append((day, hits, downloads))
+        return daily
+
+    @classmethod
+    def get_top(cls, days, field='downloads', limit=20):
+        """Get the items with most views or downloads.
+
+        @param days: number of days up to today
+        @type days: integer
+        @param field: hits or downloads
+        @type field: string
+        @param limit: number of items
+        @type limit: integer
+        @return: slug text and views and downloads of the items
+        @rtype: list of dicts with keys slug, hits and downloads
+        """
+        since = date.today() - timedelta(days=days - 1)
+        rows = cls.objects.filter(day__gte=since).values('slug__text').annotate(
+            Sum('hits'), Sum('downloads')).order_by('-' + field + '__sum')[:limit]
+        return [{'slug': row['slug__text'], 'hits': row['hits__sum'],
+            'downloads': row['downloads__sum']} for row in rows]
+
+    @classmethod
+    def get_formats(cls, days):
+        """Get downloads per format.
+
+        @param days: number of days up to today
+        @type days: integer
+        @return: format and number of downloads, most downloaded first
+        @rtype: list of tuples
+        """
+        since = date.today() - timedelta(days=days - 1)
+        rows = cls.objects.filter(day__gte=since).exclude(format=HITS_FORMAT).values(
+            'format').annotate(Sum('downloads')).order_by('-downloads__sum')
+        return [(row['format'], row['downloads__sum']) for row in rows]
@@ -1,4 +1,5 @@
 from django.db import models
+from django.core.cache import cache
 from django.core.urlresolvers import reverse
 
 import repository
@@ -10,13 +11,14 @@ from challenge import Challenge
 from django.utils.translation import ugettext as _
 
 from utils import slugify
+from utils.compression import iter_decompressed, MAX_LINE_LENGTH
 
 from mleval import evaluation
 import ml2h5
 import os
 import numpy
 
-from settings import SOLUTIONPATH, MEDIA_ROOT
+from settings import SOLUTIONPATH, MEDIA_ROOT, RESOLUTIONS
 
 # Create your models here.
 class Method(Repository):
@@ -66,14 +68,41 @@ class Method(Repository):
         from repository.models.method import Result
         return Result.objects.filter(method=self.pk)
 
-    def dependent_entries_exist(self):
-        """Check whether there exists an object which depends on self.
+    @classmethod
+    def get_related_counts(cls, ids):
+        """Count results of Method items."""
+        from repository.models.method import Result
+        return {'results': cls._count_by(Result.objects.all(), 'method', ids)}
+
+    @staticmethod
+    def get_curves_cache_key(method_id, resolution):
+        """Get cache key of the rendered curve overlay of a Method.
+
+        @param method_id: id of the Method
+        @type method_id: integer
+        @param resolution: name of resolution, key of settings.RESOLUTIONS
+        @type resolution: string
+        @return: cache key
+        @rtype: string
+        """
+        return 'method_curves_%d_%s' % (method_id, resolution)
+
+    @staticmethod
+    def clear_curves_cache(method_id):
+        """Drop the cached curve overlays of a Method in all resolutions.
+
+        @param method_id: id of the Method
+        @type method_id: integer
+        """
+        cache.delete_many([Method.get_curves_cache_key(method_id, r)
+            for r in RESOLUTIONS.iterkeys()])
+
+    def check_dependent_entries(self):
+        """Query whether there exists an object which depends on self.
 
         for Method objects, checks whether there exists a Result object.
         """
-        if Result.objects.filter(method__slug=self.slug).count() > 0:
-            return True
-        return False
+        return Result.objects.filter(method__slug=self.slug_id).exists()
 
     def can_edit(self, user):
         """Can given user edit this item.
@@ -85,7 +114,7 @@ class Method(Repository):
         """
         if self.dependent_entries_exist():
             return False
-        return self.user==user
+        return self.user_id==user.id
 
 class MethodRating(Rating):
     """Rating for a Method item."""
@@ -99,6 +128,8 @@ class Result(models.Model):
 
     @cvar score: score file
     @type score: models.FileField
+    @cvar output_file: submitted predictions, stored compressed
+    @type output_file: models.FileField
     """
 
     pub_date = models.DateTimeField(auto_now=True, auto_now_add=True)
@@ -127,6 +158,52 @@ class Result(models.Model):
     def get_output_filename(self):
         return os.path.join(MEDIA_ROOT, self.output_file.name)
 
+    def save(self, *args, **kwargs):
+        super(Result, self).save(*args, **kwargs)
+        Method.clear_curves_cache(self.method_id)
+
+    def delete(self, using=None):
+        super(Result, self).delete(using=using)
+        Method.clear_curves_cache(self.method_id)
+
+    @staticmethod
+    def parse_predictions(data, max_rows=None):
+        """Parse submitted predictions, one comma-separated row per line.
+
+        Values are converted to float if all of them are numbers, otherwise
+        they are kept as strings. The data may be given in chunks, e.g. as
+        they are decompressed, so the whole file is never held in memory.
+
+        @param data: contents of an output file or its chunks
+        @type data: string or iterable of strings
+        @param max_rows: maximum number of rows, None for no limit
+        @type max_rows: integer
+        @return: parsed predictions
+        @rtype: list of lists
+        @raise ValueError: if there are too many rows or a row is too long
+        """
+        if isinstance(data, basestring):
+            data = [data]
+        rows = []
+        tail = ''
+        for chunk in data:
+            lines = (tail + chunk).split("\n")
+            tail = lines.pop()
+            rows.extend([d.split(",") for d in lines if d])
+            if len(tail) > MAX_LINE_LENGTH:
+                raise ValueError(_("Row %d is too long, is this a text file?") % (len(rows) + 1))
+            if max_rows is not None and len(rows) > max_rows:
+                break
+        if tail:
+            rows.append(tail.split(","))
+        if max_rows is not None and len(rows) > max_rows:
+            raise ValueError(_("Submitted results have more rows than the %d test instances of the Task") % max_rows)
+
+        try:
+            return [[float(v) for v in d] for d in rows]
+        except ValueError:
+            return rows
+
     def predict(self):
         """Evaluate performance measure.
 
@@ -147,19 +224,20 @@ class Result(models.Model):
         except Exception:
             return -1,_("Couldn't extract true outputs from Data file!"), False
 
+        # as Task.get_test_rows, bounding boxes aren't one per test instance
+        max_rows = None
+        if self.task.performance_measure != 'VOC bounding box':
+            max_rows = len(test_idx[0])
         try:
-            data = self.output_file.read()
-        except Exception:
+            predicted = Result.parse_predictions(
+                iter_decompressed(self.output_file), max_rows)
+        except IOError:
             return -1,_("Failed to read predictions"), False
-
-        try:
-            predicted = [[float(v) for v in d.split(",")] for d in data.split("\n") if d]
-        except ValueError:
-            predicted = [[v for v in d.split(",")] for d in data.split("\n") if d]
+        except ValueError, e:
+            return -1, unicode(e), False
         except Exception:
             return -1,_("Format of given results is wrong!"), False
 
-        data=numpy.array(data)
 #        if type(predicted[0]) == type(''):
 #            correct = map(str, correct)
         predicted = (numpy.array(predicted))
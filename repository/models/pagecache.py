@@ -0,0 +1,129 @@
+"""
+Cache of the pages anonymous users see.
+
+Most requests are anonymous views of public items, indexes and tag pages,
+which look the same for every anonymous user. Their rendered content is
+cached per URL and generation. Every page shows the tag clouds and most
+show items of other classes, e.g. the tasks of a Data item or the results
+of a Task, so any change of an item, result, comment or rating starts a
+new generation instead of tracking which pages it touches. Views of an
+item are still counted when its page comes from the cache, see
+ItemCounter. The generation also keys the template fragments cached for
+logged-in users, see repository.context_processors.
+"""
+
+import hashlib
+import time
+
+from django.contrib.comments.models import Comment
+from django.core.cache import cache
+from django.db.models import signals
+
+from settings import PAGE_CACHE_TIMEOUT
+from data import Data
+from task import Task
+from challenge import Challenge
+from method import Method, Result
+
+GENERATION_KEY = 'page_cache_generation'
+# outlives the pages of a generation
+GENERATION_TIMEOUT = 7*24*60*60
+
+
+class PageCache(object):
+    """Rendered pages for anonymous users.
+
+    A cached page is a tuple of content, content type and the id of the
+    slug of the viewed item, None for indexes.
+    """
+
+    @staticmethod
+    def get_generation():
+        """Get the current generation of cached pages.
+
+        @return: generation
+        @rtype: integer
+        """
+        generation = cache.get(GENERATION_KEY)
+        if generation is None:
+            # starts past the generations lost with the key
+            generation = int(time.time())
+            if not cache.add(GENERATION_KEY, generation, GENERATION_TIMEOUT):
+                generation = cache.get(GENERATION_KEY, generation)
+        return generation
+
+    @staticmethod
+    def is_cacheable(request):
+        """Check whether given request may be answered from the cache.
+
+        @param request: request data
+        @type request: Django request
+        @return: if the request is an anonymous GET and caching is enabled
+        @rtype: boolean
+        """
+        return (PAGE_CACHE_TIMEOUT and request.method == 'GET' and
+            not request.user.is_authenticated())
+
+    @staticmethod
+    def allow(request, slug_id=None):
+        """Mark the page rendered for given request as the same for all
+        anonymous users.
+
+        @param request: request data
+        @type request: Django request
+        @param slug_id: id of the slug of the viewed item, None for indexes
+        @type slug_id: integer
+        """
+        request.page_cache_slug_id = slug_id
+
+    @classmethod
+    def get(cls, request):
+        """Get the cached page for given request.
+
+        Remembers the generation in the request, so a page rendered while
+        an item changes is cached in the generation which is already over.
+
+        @param request: request data
+        @type request: Django request
+        @return: cached page or None
+        @rtype: tuple
+        """
+        request.page_cache_key = 'page_%d_%s' % (cls.get_generation(),
+            hashlib.md5(request.get_full_path()).hexdigest())
+        return cache.get(request.page_cache_key)
+
+    @staticmethod
+    def set(request, response):
+        """Cache the page rendered for given request if allowed.
+
+        Pages with a CSRF token or cookies are specific to the visitor and
+        not cached.
+
+        @param request: request data, after get
+        @type request: Django request
+        @param response: rendered page
+        @type response: Django response
+        """
+        if (not hasattr(request, 'page_cache_slug_id') or
+                response.status_code != 200 or response.cookies or
+                request.META.get('CSRF_COOKIE_USED')):
+            return
+        page = (response.content, response['Content-Type'],
+            request.page_cache_slug_id)
+        cache.set(request.page_cache_key, page, PAGE_CACHE_TIMEOUT)
+
+    @staticmethod
+    def invalidate():
+        """Start a new generation, so all cached pages are rendered again."""
+        try:
+            cache.incr(GENERATION_KEY)
+        except ValueError: # no generation yet
+            pass
+
+
+def _invalidate(sender, **kwargs):
+    PageCache.invalidate()
+
+for klass in (Data, Task, Challenge, Method, Result, Comment):
+    signals.post_save.connect(_invalidate, klass, dispatch_uid='page_cache_save_%s' % klass.__name__)
+    signals.post_delete.connect(_invalidate, klass, dispatch_uid='page_cache_delete_%s' % klass.__name__)
@@ -0,0 +1,101 @@
+"""
+Cached feed of recently changed items for the welcome page.
+
+Every visit of the welcome page used to count and fetch the newest Data,
+Tasks, Challenges and Results. The public part of the feed is the same for
+all visitors, so it is cached until an item or result is saved, deleted or
+switched to another version. Only for logged-in users their own private
+items are queried and merged in.
+"""
+
+from django.core.cache import cache
+from django.db.models import Q, signals
+
+from data import Data
+from task import Task
+from challenge import Challenge
+from method import Method, Result
+
+RECENT_CACHE_KEY = 'recent_items'
+# the feed is invalidated on change, the timeout only limits staleness
+RECENT_CACHE_TIMEOUT = 60*60
+NUM_RECENT = 5
+
+
+class RecentFeed(object):
+    """Recently changed items and results, as shown on the welcome page.
+
+    Entries are dicts with the keys kind, name, url, summary and pub_date,
+    so the cached feed is rendered without further queries. Results are
+    shown as their Method.
+    """
+
+    @staticmethod
+    def _get_entries(q, q_result):
+        """Get the newest items and results matching given filters.
+
+        @param q: filter for Data, Task and Challenge
+        @type q: Q
+        @param q_result: filter for Result
+        @type q_result: Q
+        @return: newest entries, newest first
+        @rtype: list of dicts
+        """
+        entries = []
+        for klass in (Data, Task, Challenge):
+            items = klass.objects.filter(q)
+            if klass == Data:
+                items = items.filter(is_approved=True)
+            items = items.select_related('slug').order_by('-pub_date')
+            for item in items[:NUM_RECENT]:
+                entries.append({'kind': klass.__name__, 'name': item.name,
+                    'url': item.get_absolute_slugurl(),
+                    'summary': item.summary, 'pub_date': item.pub_date})
+
+        results = Result.objects.filter(q_result).select_related(
+            'method__slug').order_by('-pub_date')
+        for result in results[:NUM_RECENT]:
+            entries.append({'kind': 'Method', 'name': result.method.name,
+                'url': result.method.get_absolute_slugurl(),
+                'summary': result.method.summary, 'pub_date': result.pub_date})
+
+        entries.sort(key=lambda e: e['pub_date'], reverse=True)
+        return entries[:NUM_RECENT]
+
+    @classmethod
+    def get(cls, user):
+        """Get recently changed items.
+
+        @param user: user to get recent items for
+        @type user: auth.models.user
+        @return: newest entries, newest first
+        @rtype: list of dicts
+        """
+        entries = cache.get(RECENT_CACHE_KEY)
+        if entries is None:
+            entries = cls._get_entries(Q(is_public=True, is_current=True),
+                Q(method__is_public=True, method__is_current=True))
+            cache.set(RECENT_CACHE_KEY, entries, RECENT_CACHE_TIMEOUT)
+
+        # without if-construct sqlite3 barfs on AnonymousUser
+        if user.id:
+            entries = entries + cls._get_entries(
+                Q(user=user.id, is_public=False, is_current=True),
+                Q(method__user=user.id, method__is_public=False,
+                    method__is_current=True))
+            entries.sort(key=lambda e: e['pub_date'], reverse=True)
+            entries = entries[:NUM_RECENT]
+        return entries
+
+    @staticmethod
+    def invalidate():
+        """Drop the cached feed, so the next visit fetches it again."""
+        cache.delete(RECENT_CACHE_KEY)
+
+
+def _invalidate(sender, **kwargs):
+    RecentFeed.invalidate()
+
+for klass in (Data, Task, Challenge, Method, Result):
+    signals.post_save.connect(_invalidate, klass, dispatch_uid='recent_save_%s' % klass.__name__)
+    signals.post_delete.connect(_invalidate, klass, dispatch_uid='recent_delete_%s' % klass.__name__)
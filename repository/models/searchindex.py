@@ -0,0 +1,324 @@
+"""
+Full-text search index for repository items.
+
+Searching with LIKE scans whole tables, can't use an index and yields no
+relevance. Instead, name, summary, description, tags and source of every
+public current item are kept in a full-text index: an FTS5 virtual table
+on SQLite, a MyISAM table with FULLTEXT keys on MySQL. The index is
+created by syncdb and updated whenever an item is saved or deleted.
+"""
+
+import logging
+import re
+from django.db import connection, transaction
+from django.db.models import signals
+
+from data import Data
+from task import Task
+from challenge import Challenge
+from method import Method
+
+TABLE = 'repository_searchindex'
+COLUMNS = ('name', 'summary', 'description', 'tags', 'source')
+# relevance weight of the columns, used by SQLite only
+WEIGHTS = (10.0, 4.0, 1.0, 4.0, 2.0)
+
+logger = logging.getLogger('mldata.search')
+
+CREATE = {
+    'sqlite': """
+        CREATE VIRTUAL TABLE IF NOT EXISTS %(table)s USING fts5(
+            name, summary, description, tags, source, klass UNINDEXED,
+            tokenize = 'porter unicode61')""",
+    'mysql': """
+        CREATE TABLE IF NOT EXISTS %(table)s (
+            repository_id integer NOT NULL PRIMARY KEY,
+            klass varchar(16) NOT NULL,
+            name varchar(32) NOT NULL,
+            summary varchar(255) NOT NULL,
+            description longtext NOT NULL,
+            tags varchar(255) NOT NULL,
+            source longtext NOT NULL,
+            KEY klass (klass),
+            FULLTEXT KEY name (name),
+            FULLTEXT KEY content (name, summary, description, tags, source)
+        ) ENGINE=MyISAM DEFAULT CHARSET=utf8""",
+}
+
+
+class SearchIndex(object):
+    """Access to the full-text search index."""
+    _available = None
+
+    @classmethod
+    def is_available(cls):
+        """Check if the index exists for the database in use.
+
+        @return: if the index can be used
+        @rtype: boolean
+        """
+        if cls._available is None:
+            cls._available = connection.vendor in CREATE and \
+                TABLE in connection.introspection.table_names()
+        return cls._available
+
+    @classmethod
+    def create(cls):
+        """Create the index table if the database supports it."""
+        if connection.vendor not in CREATE:
+            return
+        cursor = connection.cursor()
+        try:
+            cursor.execute(CREATE[connection.vendor] % {'table': TABLE})
+        except Exception, e: # e.g. SQLite compiled without FTS5
+            logger.warning('Full-text search index not created: %s' % e)
+            transaction.rollback_unless_managed()
+        else:
+            transaction.commit_unless_managed()
+        cls._available = None
+
+    @staticmethod
+    def is_searchable(item):
+        """Check if item should be found by search."""
+        return item.is_public and item.is_current and not item.is_deleted \
+            and item.check_is_approved()
+
+    @classmethod
+    def update(cls, item):
+        """Add, update or remove item in index, depending on its state.
+
+        @param item: item to index
+        @type item: Data, Task, Challenge or Method
+        """
+        if not cls.is_available():
+            return
+        cursor = connection.cursor()
+        if connection.vendor == 'sqlite':
+            cursor.execute('DELETE FROM %s WHERE rowid = %%s' % TABLE, [item.pk])
+        if cls.is_searchable(item):
+            values = [getattr(item, c, '') or '' for c in COLUMNS]
+            if connection.vendor == 'sqlite':
+                sql = 'INSERT INTO %s (rowid, klass, %s) VALUES (%%s, %%s, %s)'
+            else:
+                sql = 'REPLACE INTO %s (repository_id, klass, %s) VALUES (%%s, %%s, %s)'
+            cursor.execute(sql % (TABLE, ', '.join(COLUMNS),
+                ', '.join(['%s'] * len(COLUMNS))),
+                [item.pk, item.__class__.__name__] + values)
+        elif connection.vendor == 'mysql':
+            cursor.execute('DELETE FROM %s WHERE repository_id = %%s' % TABLE, [item.pk])
+        transaction.commit_unless_managed()
+
+    @classmethod
+    def remove(cls, item):
+        """Remove item from index.
+
+        @param item: item to remove
+        @type item: Data, Task, Challenge or Method
+        """
+        cls.remove_id(item.pk)
+
+    @classmethod
+    def remove_id(cls, id):
+        """Remove item with given id from index.
+
+        @param id: id of the item to remove
+        @type id: integer
+        """
+        if not cls.is_available():
+            return
+        if connection.vendor == 'sqlite':
+            sql = 'DELETE FROM %s WHERE rowid = %%s'
+        else:
+            sql = 'DELETE FROM %s WHERE repository_id = %%s'
+        connection.cursor().execute(sql % TABLE, [id])
+        transaction.commit_unless_managed()
+
+    @classmethod
+    def rebuild(cls, klass):
+        """Reindex all items of given class.
+
+        @param klass: item class
+        @type klass: Data, Task, Challenge or Method
+        """
+        for item in klass.objects.filter(is_public=True, is_current=True, is_deleted=False):
+            cls.update(item)
+
+    @staticmethod
+    def _get_match(klass, words):
+        """Get the condition and its parameters matching all given words.
+
+        @param klass: item class
+        @type klass: Data, Task, Challenge or Method
+        @param words: words to search for
+        @type words: list of strings
+        @return: SQL condition and its parameters
+        @rtype: tuple
+        """
+        if connection.vendor == 'sqlite':
+            query = ' '.join(['"%s"*' % w for w in words])
+            return '%s MATCH %%s AND klass = %%s' % TABLE, [query, klass.__name__]
+        query = ' '.join(['+%s*' % w for w in words])
+        return 'klass = %%s AND MATCH (%s) AGAINST (%%s IN BOOLEAN MODE)' % \
+            ', '.join(COLUMNS), [klass.__name__, query]
+
+    @classmethod
+    def search(cls, klass, searchterm, offset=0, limit=None):
+        """Search items of given class, best matches first.
+
+        All words of the searchterm must match, as a word or a prefix of one.
+
+        @param klass: item class
+        @type klass: Data, Task, Challenge or Method
+        @param searchterm: words to search for
+        @type searchterm: string
+        @param offset: number of best matches to skip if limit is given
+        @type offset: integer
+        @param limit: maximum number of ids, None for all
+        @type limit: integer
+        @return: ids of matching items, ordered by relevance
+        @rtype: list of integers
+        """
+        words = re.findall(r'\w+', searchterm, re.UNICODE)
+        if not words:
+            return []
+
+        where, params = cls._get_match(klass, words)
+        if connection.vendor == 'sqlite':
+            weights = ', '.join([str(w) for w in WEIGHTS])
+            sql = """
+                SELECT rowid FROM %(table)s WHERE %(where)s
+                ORDER BY bm25(%(table)s, %(weights)s, 0.0)""" % {
+                'table': TABLE, 'where': where, 'weights': weights}
+        else:
+            text = ' '.join(words)
+            sql = """
+                SELECT repository_id FROM %(table)s WHERE %(where)s
+                ORDER BY 3 * MATCH (name) AGAINST (%%s) + MATCH (%(content)s) AGAINST (%%s) DESC""" % {
+                'table': TABLE, 'where': where, 'content': ', '.join(COLUMNS)}
+            params += [text, text]
+        if limit is not None:
+            sql += ' LIMIT %d OFFSET %d' % (limit, offset)
+
+        cursor = connection.cursor()
+        cursor.execute(sql, params)
+        return [row[0] for row in cursor.fetchall()]
+
+    @classmethod
+    def count(cls, klass, searchterm):
+        """Count the items of given class matching a search.
+
+        @param klass: item class
+        @type klass: Data, Task, Challenge or Method
+        @param searchterm: words to search for
+        @type searchterm: string
+        @return: number of matching items
+        @rtype: integer
+        """
+        words = re.findall(r'\w+', searchterm, re.UNICODE)
+        if not words:
+            return 0
+        where, params = cls._get_match(klass, words)
+        cursor = connection.cursor()
+        cursor.execute('SELECT COUNT(*) FROM %s WHERE %s' % (TABLE, where), params)
+        return cursor.fetchone()[0]
+
+
+class SearchHits(object):
+    """Lazy list of the ids of the items matching a search, best first.
+
+    Only the number of matches and the ids of the requested slices are
+    queried, so pages of results needn't be limited.
+    """
+
+    def __init__(self, klass, searchterm):
+        """
+        @param klass: item class
+        @type klass: Data, Task, Challenge or Method
+        @param searchterm: words to search for
+        @type searchterm: string
+        """
+        self.klass = klass
+        self.searchterm = searchterm
+        self._count = None
+
+    def __len__(self):
+        if self._count is None:
+            self._count = SearchIndex.count(self.klass, self.searchterm)
+        return self._count
+
+    def __iter__(self):
+        return iter(SearchIndex.search(self.klass, self.searchterm))
+
+    def __getitem__(self, k):
+        if isinstance(k, slice):
+            start, stop, step = k.indices(len(self))
+            if stop <= start:
+                return []
+            return SearchIndex.search(self.klass, self.searchterm, start,
+                stop - start)[::step]
+        if k < 0:
+            k += len(self)
+        ids = k >= 0 and SearchIndex.search(self.klass, self.searchterm, k, 1)
+        if not ids:
+            raise IndexError('search hit index out of range')
+        return ids[0]
+
+
+class SearchResults(object):
+    """Lazy list of search results for pagination.
+
+    Only the items of the requested page are fetched from the database,
+    in the order of relevance. Items which are not searchable anymore
+    are skipped.
+    """
+
+    def __init__(self, klass, ids, queryset=None):
+        """
+        @param klass: item class
+        @type klass: Data, Task, Challenge or Method
+        @param ids: ids of found items, ordered by relevance
+        @type ids: list of integers or SearchHits
+        @param queryset: restricts the items to fetch
+        @type queryset: QuerySet of klass
+        """
+        self.model = klass
+        self.ids = ids
+        if queryset is None:
+            queryset = klass.objects.all()
+        self.queryset = queryset
+
+    def count(self):
+        return len(self.ids)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __getitem__(self, k):
+        if isinstance(k, slice):
+            ids = self.ids[k]
+        else:
+            ids = [self.ids[k]]
+        found = self.queryset.in_bulk(ids)
+        items = [found[i] for i in ids if i in found]
+        if isinstance(k, slice):
+            return items
+        if not items:
+            raise IndexError('search result not available')
+        return items[0]
+
+
+def _create_index(sender, **kwargs):
+    # the app is installed as mldata.repository
+    if sender.__name__.endswith('repository.models'):
+        SearchIndex.create()
+
+def _update_index(sender, instance, **kwargs):
+    SearchIndex.update(instance)
+
+def _remove_from_index(sender, instance, **kwargs):
+    SearchIndex.remove(instance)
+
+signals.post_syncdb.connect(_create_index, dispatch_uid='search_index_create')
+for klass in (Data, Task, Challenge, Method):
+    signals.post_save.connect(_update_index, klass, dispatch_uid='search_index_save_%s' % klass.__name__)
+    signals.post_delete.connect(_remove_from_index, klass, dispatch_uid='search_index_delete_%s' % klass.__name__)
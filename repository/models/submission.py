@@ -0,0 +1,191 @@
+"""
+Throttling of Result submissions.
+
+Scoring a submission is synchronous and may take a while for large test
+sets, so submissions are rate limited per user with a token bucket and,
+for challenges, limited by a daily quota. Both are kept in the cache, the
+daily quota is re-read from the database if the cache lost it.
+"""
+
+import time
+from datetime import date
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import models, IntegrityError
+from django.db.models import F, Sum
+from django.utils.translation import ugettext as _
+
+from settings import SUBMISSION_RATE, SUBMISSION_BURST, SUBMISSION_DAILY_QUOTA
+from challenge import Challenge
+
+SECONDS_PER_DAY = 24 * 60 * 60
+# a user's bucket is locked while a token is taken, the timeout frees the
+# lock of a crashed request
+BUCKET_LOCK_TIMEOUT = 10
+BUCKET_LOCK_TRIES = 20
+BUCKET_LOCK_DELAY = 0.05
+
+
+class SubmissionThrottled(Exception):
+    """Raised when a submission is rejected by the rate limit or quota.
+
+    @ivar message: explanation for the user
+    @type message: string
+    @ivar retry_after: seconds until a submission will be accepted again
+    @type retry_after: integer
+    """
+    def __init__(self, message, retry_after):
+        super(SubmissionThrottled, self).__init__(message)
+        self.message = message
+        self.retry_after = retry_after
+
+
+class SubmissionCounter(models.Model):
+    """Daily count of a user's Result submissions.
+
+    Used for the daily quota of challenges and as statistics for admins.
+
+    @cvar user: submitting user
+    @type user: Django User
+    @cvar challenge: challenge submitted to, if any
+    @type challenge: Challenge
+    @cvar day: day of the submissions
+    @type day: models.DateField
+    @cvar accepted: number of submissions which were scored
+    @type accepted: integer / models.IntegerField
+    @cvar rejected: number of submissions rejected by rate limit or quota
+    @type rejected: integer / models.IntegerField
+    """
+    user = models.ForeignKey(User, related_name='submission_user')
+    challenge = models.ForeignKey(Challenge, null=True, blank=True)
+    day = models.DateField()
+    accepted = models.IntegerField(default=0)
+    rejected = models.IntegerField(default=0)
+
+    class Meta:
+        app_label = 'repository'
+        unique_together = ('user', 'challenge', 'day')
+        ordering = ('-day', )
+
+    def __unicode__(self):
+        return unicode("%s %s %s" % (self.user_id, self.challenge_id, self.day))
+
+    @staticmethod
+    def _get_quota_key(user, challenge, day):
+        return 'submission_quota_%d_%d_%s' % (user.id, challenge.id, day.isoformat())
+
+    @staticmethod
+    def _get_bucket_key(user):
+        return 'submission_bucket_%d' % user.id
+
+    @classmethod
+    def get_accepted(cls, user, challenge, day):
+        """Get number of accepted submissions of user to challenge on day.
+
+        @return: number of accepted submissions
+        @rtype: integer
+        """
+        key = cls._get_quota_key(user, challenge, day)
+        count = cache.get(key)
+        if count is None:
+            count = cls.objects.filter(user=user, challenge=challenge,
+                day=day).aggregate(Sum('accepted'))['accepted__sum'] or 0
+            cache.set(key, count, SECONDS_PER_DAY)
+        return count
+
+    @classmethod
+    def _take_token(cls, user):
+        """Take a token from the user's bucket.
+
+        The bucket holds up to SUBMISSION_BURST tokens and is refilled with
+        SUBMISSION_RATE tokens per hour. It is locked while the token is
+        taken, so concurrent submissions can't take the same token.
+
+        @raise SubmissionThrottled: if the bucket is empty
+        """
+        if not SUBMISSION_RATE:
+            return
+        key = cls._get_bucket_key(user)
+        # the cache has no compare-and-set, so concurrent submissions of the
+        # user are serialized with a lock taken by the atomic cache.add
+        lock = key + '_lock'
+        for i in xrange(BUCKET_LOCK_TRIES):
+            if cache.add(lock, 1, BUCKET_LOCK_TIMEOUT):
+                break
+            time.sleep(BUCKET_LOCK_DELAY)
+        else:
+            raise SubmissionThrottled(_('Another submission is in progress, please try again in a moment.'), 1)
+
+        try:
+            now = time.time()
+            rate = SUBMISSION_RATE / 3600.0
+            state = cache.get(key)
+            if state:
+                tokens, last = state
+                tokens = min(SUBMISSION_BURST, tokens + (now - last) * rate)
+            else:
+                tokens = SUBMISSION_BURST
+
+            if tokens < 1:
+                retry_after = int((1 - tokens) / rate) + 1
+                raise SubmissionThrottled(_('Too many submissions, please wait %d seconds before submitting again.') % retry_after, retry_after)
+
+            timeout = int(SUBMISSION_BURST / rate) + 1
+            cache.set(key, (tokens - 1, now), timeout)
+        finally:
+            cache.delete(lock)
+
+    @classmethod
+    def check(cls, user, challenge=None):
+        """Check whether user may submit a Result now.
+
+        Rejected submissions are counted.
+
+        @param user: submitting user
+        @type user: Django User
+        @param challenge: challenge submitted to, if any
+        @type challenge: Challenge
+        @raise SubmissionThrottled: if rate limit or daily quota are exceeded
+        """
+        try:
+            if challenge:
+                quota = challenge.max_daily_submissions or SUBMISSION_DAILY_QUOTA
+                if quota and cls.get_accepted(user, challenge, date.today()) >= quota:
+                    retry_after = SECONDS_PER_DAY - int(time.time() -
+                        time.mktime(date.today().timetuple()))
+                    raise SubmissionThrottled(_('You reached the limit of %d submissions per day to this challenge, please try again tomorrow.') % quota, retry_after)
+            cls._take_token(user)
+        except SubmissionThrottled:
+            cls.record(user, challenge, accepted=False)
+            raise
+
+    @classmethod
+    def record(cls, user, challenge=None, accepted=True):
+        """Count a submission.
+
+        @param user: submitting user
+        @type user: Django User
+        @param challenge: challenge submitted to, if any
+        @type challenge: Challenge
+        @param accepted: if the submission was accepted
+        @type accepted: boolean
+        """
+        day = date.today()
+        if accepted:
+            field = 'accepted'
+        else:
+            field = 'rejected'
+
+        qs = cls.objects.filter(user=user, challenge=challenge, day=day)
+        if not qs.update(**{field: F(field) + 1}):
+            try:
+                cls.objects.create(user=user, challenge=challenge, day=day,
+                    **{field: 1})
+            except IntegrityError: # created concurrently
+                qs.update(**{field: F(field) + 1})
+
+        if accepted and challenge:
+            try:
+                cache.incr(cls._get_quota_key(user, challenge, day))
+            except ValueError: # not cached, will be read from db
+                pass
@@ -0,0 +1,158 @@
+"""
+Denormalized tag usage for the tag clouds.
+
+The tag clouds are shown on almost every page, aggregating the tags of all
+public items on every request is too expensive. Instead the number of
+public current items carrying a tag is kept per item class and updated
+whenever an item changes its tags or visibility, i.e. on save, delete and
+set_current. The public cloud is cached per class on top of that.
+"""
+
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.db import models, IntegrityError
+from django.db.models import Count, signals
+from tagging.models import Tag, TaggedItem
+from tagging.utils import parse_tag_input
+
+from data import Data
+from task import Task
+from challenge import Challenge
+from method import Method
+
+TAG_CLOUD_CACHE_TIMEOUT = 60*60*24
+
+
+class TagUsage(models.Model):
+    """Number of public current items of a class carrying a tag.
+
+    @cvar content_type: item class
+    @type content_type: ContentType
+    @cvar tag: the tag
+    @type tag: tagging.Tag
+    @cvar count: number of public current items of the class with the tag
+    @type count: integer / models.IntegerField
+    """
+    content_type = models.ForeignKey(ContentType)
+    tag = models.ForeignKey(Tag)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        app_label = 'repository'
+        unique_together = ('content_type', 'tag')
+
+    def __unicode__(self):
+        return unicode("%s %s %d" % (self.content_type_id, self.tag_id, self.count))
+
+    @staticmethod
+    def get_cache_key(klass):
+        return 'tag_cloud_%s' % klass.__name__
+
+    @staticmethod
+    def get_public_items(klass):
+        """Get items of klass which count for the public tag cloud."""
+        return klass.objects.filter(is_public=True, is_current=True)
+
+    @classmethod
+    def update(cls, klass, tag_names):
+        """Recount usage of given tags for given class.
+
+        @param klass: item class
+        @type klass: Data, Task, Challenge or Method
+        @param tag_names: names of the tags to recount
+        @type tag_names: list of strings
+        """
+        tags = Tag.objects.filter(name__in=tag_names)
+        if not tags:
+            return
+        ctype = ContentType.objects.get_for_model(klass)
+        items = cls.get_public_items(klass).values_list('pk', flat=True)
+        counts = dict(TaggedItem.objects.filter(content_type=ctype,
+            tag__in=tags, object_id__in=items).values_list('tag').annotate(
+            Count('id')))
+
+        for tag in tags:
+            count = counts.get(tag.id, 0)
+            qs = cls.objects.filter(content_type=ctype, tag=tag)
+            if not count:
+                qs.delete()
+            elif not qs.update(count=count):
+                try:
+                    cls.objects.create(content_type=ctype, tag=tag, count=count)
+                except IntegrityError: # created concurrently
+                    qs.update(count=count)
+        cache.delete(cls.get_cache_key(klass))
+
+    @classmethod
+    def rebuild(cls, klass):
+        """Recount usage of all tags for given class.
+
+        @param klass: item class
+        @type klass: Data, Task, Challenge or Method
+        """
+        ctype = ContentType.objects.get_for_model(klass)
+        cls.objects.filter(content_type=ctype).delete()
+        for tag in Tag.objects.usage_for_queryset(
+                cls.get_public_items(klass), counts=True):
+            cls.objects.create(content_type=ctype, tag=tag, count=tag.count)
+        cache.delete(cls.get_cache_key(klass))
+
+    @classmethod
+    def get_public_tags(cls, klass):
+        """Get tags of public current items of given class.
+
+        @param klass: item class
+        @type klass: Data, Task, Challenge or Method
+        @return: tags with attribute count
+        @rtype: list of tagging.Tag
+        """
+        key = cls.get_cache_key(klass)
+        tags = cache.get(key)
+        if tags is None:
+            ctype = ContentType.objects.get_for_model(klass)
+            tags = []
+            for usage in cls.objects.filter(content_type=ctype).select_related('tag'):
+                usage.tag.count = usage.count
+                tags.append(usage.tag)
+            cache.set(key, tags, TAG_CLOUD_CACHE_TIMEOUT)
+        return tags
+
+
+def _get_public_state(instance):
+    if instance.is_public and instance.is_current:
+        return set(parse_tag_input(instance.tags or ''))
+    return set()
+
+def _remember_state(sender, instance, **kwargs):
+    # only the visibility, reading the tags would query them for every
+    # loaded item
+    instance._tag_usage_public = instance.pk is not None and \
+        instance.is_public and instance.is_current
+
+def _remember_tags(sender, instance, **kwargs):
+    # the tags saved last, before the TagField replaces them after save
+    if getattr(instance, '_tag_usage_public', False):
+        instance._tag_usage_state = set([t.name for t in Tag.objects.get_for_object(instance)])
+    else:
+        instance._tag_usage_state = set()
+
+def _update_usage(sender, instance, **kwargs):
+    old = getattr(instance, '_tag_usage_state', set())
+    if kwargs.get('created'):
+        old = set()
+    if kwargs.get('signal') == signals.post_delete:
+        new = set()
+    else:
+        new = _get_public_state(instance)
+    if old != new:
+        TagUsage.update(sender, list(old | new))
+    instance._tag_usage_public = instance.is_public and instance.is_current
+
+# connected after the TagFields, their post_save stores the tags which are
+# recounted here
+for klass in (Data, Task, Challenge, Method):
+    signals.post_init.connect(_remember_state, klass, dispatch_uid='tag_usage_init_%s' % klass.__name__)
+    signals.pre_save.connect(_remember_tags, klass, dispatch_uid='tag_usage_pre_save_%s' % klass.__name__)
+    signals.pre_delete.connect(_remember_tags, klass, dispatch_uid='tag_usage_pre_delete_%s' % klass.__name__)
+    signals.post_save.connect(_update_usage, klass, dispatch_uid='tag_usage_save_%s' % klass.__name__)
+    signals.post_delete.connect(_update_usage, klass, dispatch_uid='tag_usage_delete_%s' % klass.__name__)
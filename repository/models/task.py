@@ -1,5 +1,6 @@
 from django.db import models
 from django.db.models import Q
+from django.core.cache import cache
 from django.core.urlresolvers import reverse
 from django.utils.translation import ugettext as _
 
@@ -168,6 +169,17 @@ class Task(Repository):
         from repository.models.method import Result
         return Result.objects.filter(task=self.pk)
 
+    @classmethod
+    def get_related_counts(cls, ids):
+        """Count results and public challenges of Task items."""
+        from repository.models.method import Result
+        from repository.models.challenge import Challenge
+        return {
+            'methods': cls._count_by(Result.objects.all(), 'task', ids),
+            'challenges': cls._count_by(Challenge.objects.filter(
+                cls().get_public_qs()), 'task', ids),
+        }
+
     def get_challenges(self, user=None):
         qs=self.get_public_qs(user)
         return self.challenge_set.filter(qs)
@@ -175,19 +187,42 @@ class Task(Repository):
     def get_extract(self):
         return ml2h5.task.get_extract(os.path.join(MEDIA_ROOT, self.file.name))
 
+    def get_test_rows(self):
+        """Get the number of rows a Result's output file must have.
+
+        The number is cached, a Task file doesn't change within a version.
+
+        @return: number of test instances or None if it can't be determined
+        @rtype: integer
+        """
+        if self.performance_measure == 'VOC bounding box':
+            return None
+
+        cache_key = 'task_test_rows_%d' % self.pk
+        rows = cache.get(cache_key)
+        if rows is None:
+            try:
+                test_idx, output_variables = ml2h5.task.get_test_output(self.get_task_filename())
+                rows = len(test_idx[0])
+            except Exception:
+                rows = -1
+            cache.set(cache_key, rows)
+
+        if rows < 0:
+            return None
+        return rows
+
     def get_split_image(self,split_nr):
         return ml2h5.task.get_split_image(os.path.join(MEDIA_ROOT, self.file.name),split_nr)
 
-    def dependent_entries_exist(self):
-        """Check whether there exists an object which depends on self.
+    def check_dependent_entries(self):
+        """Query whether there exists an object which depends on self.
 
         for Task objects, checks whether there exists a Challenge or Result object.
         """
-        if repository.models.Challenge.objects.filter(task__slug=self.slug).count() > 0:
-            return True
-        if repository.models.Result.objects.filter(task__slug=self.slug).count() > 0:
+        if repository.models.Challenge.objects.filter(task__slug=self.slug_id).exists():
             return True
-        return False
+        return repository.models.Result.objects.filter(task__slug=self.slug_id).exists()
 
     def has_h5(self):
         return self.get_task_filename().endswith('.h5')
@@ -17,6 +17,8 @@ def item_index(context, queryset, klass):
     if context.has_key('searchterm'):
         r['searchterm']=quote(context['searchterm'],'')
         r['selecttab']='#tabs-' + klass.lower()
+    if context.has_key('facet_query'):
+        r['facet_query']=context['facet_query']
     if context.has_key('klass'):
         r['klass']=quote(context['klass'],'')
     if context.has_key('tagcloud'):
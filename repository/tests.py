@@ -6,7 +6,9 @@ Replace these with more appropriate tests for your application.
 """
 import os
 
-from django.test import TestCase
+from django.test import TestCase, TransactionTestCase
+from django.utils import unittest
+from django.db import connection
 from django.contrib.auth.models import User
 from django.core.files import File
 from datetime import datetime as dt
@@ -80,6 +82,34 @@ class RepositoryTest(TestCase):
     def do_post(self, url, params, follow=False):
         return self.client.post(self.url[url], params, follow=follow)
 
+    def attach_file(self, data):
+        """Give a Data item a file, item pages show its size."""
+        import shutil
+        fname = os.path.join(DATAPATH, data.slug.text + '.txt')
+        shutil.copy('fixtures/breastcancer-small.txt', os.path.join(MEDIA_ROOT, fname))
+        self.addCleanup(self.remove_if_exists, os.path.join(MEDIA_ROOT, fname))
+        data.file.name = fname
+        data.format = 'libsvm'
+        data.save()
+
+    def get_queries(self, func, *args, **kwargs):
+        """Call func, return its result and the SQL queries it executed."""
+        from django.conf import settings
+        debug = settings.DEBUG
+        settings.DEBUG = True
+        connection.queries = []
+        try:
+            result = func(*args, **kwargs)
+            return result, connection.queries
+        finally:
+            settings.DEBUG = debug
+
+    def get_page_queries(self, url):
+        """Fetch url, return the response and the number of queries."""
+        r, queries = self.get_queries(self.client.get, url)
+        self.assertEqual(200, r.status_code)
+        return r, len(queries)
+
     #
     # Tests
     #
@@ -320,29 +350,848 @@ class PerformenceTest(RepositoryTest):
         self.assertTemplateUsed(r, 'data/item_view.html')
 
     def test_view_data_queries(self):
-        from django.conf import settings
-        from django.db import connection
-
         self.remove_if_exists(self.data_file_name)
-        settings.DEBUG = True
         self.add_data()
-        connection.queries = []
-        r = self.do_post('new_data_view', {}, follow=True)
-        self.assertLess(len(connection.queries), 5, "More than 5 queries executed during simple data view")
-        settings.DEBUG = False
+        r, queries = self.get_queries(self.do_post, 'new_data_view', {}, follow=True)
+        self.assertLess(len(queries), 5, "More than 5 queries executed during simple data view")
 
     def test_view_many_datasets(self):
-        from django.conf import settings
-        from django.db import connection
-
         for i in xrange(1, 10):
             self.add_data(i.__str__())
 
         import time
         start = time.time()
-        settings.DEBUG = True
-        connection.queries = []
-        r = self.do_post('new_data_view', {}, follow=True)
-        self.assertLess(len(connection.queries), 5, "More than 5 queries executed during simple data view")
-        settings.DEBUG = False
+        r, queries = self.get_queries(self.do_post, 'new_data_view', {}, follow=True)
+        self.assertLess(len(queries), 5, "More than 5 queries executed during simple data view")
         self.assertLess(time.time() - start, 1000, "Slow response ( > 1 sek)")
+
+    def test_index_counts_once(self):
+        r, queries = self.get_queries(self.do_get, 'index_data')
+        counts = [q for q in queries
+            if 'COUNT(' in q['sql'] and 'repository_data' in q['sql']]
+        self.assertLessEqual(len(counts), 1, "Data counted more than once on index page")
+
+
+class CurveTest(TestCase):
+    def test_simplify_straight_line(self):
+        from repository.views.util import simplify_curve
+        x = range(100000)
+        sx, sy = simplify_curve(x, x, 400, 300)
+        self.assertEqual([0, 99999], list(sx))
+
+    def test_simplify_keeps_corners(self):
+        from repository.views.util import simplify_curve
+        x = [0, 1, 2, 3, 4, 5, 6]
+        y = [0, 0, 0, 1, 1, 1, 1]
+        sx, sy = simplify_curve(x, y, 400, 300)
+        self.assertEqual([0, 2, 3, 6], list(sx))
+
+
+class ResultUploadTest(TestCase):
+    def get_handler(self, expected):
+        from django.http import HttpRequest
+        from utils.resultuploadhandler import ResultUploadHandler
+        handler = ResultUploadHandler(HttpRequest())
+        handler.expected = expected
+        handler.new_file('output_file', 'out.txt', 'text/plain', None)
+        return handler
+
+    def test_rows_split_over_chunks(self):
+        h = self.get_handler(2)
+        h.receive_data_chunk('1,', 0)
+        h.receive_data_chunk('2\n3,4\n', 2)
+        h.file_complete(8)
+        self.assertEqual(2, h.rows)
+        self.assertFalse(hasattr(h.request, 'result_upload_error'))
+
+    def test_too_many_rows(self):
+        from django.core.files.uploadhandler import StopUpload
+        h = self.get_handler(2)
+        h.receive_data_chunk('1\n2\n', 0)
+        self.assertRaises(StopUpload, h.receive_data_chunk, '3\n', 4)
+        self.assertTrue(h.request.result_upload_error)
+
+    def test_too_few_rows(self):
+        h = self.get_handler(3)
+        h.receive_data_chunk('1\n2', 0)
+        h.file_complete(3)
+        self.assertTrue(h.request.result_upload_error)
+
+    def test_wrong_number_of_columns(self):
+        from django.core.files.uploadhandler import StopUpload
+        h = self.get_handler(3)
+        self.assertRaises(StopUpload, h.receive_data_chunk, '1,2\n3\n', 0)
+        self.assertTrue(h.request.result_upload_error)
+
+    def test_gzip_compressed_rows(self):
+        import gzip
+        from StringIO import StringIO
+        buf = StringIO()
+        gz = gzip.GzipFile(fileobj=buf, mode='wb')
+        gz.write('1\n2\n3\n')
+        gz.close()
+        data = buf.getvalue()
+
+        h = self.get_handler(3)
+        h.receive_data_chunk(data[:5], 0)
+        h.receive_data_chunk(data[5:], 5)
+        h.file_complete(len(data))
+        self.assertEqual(3, h.rows)
+        self.assertFalse(hasattr(h.request, 'result_upload_error'))
+
+    def test_truncated_compressed_rows(self):
+        import bz2, gzip
+        from StringIO import StringIO
+        from utils.compression import iter_decompressed
+        buf = StringIO()
+        gz = gzip.GzipFile(fileobj=buf, mode='wb')
+        gz.write('1\n2\n3\n')
+        gz.close()
+        for data in (buf.getvalue(), bz2.compress('1\n2\n3\n')):
+            self.assertEqual('1\n2\n3\n', ''.join(iter_decompressed(StringIO(data))))
+            for cut in (1, 9):
+                self.assertRaises(IOError, list, iter_decompressed(StringIO(data[:-cut])))
+
+        data = buf.getvalue()[:-1]
+        h = self.get_handler(3)
+        h.receive_data_chunk(data, 0)
+        h.file_complete(len(data))
+        self.assertTrue(h.request.result_upload_error)
+
+    def test_parse_predictions_in_chunks(self):
+        self.assertEqual([[1.0, 2.0], [3.0, 4.0]],
+            Result.parse_predictions(['1,', '2\n3,4', '\n\n']))
+        self.assertEqual([['a', '1'], ['b', '2']],
+            Result.parse_predictions('a,1\nb,2'))
+
+    def test_parse_predictions_stops_after_max_rows(self):
+        def chunks():
+            yield '1\n2\n3\n'
+            raise AssertionError('read past the limit')
+        self.assertRaises(ValueError, Result.parse_predictions, chunks(), 2)
+
+
+class PredictionsTest(RepositoryTest):
+    def test_gzip_predictions_vary_on_accept_encoding(self):
+        import gzip
+        from StringIO import StringIO
+        from django.core.files.base import ContentFile
+        data = Data.objects.get(name='foobar')
+        task = Task(name='task', pub_date=dt.now(), version=1, user_id=1,
+            license_id=1, is_current=True, is_public=True, data=data,
+            type='Binary Classification', performance_measure='Accuracy')
+        task.save()
+        method = Method(name='method', pub_date=dt.now(), version=1,
+            user_id=1, license_id=1, is_current=True, is_public=True)
+        method.save()
+        buf = StringIO()
+        gz = gzip.GzipFile(fileobj=buf, mode='wb')
+        gz.write('1\n2\n')
+        gz.close()
+        result = Result(task=task, method=method, aggregation_score=0.5)
+        result.output_file.save('predictions.txt.gz', ContentFile(buf.getvalue()))
+        self.addCleanup(self.remove_if_exists, result.get_output_filename())
+
+        url = '/repository/method/result/predictions/%d/' % result.pk
+        r = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual('gzip', r['Content-Encoding'])
+        self.assertTrue('Accept-Encoding' in r['Vary'])
+        r = self.client.get(url)
+        self.assertFalse(r.has_header('Content-Encoding'))
+        self.assertTrue('Accept-Encoding' in r['Vary'])
+
+
+class SubmissionThrottleTest(RepositoryTest):
+    def test_daily_quota(self):
+        user = User.objects.get(username='user')
+        challenge = Challenge(name='test_challenge_quota', pub_date=dt.now(),
+            user=user, license=FixedLicense.objects.get(pk=1),
+            max_daily_submissions=2)
+        challenge.save()
+
+        SubmissionCounter.record(user, challenge)
+        SubmissionCounter.record(user, challenge)
+        self.assertRaises(SubmissionThrottled, SubmissionCounter.check, user, challenge)
+
+        counter = SubmissionCounter.objects.get(user=user, challenge=challenge)
+        self.assertEqual(2, counter.accepted)
+        self.assertEqual(1, counter.rejected)
+
+    def test_anonymous_submission_is_redirected(self):
+        from StringIO import StringIO
+        user = User.objects.get(username='user')
+        license = FixedLicense.objects.get(pk=1)
+        items = []
+        for klass, extra in ((Challenge, {}),
+                (Task, {'data': Data.objects.get(name='foobar')}), (Method, {})):
+            obj = klass(name='test_anonymous_' + klass.__name__.lower(),
+                pub_date=dt.now(), user=user, license=license, version=1,
+                is_public=True, is_current=True, **extra)
+            obj.create_slug()
+            obj.save()
+            items.append(obj)
+        challenge, task, method = items
+
+        output_file = StringIO('1\n2\n')
+        output_file.name = 'out.txt'
+        url = '/challenge/%s/submit/' % challenge.slug.text
+        r = self.client.post(url, {'task': task.pk, 'method': method.pk,
+            'output_file': output_file})
+        self.assertEqual(302, r.status_code)
+        self.assertTrue('/challenge/%s/login/' % challenge.slug.text in r['Location'])
+        self.assertEqual(0, SubmissionCounter.objects.count())
+
+    def test_burst_and_locked_bucket(self):
+        from django.core.cache import cache
+        import repository.models.submission as submission
+        if not submission.SUBMISSION_RATE:
+            self.skipTest('submission rate limit disabled')
+        user = User.objects.get(username='user')
+        key = SubmissionCounter._get_bucket_key(user)
+        cache.delete(key)
+        for i in xrange(submission.SUBMISSION_BURST):
+            SubmissionCounter._take_token(user)
+        self.assertRaises(SubmissionThrottled, SubmissionCounter._take_token, user)
+
+        cache.delete(key)
+        cache.add(key + '_lock', 1, 10)
+        tries = submission.BUCKET_LOCK_TRIES
+        submission.BUCKET_LOCK_TRIES = 1
+        try:
+            self.assertRaises(SubmissionThrottled, SubmissionCounter._take_token, user)
+        finally:
+            submission.BUCKET_LOCK_TRIES = tries
+            cache.delete(key + '_lock')
+        SubmissionCounter._take_token(user)
+
+
+class TagCloudTest(RepositoryTest):
+    def get_cloud(self, user):
+        cloud = Data.get_tag_cloud(user) or []
+        return dict([(t.name, t.count) for t in cloud])
+
+    def test_usage_follows_visibility(self):
+        from django.contrib.auth.models import AnonymousUser
+        self.assertEqual({'foobar': 1}, self.get_cloud(AnonymousUser()))
+
+        data = Data.objects.get(name='foobar')
+        data.is_public = False
+        data.save()
+        self.assertEqual({}, self.get_cloud(AnonymousUser()))
+        self.assertEqual({'foobar': 1}, self.get_cloud(data.user))
+
+        data.is_public = True
+        data.tags = 'foobar baz'
+        data.save()
+        self.assertEqual({'foobar': 1, 'baz': 1}, self.get_cloud(AnonymousUser()))
+
+        data.is_current = False
+        data.save()
+        self.assertFalse(TagUsage.objects.all())
+
+    def test_current_tagged_items(self):
+        from tagging.models import Tag
+        other = Data(name='other', pub_date=dt.now(), version=1, user_id=1,
+            license_id=1, is_current=True, is_public=True, is_approved=True,
+            tags='other')
+        other.save()
+        items = Data.get_current_tagged_items(None, Tag.objects.get(name='foobar'))
+        self.assertEqual(['foobar'], [d.name for d in items])
+
+
+class SearchIndexTest(RepositoryTest):
+    def setUp(self):
+        super(SearchIndexTest, self).setUp()
+        if SearchIndex.is_available():
+            return
+        if connection.vendor == 'sqlite':
+            cursor = connection.cursor()
+            cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+            self.assertFalse(cursor.fetchone()[0],
+                'Search index missing although SQLite supports FTS5')
+        self.skipTest('full-text search is not supported by this database')
+
+    def test_search_follows_visibility(self):
+        data = Data.objects.get(name='foobar')
+        self.assertEqual([data.pk], SearchIndex.search(Data, 'foo'))
+        self.assertEqual([], SearchIndex.search(Task, 'foo'))
+
+        data.is_public = False
+        data.save()
+        self.assertEqual([], SearchIndex.search(Data, 'foo'))
+
+    def test_search_ranks_name_first(self):
+        other = Data(name='other', summary='better than foobar',
+            pub_date=dt.now(), version=1, user_id=1, license_id=1,
+            is_current=True, is_public=True, is_approved=True)
+        other.save()
+        ids = SearchIndex.search(Data, 'foobar')
+        self.assertEqual(['foobar', 'other'],
+            [d.name for d in SearchResults(Data, ids)[0:2]])
+
+    def test_hits_are_paged_in_the_database(self):
+        for i in xrange(3):
+            Data(name='other%d' % i, summary='foobar too', pub_date=dt.now(),
+                version=1, user_id=1, license_id=1, is_current=True,
+                is_public=True, is_approved=True).save()
+        ids = SearchIndex.search(Data, 'foobar')
+        hits = SearchHits(Data, 'foobar')
+        self.assertEqual(4, len(hits))
+        self.assertEqual(4, SearchResults(Data, hits).count())
+        self.assertEqual(ids[1:3], hits[1:3])
+        self.assertEqual(ids[-1], hits[-1])
+        self.assertEqual(ids, list(hits))
+        self.assertEqual(ids[2:], SearchIndex.search(Data, 'foobar', 2, 10))
+
+
+class DataShapeTest(RepositoryTest):
+    def test_facet_filters(self):
+        from django.http import QueryDict
+        lookups, params = DataShape.get_filters(
+            QueryDict('classes_min=5&classes_max=11&instances_max=1000&missing_max=x'))
+        self.assertEqual({'shape__num_classes__gte': 5,
+            'shape__num_classes__lt': 11, 'shape__num_instances__lt': 1000}, lookups)
+
+        data = Data.objects.get(name='foobar')
+        DataShape(data=data, num_instances=500, num_attributes=4,
+            num_classes=7, missing_ratio=0, num_numeric=4, num_nominal=0,
+            num_string=0).save()
+        self.assertEqual([data], list(Data.objects.filter(**lookups)))
+
+        facets = dict([(f['name'], f) for f in DataShape.get_facet_counts()])
+        self.assertEqual([0, 0, 1, 0],
+            [r['count'] for r in facets['classes']['ranges']])
+
+    def test_statistics(self):
+        import h5py, numpy, tempfile
+        from repository.models.datashape import get_statistics
+        fname = tempfile.mktemp(suffix='.h5')
+        h5 = h5py.File(fname, 'w')
+        h5.create_dataset('data/double0',
+            data=numpy.array([[1, 2, numpy.nan, 4, 5], [1, 1, 1, 1, 1]], dtype=float))
+        h5.create_dataset('data/label', data=numpy.array([1, 2, 1, 3, 2]))
+        h5.close()
+        try:
+            stats = get_statistics(fname, 5)
+        finally:
+            self.remove_if_exists(fname)
+        self.assertEqual(2, stats['num_attributes'])
+        self.assertEqual(3, stats['num_classes'])
+        self.assertAlmostEqual(0.1, stats['missing_ratio'])
+
+
+class ApiTest(RepositoryTest):
+    def test_cursor_pagination(self):
+        from django.utils import simplejson
+        other = Data(name='other', pub_date=dt.now(), version=1, user_id=1,
+            license_id=1, is_current=True, is_public=True, is_approved=True,
+            tags='foobar other')
+        other.save()
+
+        r = self.client.get('/api/v1.0/data/', {'limit': 1, 'fields': 'name,tags'})
+        page = simplejson.loads(r.content)
+        self.assertEqual([{'name': 'other', 'tags': ['foobar', 'other']}], page['data'])
+
+        r = self.client.get(page['next'])
+        page = simplejson.loads(r.content)
+        self.assertEqual(['foobar'], [d['name'] for d in page['data']])
+        self.assertEqual(None, page['next'])
+
+        r = self.client.get('/api/v1.0/search', {'filter': 'tag:other'})
+        self.assertEqual(['other'], [d['name'] for d in simplejson.loads(r.content)['data']])
+
+    def test_etag(self):
+        r = self.client.get('/api/v1.0/search', {'type': 'data'})
+        self.assertEqual(200, r.status_code)
+        r = self.client.get('/api/v1.0/search', {'type': 'data'},
+            HTTP_IF_NONE_MATCH=r['ETag'])
+        self.assertEqual(304, r.status_code)
+
+    def test_invalid_parameters(self):
+        self.assertEqual(400, self.client.get('/api/v1.0/search', {'type': 'foo'}).status_code)
+        self.assertEqual(400, self.client.get('/api/v1.0/data/', {'fields': 'foo'}).status_code)
+        self.assertEqual(400, self.client.get('/api/v1.0/data/', {'cursor': 'foo'}).status_code)
+
+
+class VersionsTest(RepositoryTest):
+    def test_versions_visibility(self):
+        from django.contrib.auth.models import AnonymousUser
+        user = User.objects.get(username='user')
+        other = User.objects.create_user('other', 'other@mldata.org', 'pass')
+        first = Data.objects.get(name='foobar')
+        second = Data(name='foobar', slug=first.slug, pub_date=dt.now(),
+            version=2, user=other, license_id=1, is_public=False,
+            is_approved=True)
+        second.save()
+
+        self.assertEqual([1], [v.version for v in first.get_versions(AnonymousUser())])
+        self.assertEqual([1], [v.version for v in first.get_versions(user)])
+        self.assertEqual([1, 2], [v.version for v in first.get_versions(other)])
+
+
+class ItemCounterTest(RepositoryTest):
+    def test_counts_are_flushed(self):
+        from django.core.cache import cache
+        import repository.models.counter as counter
+        if not counter.COUNTER_FLUSH_INTERVAL:
+            return
+        ItemCounter.flush() # counts left by other tests
+        cache.set(counter.FLUSH_KEY, 1, 60) # no flush during the test
+        self.addCleanup(cache.delete, counter.FLUSH_KEY)
+        data = Data.objects.get(name='foobar')
+        hits, downloads = data.hits, data.downloads
+        ItemCounter.record(data.slug_id, 'hits')
+        ItemCounter.record(data.slug_id, 'hits')
+        ItemCounter.record(data.slug_id, 'downloads')
+        self.assertEqual(hits, Data.objects.get(pk=data.pk).hits)
+        self.assertEqual(hits + 3, data.update_current_hits().hits)
+
+        self.assertEqual(1, ItemCounter.flush())
+        data = Data.objects.get(pk=data.pk)
+        self.assertEqual(hits + 3, data.hits)
+        self.assertEqual(downloads + 1, data.downloads)
+        self.assertEqual(0, ItemCounter.flush())
+
+        # counted again after the flush
+        ItemCounter.record(data.slug_id, 'hits')
+        self.assertEqual(1, ItemCounter.flush())
+        self.assertEqual(hits + 4, Data.objects.get(pk=data.pk).hits)
+
+        # a slot counted but set only after the flush read the slots
+        ItemCounter.record(data.slug_id, 'hits')
+        ItemCounter.flush()
+        cache.incr(counter.DIRTY_COUNT_KEY)
+        ItemCounter.flush()
+        cache.add(counter.DIRTY_KEY % data.slug_id, 1)
+        cache.incr(ItemCounter._get_key(data.slug_id, 'hits', counter.HITS_FORMAT))
+        cache.set(counter.DIRTY_SLOT_KEY % cache.get(counter.DIRTY_COUNT_KEY), data.slug_id)
+        self.assertEqual(1, ItemCounter.flush())
+        self.assertEqual(hits + 6, Data.objects.get(pk=data.pk).hits)
+
+    def test_daily_statistics(self):
+        from datetime import date
+        ItemCounter.flush() # counts left by other tests
+        ItemStatistics.objects.all().delete()
+        data = Data.objects.get(name='foobar')
+        ItemCounter.record(data.slug_id, 'hits')
+        ItemCounter.record(data.slug_id, 'downloads', 'csv')
+        ItemCounter.record(data.slug_id, 'downloads', 'csv')
+        ItemCounter.record(data.slug_id, 'downloads', 'matlab')
+        ItemCounter.flush()
+
+        stats = ItemStatistics.objects.filter(slug=data.slug_id, day=date.today())
+        self.assertEqual({'': (1, 0), 'csv': (0, 2), 'matlab': (0, 1)},
+            dict([(s.format, (s.hits, s.downloads)) for s in stats]))
+        self.assertEqual((date.today(), 1, 3), ItemStatistics.get_daily(7, data.slug_id)[-1])
+        self.assertEqual([('csv', 2), ('matlab', 1)], ItemStatistics.get_formats(7))
+
+
+class RatingTest(RepositoryTest):
+    def rate(self, user, data, interest, doc):
+        r, created = DataRating.get_or_create_for(user, data)
+        r.update(interest, doc, created)
+
+    def test_running_aggregates(self):
+        user = User.objects.get(username='user')
+        other = User.objects.create_user('other', 'other@mldata.org', 'pass')
+        data = Data.objects.get(name='foobar')
+
+        self.rate(user, data, 4, 2)
+        self.rate(other, data, 1, 5)
+        self.rate(user, data, 5, 3)
+        rated = Data.objects.get(pk=data.pk)
+        self.assertEqual(data.pub_date, rated.pub_date)
+        self.assertEqual(2, rated.rating_votes)
+        self.assertEqual((6, 8), (rated.rating_sum_interest, rated.rating_sum_doc))
+        self.assertAlmostEqual(3.0, rated.rating_avg_interest)
+        self.assertAlmostEqual(4.0, rated.rating_avg_doc)
+        self.assertAlmostEqual(3.5, rated.rating_avg)
+
+        self.assertEqual(0, DataRating.repair())
+        Repository.objects.filter(pk=data.pk).update(rating_votes=5, rating_avg=0)
+        self.assertEqual(1, DataRating.repair())
+        self.assertAlmostEqual(3.5, Data.objects.get(pk=data.pk).rating_avg)
+
+    def test_rating_without_current_version(self):
+        data = Data.objects.get(name='foobar')
+        Repository.objects.filter(pk=data.pk).update(is_current=False)
+        self.do_login()
+        r = self.client.post('/repository/data/rate/%d/' % data.pk,
+            {'interest': 3, 'doc': 3})
+        self.assertEqual(404, r.status_code)
+        self.assertEqual(0, DataRating.objects.count())
+
+    def test_ratings_move_with_version_switch(self):
+        user = User.objects.get(username='user')
+        other = User.objects.create_user('other', 'other@mldata.org', 'pass')
+        first = Data.objects.get(name='foobar')
+        self.rate(user, first, 4, 2)
+        self.rate(other, first, 2, 2)
+
+        second = Data(name='foobar', slug=first.slug, pub_date=dt.now(),
+            version=2, user_id=1, license_id=1, is_public=True,
+            is_approved=True)
+        second.save()
+        second = Data.set_current(second)
+        self.assertEqual(2, DataRating.objects.filter(repository=second).count())
+
+        self.rate(other, second, 4, 4)
+        rated = Data.objects.get(pk=second.pk)
+        self.assertEqual(2, rated.rating_votes)
+        self.assertEqual((8, 6), (rated.rating_sum_interest, rated.rating_sum_doc))
+        self.assertEqual(0, DataRating.repair())
+
+        # a rating left on an old version is moved, not counted again
+        DataRating.objects.filter(user=other).update(repository=first.pk)
+        self.rate(other, second, 2, 2)
+        rated = Data.objects.get(pk=second.pk)
+        self.assertEqual((2, 6, 4), (rated.rating_votes,
+            rated.rating_sum_interest, rated.rating_sum_doc))
+        self.assertEqual(0, DataRating.repair())
+
+
+class SetCurrentTest(RepositoryTest):
+    def add_version(self, first, version):
+        data = Data(name='foobar', slug=first.slug, pub_date=dt.now(),
+            version=version, user_id=1, license_id=1, is_public=True,
+            is_approved=True, tags='foobar')
+        data.save()
+        return data
+
+    def test_switch_version(self):
+        first = Data.objects.get(name='foobar')
+        r, created = DataRating.objects.get_or_create(user_id=1, repository=first)
+        r.update(4, 2, created)
+        Repository.objects.filter(pk=first.pk).update(hits=7, downloads=3)
+        pub_date = Data.objects.get(pk=first.pk).pub_date
+
+        for version in (2, 3):
+            cur = self.add_version(first, version)
+            ignored, queries = self.get_queries(Data.set_current, cur)
+            self.assertLess(len(queries), 15, "More than 15 queries executed to switch versions")
+
+        self.assertEqual([3], [d.version for d in Data.objects.filter(is_current=True)])
+        cur = Data.objects.get(is_current=True)
+        self.assertEqual((7, 3, 1, 4), (cur.hits, cur.downloads, cur.rating_votes, cur.rating_sum_interest))
+        self.assertEqual(cur.pk, DataRating.objects.get(pk=r.pk).repository_id)
+        self.assertEqual(pub_date, Data.objects.get(pk=first.pk).pub_date)
+        self.assertEqual({'foobar': 1}, dict([(t.name, t.count) for t in TagUsage.get_public_tags(Data)]))
+
+        cur.is_deleted = True
+        cur.save(silent_update=True)
+        # counted after the deleted version was loaded
+        from django.db.models import F
+        Repository.objects.filter(pk=cur.pk).update(hits=F('hits') + 5)
+        self.assertEqual(2, Data.set_current(cur).version)
+        self.assertEqual([2], [d.version for d in Data.objects.filter(is_current=True)])
+        self.assertEqual(12, Data.objects.get(is_current=True).hits)
+
+
+class QueryPlanTest(TransactionTestCase):
+    """Reading a plan commits the transaction, see get_full_scans."""
+
+    def assertNoFullScan(self, queryset):
+        from repository.models.indexes import get_full_scans
+        self.assertEqual([], get_full_scans(queryset), 'Full table scan in %s' % queryset.query)
+
+    # MySQL scans tiny tables anyway
+    @unittest.skipUnless(connection.vendor == 'sqlite', 'query plans are checked on SQLite')
+    def test_hot_queries_use_indexes(self):
+        self.assertNoFullScan(Data.objects.filter(slug__text='foobar',
+            is_deleted=False, is_current=True))
+        self.assertNoFullScan(Data.objects.filter(slug__text='foobar',
+            is_deleted=False, version=1))
+        self.assertNoFullScan(Data.objects.filter(is_deleted=False,
+            is_current=True, is_public=True, is_approved=True).order_by('-pub_date')[:10])
+        self.assertNoFullScan(Result.objects.filter(method=1, task=1, challenge=None))
+        self.assertNoFullScan(Result.objects.filter(challenge=1, task=1))
+
+
+class InstrumentationTest(RepositoryTest):
+    def test_stats_header(self):
+        import re
+        import repository.middleware as middleware
+        rate, header = middleware.INSTRUMENTATION_SAMPLE_RATE, middleware.INSTRUMENTATION_HEADER
+        middleware.INSTRUMENTATION_SAMPLE_RATE = 1
+        middleware.INSTRUMENTATION_HEADER = True
+        self.attach_file(Data.objects.get(name='foobar'))
+        try:
+            r = self.client.get('/repository/data/viewslug/foobar/')
+        finally:
+            middleware.INSTRUMENTATION_SAMPLE_RATE, middleware.INSTRUMENTATION_HEADER = rate, header
+        stats = r[middleware.HEADER]
+        self.assertTrue(re.match(r'queries=\d+ db=[\d.]+ms h5=\d+ cache=\d+/\d+ render=[\d.]+ms total=[\d.]+ms$', stats), stats)
+        self.assertNotEqual('0', re.search(r'queries=(\d+)', stats).group(1))
+
+        middleware.INSTRUMENTATION_SAMPLE_RATE = 0
+        try:
+            r = self.client.get('/repository/data/viewslug/foobar/')
+        finally:
+            middleware.INSTRUMENTATION_SAMPLE_RATE = rate
+        self.assertFalse(r.has_header(middleware.HEADER))
+
+
+class PermissionTest(RepositoryTest):
+    def test_checks_query_once(self):
+        user = User.objects.get(username='user')
+        data = Data.objects.get(name='foobar')
+
+        def check():
+            self.assertTrue(data.can_edit(user))
+            self.assertFalse(data.can_activate(user))
+            self.assertTrue(data.can_delete(user))
+            self.assertFalse(data.dependent_entries_exist())
+        ignored, queries = self.get_queries(check)
+        self.assertEqual(1, len(queries))
+
+
+class ListingQueriesTest(RepositoryTest):
+    def count_queries(self, url):
+        from django.core.cache import cache
+        cache.clear() # cached counts and tag clouds
+        return self.get_page_queries(url)[1]
+
+    def add_data(self, num):
+        for i in xrange(num):
+            Data(name='foobar%d' % i, pub_date=dt.now(), version=1,
+                user_id=1, license_id=1, is_current=True, is_public=True,
+                is_approved=True, tags='foobar').save()
+
+    def test_item_listings(self):
+        urls = ['/repository/data/', '/repository/tags/data/foobar/',
+            '/repository/search/?searchterm=foobar&data=1']
+        for url in urls:
+            self.client.get(url) # content types are cached per process
+        before = [self.count_queries(url) for url in urls]
+        self.add_data(5)
+        after = [self.count_queries(url) for url in urls]
+        self.assertEqual(before, after, 'Queries per listed item on %s' % urls)
+
+    def test_result_listing(self):
+        data = Data.objects.get(name='foobar')
+        task = Task(name='task', pub_date=dt.now(), version=1, user_id=1,
+            license_id=1, is_current=True, is_public=True, data=data,
+            type='Binary Classification', performance_measure='Accuracy')
+        task.save()
+        method = Method(name='method', pub_date=dt.now(), version=1,
+            user_id=1, license_id=1, is_current=True, is_public=True)
+        method.save()
+
+        url = '/repository/method/view/%d/' % method.pk
+        Result(task=task, method=method, aggregation_score=0.5).save()
+        self.client.get(url)
+        before = self.count_queries(url)
+        for i in xrange(5):
+            Result(task=task, method=method, aggregation_score=0.5).save()
+        self.assertEqual(before, self.count_queries(url))
+
+
+class RecentFeedTest(RepositoryTest):
+    def test_public_feed_is_cached(self):
+        from django.contrib.auth.models import AnonymousUser
+        RecentFeed.invalidate()
+        anonymous = AnonymousUser()
+        first = RecentFeed.get(anonymous)
+        self.assertEqual(['foobar'], [e['name'] for e in first])
+
+        recent, queries = self.get_queries(RecentFeed.get, anonymous)
+        self.assertEqual(0, len(queries))
+        self.assertEqual(first, recent)
+
+        Data(name='private', pub_date=dt.now(), version=1, user_id=1,
+            license_id=1, is_current=True, is_public=False,
+            is_approved=True).save()
+        user = User.objects.get(username='user')
+        self.assertEqual(['private', 'foobar'], [e['name'] for e in RecentFeed.get(user)])
+        self.assertEqual(['foobar'], [e['name'] for e in RecentFeed.get(anonymous)])
+
+        data = Data.objects.get(name='private')
+        data.is_public = True
+        data.save()
+        self.assertEqual(['private', 'foobar'], [e['name'] for e in RecentFeed.get(anonymous)])
+
+
+class PageCacheTest(RepositoryTest):
+    def test_anonymous_pages_are_cached(self):
+        from django.core.cache import cache
+        import repository.models.counter as counter
+        import repository.models.pagecache as pagecache
+        if not pagecache.PAGE_CACHE_TIMEOUT or not counter.COUNTER_FLUSH_INTERVAL:
+            self.skipTest('page cache or buffered counters disabled')
+        cache.set(counter.FLUSH_KEY, 1, 60) # no flush during the test
+        self.addCleanup(cache.delete, counter.FLUSH_KEY)
+        url = '/repository/data/viewslug/foobar/'
+        data = Data.objects.get(name='foobar')
+        self.attach_file(data)
+        self.client.get(url)
+        hits = ItemCounter.get_pending(data.slug_id)['hits']
+        r, queries = self.get_page_queries(url)
+        self.assertEqual(0, queries)
+        self.assertEqual(hits + 1, ItemCounter.get_pending(data.slug_id)['hits'])
+
+        data.summary = 'changed summary'
+        data.save()
+        r, queries = self.get_page_queries(url)
+        self.assertNotEqual(0, queries)
+        self.assertContains(r, 'changed summary')
+
+        self.client.get('/repository/data/')
+        r, queries = self.get_page_queries('/repository/data/')
+        self.assertEqual(0, queries)
+
+        self.do_login()
+        r, queries = self.get_page_queries('/repository/data/')
+        self.assertNotEqual(0, queries)
+
+
+class FragmentCacheTest(RepositoryTest):
+    def test_item_fragments_are_cached(self):
+        self.do_login()
+        self.attach_file(Data.objects.get(name='foobar'))
+        url = '/repository/data/viewslug/foobar/'
+        r, first = self.get_page_queries(url)
+        r, second = self.get_page_queries(url)
+        self.assertLess(second, first)
+        self.assertNotContains(r, 'revision 2')
+
+        data = Data.objects.get(name='foobar')
+        Data(name='foobar', slug=data.slug, pub_date=dt.now(), version=2,
+            user_id=1, license_id=1, is_public=True, is_approved=True,
+            tags='foobar').save()
+        r, third = self.get_page_queries(url)
+        self.assertContains(r, 'revision 2')
+
+
+class BulkImportTest(RepositoryTest):
+    def test_import_reports_each_item(self):
+        from utils.slurper.bulk import BulkImport
+        fixture = 'fixtures/breastcancer-small.txt'
+        manifest = [
+            {'name': 'bulk one', 'file': fixture, 'format': 'libsvm',
+                'tags': ['bulk', 'libsvm'], 'publications': ['Some paper']},
+            {'name': 'bulk two', 'file': fixture, 'format': 'libsvm',
+                'publications': ['Some paper']},
+            {'name': 'Bulk One', 'file': fixture},
+            {'name': 'foobar', 'file': fixture},
+            {'name': 'missing', 'file': 'fixtures/does-not-exist'},
+        ]
+        report = BulkImport(processes=1, batch_size=1).run(manifest)
+        self.assertEqual(['bulk-one', 'bulk-two', None, None, None],
+            [r['slug'] for r in report])
+        self.assertEqual([False, False, True, True, True],
+            [bool(r['error']) for r in report])
+
+        data = Data.objects.get(slug__text='bulk-one')
+        self.assertTrue(data.is_public)
+        self.assertTrue(data.has_h5())
+        self.assertEqual(1, Publication.objects.filter(content='Some paper').count())
+        self.assertEqual(['Some paper'], [p.content for p in
+            Data.objects.get(slug__text='bulk-two').publications.all()])
+        for r in report[:2]:
+            data = Data.objects.get(pk=r['id'])
+            self.remove_if_exists(data.get_data_filename())
+            self.remove_if_exists(os.path.join(MEDIA_ROOT, DATAPATH, r['slug'] + '.libsvm'))
+
+    def test_failed_item_leaves_no_rows(self):
+        from utils.slurper.bulk import BulkImport
+        class BrokenImport(BulkImport):
+            def _get_publication(self, content):
+                raise ValueError('broken publication')
+
+        manifest = [{'name': 'bulk broken', 'file': 'fixtures/breastcancer-small.txt',
+            'format': 'libsvm', 'tags': ['bulk'], 'publications': ['Some paper']}]
+        report = BrokenImport(processes=1).run(manifest)
+        self.assertEqual('broken publication', report[0]['error'])
+        self.assertFalse(Slug.objects.filter(text='bulk-broken').exists())
+        self.assertFalse(Data.objects.filter(name='bulk broken').exists())
+        self.assertFalse(os.path.isfile(os.path.join(MEDIA_ROOT, DATAPATH, 'bulk-broken.libsvm')))
+
+
+class DownloaderTest(TestCase):
+    content = ''.join([chr(i % 256) for i in xrange(100000)])
+
+    def setUp(self):
+        import tempfile, threading
+        from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+        test = self
+        self.requests = []
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                test.requests.append((self.path, self.headers.getheader('Range')))
+                if self.path == '/missing':
+                    self.send_error(404)
+                    return
+                start = 0
+                if self.headers.getheader('Range'):
+                    start = int(self.headers.getheader('Range')[6:-1])
+                    if start >= len(test.content):
+                        self.send_response(416)
+                        self.send_header('Content-Range', 'bytes */%d' % len(test.content))
+                        self.end_headers()
+                        return
+                    self.send_response(206)
+                else:
+                    self.send_response(200)
+                self.send_header('Content-Length', str(len(test.content) - start))
+                self.end_headers()
+                self.wfile.write(test.content[start:])
+
+            def log_message(self, *args):
+                pass
+
+        self.server = HTTPServer(('127.0.0.1', 0), Handler)
+        self.url = 'http://127.0.0.1:%d/' % self.server.server_port
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.setDaemon(True)
+        thread.start()
+        self.output = tempfile.mkdtemp()
+
+    def tearDown(self):
+        import shutil
+        self.server.shutdown()
+        shutil.rmtree(self.output)
+
+    def test_downloads_are_resumed_and_recorded(self):
+        import hashlib
+        from utils.slurper.download import Downloader, MANIFEST, PART
+        files = [(self.url + n, os.path.join(self.output, 'sub', n))
+            for n in ('a', 'b', 'c', 'missing')]
+        os.makedirs(os.path.join(self.output, 'sub'))
+        part = open(files[0][1] + PART, 'wb')
+        part.write(self.content[:1000])
+        part.close()
+
+        downloader = Downloader(self.output, threads=3, retries=0)
+        errors = downloader.fetch_all(files)
+        self.assertEqual([files[3][1]], errors.keys())
+        self.assertTrue(('/a', 'bytes=1000-') in self.requests)
+        for src, dst in files[:3]:
+            self.assertEqual(self.content, open(dst, 'rb').read())
+            self.assertFalse(os.path.exists(dst + PART))
+        self.assertTrue(os.path.exists(os.path.join(self.output, MANIFEST)))
+
+        # a new run only tries what's missing
+        self.requests = []
+        downloader = Downloader(self.output, retries=0)
+        self.assertEqual(hashlib.sha1(self.content).hexdigest(),
+            downloader.manifest[os.path.join('sub', 'b')]['sha1'])
+        downloader.fetch_all(files)
+        self.assertEqual([('/missing', None)], self.requests)
+
+    def test_files_without_manifest_entry_are_resumed(self):
+        from utils.slurper.download import Downloader, PART
+        files = [(self.url + n, os.path.join(self.output, n)) for n in ('a', 'b')]
+        for (src, dst), size in zip(files, (500, len(self.content))):
+            f = open(dst, 'wb')
+            f.write(self.content[:size])
+            f.close()
+
+        downloader = Downloader(self.output, retries=0)
+        self.assertEqual({}, downloader.fetch_all(files))
+        self.assertEqual([('/a', 'bytes=500-'), ('/b', 'bytes=%d-' % len(self.content))],
+            sorted(self.requests))
+        for src, dst in files:
+            self.assertEqual(self.content, open(dst, 'rb').read())
+            self.assertFalse(os.path.exists(dst + PART))
+            self.assertTrue(downloader.is_complete(dst))
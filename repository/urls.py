@@ -11,6 +11,7 @@ import repository.views.method
 import repository.views.challenge
 import repository.views.ajax
 import repository.views.publication
+import repository.views.statistics
 import repository.forms as forms
 
 urlpatterns = patterns('',
@@ -36,6 +37,11 @@ urlpatterns = patterns('',
     url(r'^publication/edit/$', views.publication.edit, name='publication_edit'),
     url(r'^publication/get/(?P<id>\d+)/$', views.publication.get, name='publication_get'),
 
+    # views and downloads over time
+    url(r'^statistics/$', views.statistics.index, name='statistics_index'),
+    url(r'^statistics/plot/$', views.statistics.plot, name='statistics_plot'),
+    url(r'^statistics/plot/(?P<slug>[A-Za-z0-9-_]+)/$', views.statistics.plot, name='statistics_plot_slug'),
+
     # upload progress AJAX
     (r'^upload_progress/$', views.ajax.upload_progress),
 )
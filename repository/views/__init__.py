@@ -5,3 +5,4 @@
 # data, task, method, publication - views for the actual models
 # ajax - ajaxy stuff
 # publication - publications
+# statistics - views and downloads over time
@@ -0,0 +1,292 @@
+"""
+JSON API to list and search repository items.
+
+Items are returned newest first and paginated by a cursor on
+(pub_date, id) instead of page numbers, so walking through all items
+neither counts the table nor skips over OFFSET rows.
+"""
+
+import base64
+import datetime
+import hashlib
+
+from django.core.urlresolvers import reverse
+from django.db.models import Q
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils import simplejson
+from tagging.models import Tag, TaggedItem
+from tagging.utils import parse_tag_input
+
+from repository.models import Data, Task, Method, Challenge, DataShape
+from repository.models import SearchIndex
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 500
+CACHE_MAX_AGE = 300
+
+KLASSES = {
+    'data': Data,
+    'task': Task,
+    'method': Method,
+    'challenge': Challenge,
+}
+
+# field name in API -> lookup for QuerySet.values
+FIELDS = {
+    'id': 'id',
+    'name': 'name',
+    'slug': 'slug__text',
+    'version': 'version',
+    'author': 'user__username',
+    'date': 'pub_date',
+    'summary': 'summary',
+    'license': 'license__name',
+    'rating': 'rating_avg',
+    'votes': 'rating_votes',
+    'views': 'hits',
+    'downloads': 'downloads',
+    'tags': 'tags',
+}
+KLASS_FIELDS = {
+    'data': {
+        'format': 'format',
+        'instances': 'num_instances',
+        'attributes': 'num_attributes',
+    },
+    'task': {
+        'type': 'type',
+        'performance_measure': 'performance_measure',
+        'data': 'data__slug__text',
+    },
+    'method': {},
+    'challenge': {
+        'track': 'track',
+    },
+}
+# filter name -> lookup
+FILTERS = {
+    'user': 'user__username',
+    'license': 'license__name',
+}
+KLASS_FILTERS = {
+    'data': {'format': 'format'},
+    'task': {'type': 'type'},
+    'method': {},
+    'challenge': {'track': 'track'},
+}
+
+
+class ApiError(Exception):
+    """Error in the parameters of an API request."""
+    pass
+
+
+def _error(msg, status=400):
+    response = HttpResponse(simplejson.dumps({'error': msg}),
+        mimetype='application/json')
+    response.status_code = status
+    return response
+
+
+def encode_cursor(pub_date, id):
+    """Encode the position after given item.
+
+    @param pub_date: publication date of the item
+    @type pub_date: datetime.datetime
+    @param id: id of the item
+    @type id: integer
+    @return: cursor
+    @rtype: string
+    """
+    return base64.urlsafe_b64encode('%s|%d' % (pub_date.isoformat(), id))
+
+
+def decode_cursor(cursor):
+    """Decode a cursor made by encode_cursor.
+
+    @param cursor: cursor
+    @type cursor: string
+    @return: publication date and id
+    @rtype: tuple of datetime.datetime and integer
+    @raise ApiError: if the cursor is invalid
+    """
+    try:
+        date, id = base64.urlsafe_b64decode(str(cursor)).split('|')
+        if '.' in date:
+            date = datetime.datetime.strptime(date, '%Y-%m-%dT%H:%M:%S.%f')
+        else:
+            date = datetime.datetime.strptime(date, '%Y-%m-%dT%H:%M:%S')
+        return date, int(id)
+    except (TypeError, ValueError):
+        raise ApiError('Invalid cursor')
+
+
+def get_fields(kname, param):
+    """Get fields to return.
+
+    @param kname: name of item class, e.g. data
+    @type kname: string
+    @param param: comma separated field names, all if empty
+    @type param: string
+    @return: mapping of field names to lookups
+    @rtype: dict
+    @raise ApiError: if a field is unknown
+    """
+    available = dict(FIELDS)
+    available.update(KLASS_FIELDS[kname])
+    available['url'] = None
+    if not param:
+        return available
+
+    fields = {}
+    for name in param.split(','):
+        name = name.strip()
+        if name not in available:
+            raise ApiError('Unknown field %s, available are: %s' %
+                (name, ', '.join(sorted(available.keys()))))
+        fields[name] = available[name]
+    return fields
+
+
+def get_queryset(kname, params):
+    """Get public current items matching the request's query and filters.
+
+    @param kname: name of item class, e.g. data
+    @type kname: string
+    @param params: request parameters
+    @type params: QueryDict
+    @return: matching items
+    @rtype: QuerySet
+    @raise ApiError: if a filter is invalid
+    """
+    klass = KLASSES[kname]
+    objects = klass.objects.filter(is_public=True, is_current=True, is_deleted=False)
+    if klass == Data:
+        lookups, valid = DataShape.get_filters(params)
+        objects = objects.filter(is_approved=True, **lookups)
+
+    q = params.get('q')
+    if q:
+        if SearchIndex.is_available():
+            objects = objects.filter(id__in=SearchIndex.search(klass, q))
+        else:
+            objects = objects.filter(Q(name__icontains=q) | Q(summary__icontains=q))
+
+    available = dict(FILTERS)
+    available.update(KLASS_FILTERS[kname])
+    for f in params.getlist('filter'):
+        try:
+            name, value = f.split(':', 1)
+        except ValueError:
+            raise ApiError('Filters must look like name:value')
+        if name == 'tag':
+            try:
+                tag = Tag.objects.get(name=value)
+            except Tag.DoesNotExist:
+                return objects.none()
+            objects = TaggedItem.objects.get_by_model(objects, tag)
+        elif name in available:
+            objects = objects.filter(**{available[name]: value})
+        else:
+            raise ApiError('Unknown filter %s, available are: tag, %s' %
+                (name, ', '.join(sorted(available.keys()))))
+    return objects
+
+
+def serialize(kname, row, fields, request):
+    """Make an item's values ready for JSON.
+
+    @param kname: name of item class, e.g. data
+    @type kname: string
+    @param row: values of the item
+    @type row: dict
+    @param fields: mapping of field names to lookups
+    @type fields: dict
+    @param request: request data
+    @type request: Django request
+    @return: item
+    @rtype: dict
+    """
+    item = {}
+    for name, lookup in fields.iteritems():
+        if name == 'url':
+            value = request.build_absolute_uri(
+                reverse(kname + '_view_slug', args=[row['slug__text']]))
+        else:
+            value = row[lookup]
+        if name == 'date':
+            value = value.isoformat()
+        elif name == 'tags':
+            value = parse_tag_input(value or '')
+        elif name == 'rating' and value < 0:
+            value = None
+        item[name] = value
+    return item
+
+
+def search(request, kname=None):
+    """List or search items of one class.
+
+    Parameters:
+      - type: data, task, method or challenge, if not given by the url
+      - q: search term
+      - filter: name:value, may be repeated, e.g. tag:uci or user:mldata
+      - <facet>_min, <facet>_max: shape of Data, see DataShape.get_filters
+      - fields: comma separated fields to return
+      - limit: number of items to return
+      - cursor: continue after the position returned as next
+
+    @param request: request data
+    @type request: Django request
+    @param kname: name of item class, e.g. data
+    @type kname: string
+    @return: JSON response with items and URL of the next page
+    @rtype: Django response
+    """
+    params = request.GET
+    if not kname:
+        kname = params.get('type', 'data')
+    if kname not in KLASSES:
+        return _error('Unknown type %s' % kname)
+
+    try:
+        limit = int(params.get('limit', DEFAULT_LIMIT))
+    except ValueError:
+        return _error('Invalid limit')
+    limit = max(1, min(limit, MAX_LIMIT))
+
+    try:
+        fields = get_fields(kname, params.get('fields'))
+        objects = get_queryset(kname, params)
+        if params.get('cursor'):
+            date, id = decode_cursor(params['cursor'])
+            objects = objects.filter(Q(pub_date__lt=date) |
+                Q(pub_date=date, id__lt=id))
+    except ApiError, e:
+        return _error(str(e))
+
+    lookups = set([l for l in fields.values() if l])
+    lookups.update(['id', 'pub_date', 'slug__text'])
+    rows = list(objects.order_by('-pub_date', '-id').values(*lookups)[:limit + 1])
+
+    next = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        query = params.copy()
+        query['cursor'] = encode_cursor(rows[-1]['pub_date'], rows[-1]['id'])
+        next = request.build_absolute_uri(request.path + '?' + query.urlencode())
+
+    body = simplejson.dumps({
+        'type': kname,
+        'data': [serialize(kname, row, fields, request) for row in rows],
+        'next': next,
+    })
+
+    etag = '"%s"' % hashlib.md5(body).hexdigest()
+    if request.META.get('HTTP_IF_NONE_MATCH') == etag:
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(body, mimetype='application/json')
+    response['ETag'] = etag
+    response['Cache-Control'] = 'public, max-age=%d' % CACHE_MAX_AGE
+    return response
@@ -5,6 +5,7 @@ import os
 import uuid
 import cPickle as pickle
 import time
+import urllib
 
 from django.template import RequestContext
 from django.core import serializers
@@ -39,14 +40,19 @@ import ml2h5.task
 from preferences.models import Preferences
 from repository.forms import *
 from repository.models import *
-from repository.views.util import get_versions_paginator, get_page, get_per_page
-from repository.views.util import get_tag_clouds, sendfile
+from repository.views.util import get_versions_paginator, get_page, get_per_page, get_count
+from repository.views.util import get_listing_page, select_listing_related
+from repository.views.util import get_tag_clouds, sendfile, cache_anonymous_page
+from repository.views.util import LazyValue
 from settings import DATAPATH, CACHE_ROOT, MEDIA_ROOT
 from tagging.models import Tag
+from utils.compression import compress
 
 MEGABYTE = 1048576
 
 DOWNLOAD_WARNING_LIMIT = 30000 # 30k is this a good margin?
+# foreign keys shown per Result on the item pages
+RESULT_RELATED = ('task__slug', 'method__user', 'method__slug')
 
 # Data-upload helper functions
 def _validate_file_size(request, form, klass):
@@ -89,19 +95,39 @@ def _response_for(request, klass, name, info_dict):
     return render_to_response(klass.__name__.lower() + '/' + name + '.html', info_dict,
             context_instance=RequestContext(request))
 
+def throttled_response(response, form):
+    """Mark response as throttled if the submission in form was throttled."""
+    if form and form.retry_after:
+        response.status_code = 429
+        response['Retry-After'] = str(form.retry_after)
+    return response
+
 def handle_result_form(request):
     if request.method == 'POST':
         form = ResultForm(request.POST, request.FILES, request=request)
         form.added = False
+        form.retry_after = None
+
+        # set by ResultUploadHandler while the file was uploaded
+        if hasattr(request, 'result_upload_error'):
+            form.errors['output_file'] = ErrorDict({'': request.result_upload_error}).as_ul()
 
         if form.is_valid():
             new = form.save(commit=False)
+            try:
+                SubmissionCounter.check(request.user, new.challenge)
+            except SubmissionThrottled, e:
+                form.errors['output_file'] = ErrorDict({'': e.message}).as_ul()
+                form.retry_after = e.retry_after
+                return form
+
             r=Result.objects.filter(method=new.method, task=new.task, challenge=new.challenge)
             if r.count():
                 new=r[0]
 
             new.aggregation_score=-1
-            new.output_file = request.FILES['output_file']
+            output_file = request.FILES['output_file']
+            new.output_file = output_file
             score, msg, ok = new.predict()
             try:
                 new.aggregation_score=score[0]
@@ -111,13 +137,16 @@ def handle_result_form(request):
                 new.aggregation_score=score
 
             if ok:
+                new.output_file = compress(output_file)
                 new.save()
+                SubmissionCounter.record(request.user, new.challenge)
                 form.added = True
             else:
                 form.errors['output_file'] = ErrorDict({'': msg}).as_ul()
     else:
         form = ResultForm(request=request)
         form.added = False
+        form.retry_after = None
         
     return form
 
@@ -147,7 +176,6 @@ def activate(request, klass, id):
     obj.is_public = True
     obj.save()
     obj.current=klass.set_current(obj)
-    obj.save()
 
     return HttpResponseRedirect(obj.get_absolute_slugurl())
 
@@ -256,9 +284,15 @@ def download(request, klass, slug, type='plain'):
 
     response = sendfile(fileobj, ctype)
     _download_cleanup(fname_export)
-    obj.increase_downloads()
+    obj.increase_downloads(type)
     return response
 
+def _get_item_page(request, objects):
+    """Get paginator of the items listed on an item's page, e.g. its results."""
+    count = objects.count()
+    return get_page(request, objects, get_per_page(count), count)
+
+@cache_anonymous_page
 @transaction.commit_on_success
 def view(request, klass, slug_or_id, version=None):
     """View item given by slug and klass.
@@ -280,11 +314,13 @@ def view(request, klass, slug_or_id, version=None):
         return HttpResponseForbidden()
     if not obj.check_is_approved():
         return HttpResponseRedirect(reverse(kname + '_review', args=[obj.slug]))
+    if obj.is_public and obj.is_current:
+        PageCache.allow(request, obj.slug_id)
 
     current = obj.update_current_hits()
 
     # need tags in list
-    versions = get_versions_paginator(request, obj)
+    versions = LazyValue(get_versions_paginator, request, obj)
     info_dict = {
         'object': obj,
         'request': request,
@@ -306,10 +342,8 @@ def view(request, klass, slug_or_id, version=None):
         info_dict['show_comments'] = True
 
     if klass == Data:
-        tasks=obj.get_related_tasks(request.user)
-        PER_PAGE = get_per_page(tasks.count())
-        info_dict['page']=get_page(request, tasks, PER_PAGE)
-        info_dict['per_page']=PER_PAGE
+        tasks=obj.get_related_tasks(request.user).select_related('slug')
+        info_dict['page']=LazyValue(_get_item_page, request, tasks)
         info_dict['related_tasks']=tasks
         info_dict['dependent_link']='#tabs-method'
     else:
@@ -319,21 +353,17 @@ def view(request, klass, slug_or_id, version=None):
 
 
         if klass == Task:
-            objects=Result.objects.filter(task=obj)
+            objects=Result.objects.filter(task=obj).select_related(*RESULT_RELATED)
             if request.user.is_authenticated():
                 form.fields['task'].queryset = obj
                 form.fields['challenge'].queryset = obj.get_challenges()
-            PER_PAGE = get_per_page(objects.count())
-            info_dict['page']=get_page(request, objects, PER_PAGE)
-            info_dict['per_page']=PER_PAGE
+            info_dict['page']=LazyValue(_get_item_page, request, objects)
             info_dict['data']=obj.get_data()
             info_dict['dependent_link']='foo'
 
         elif klass == Method:
-            objects=Result.objects.filter(method=obj)
-            PER_PAGE = get_per_page(objects.count())
-            info_dict['page']=get_page(request, objects, PER_PAGE)
-            info_dict['per_page']=PER_PAGE
+            objects=Result.objects.filter(method=obj).select_related(*RESULT_RELATED)
+            info_dict['page']=LazyValue(_get_item_page, request, objects)
 
         elif klass == Challenge:
             t=obj.get_tasks()
@@ -341,16 +371,16 @@ def view(request, klass, slug_or_id, version=None):
                 form.fields['task'].queryset = t
                 form.fields['challenge'] = obj
             info_dict['tasks']=t
-            objects=Result.objects.filter(challenge=obj).order_by('task__name','aggregation_score')
-            PER_PAGE = get_per_page(objects.count())
-            info_dict['page']=get_page(request, objects, PER_PAGE)
-            info_dict['per_page']=PER_PAGE
+            objects=Result.objects.filter(challenge=obj).select_related(
+                *RESULT_RELATED).order_by('task__name','aggregation_score')
+            info_dict['page']=LazyValue(_get_item_page, request, objects)
 
 
     if hasattr(obj, 'data_heldback') and obj.data_heldback:
         info_dict['can_view_heldback'] = obj.data_heldback.can_view(request.user)
-    info_dict['extract'] = obj.get_extract()
-    return _response_for(request, klass, 'item_view', info_dict)
+    info_dict['extract'] = LazyValue(obj.get_extract)
+    response = _response_for(request, klass, 'item_view', info_dict)
+    return throttled_response(response, info_dict.get('result_form'))
 
 @transaction.commit_on_success
 def new(request, klass, default_arg=None):
@@ -500,9 +530,11 @@ def edit(request, klass, id):
                 if next.is_public or not request.FILES['file']:
                     next.format = prev.format
                     next.file = prev.file
+                    next.save()
+                    DataShape.copy(prev, next)
                 else:
                     _upload_data_file(next, request.FILES['file'])
-                next.save()
+                    next.save()
             elif klass == Task:
                 next.license = FixedLicense.objects.get(pk=1) # fixed to CC-BY-SA
                 taskinfo = {
@@ -669,6 +701,7 @@ def fork(request, klass, id):
 
     return _response_for(request, klass, 'item_new', info_dict)
 
+@cache_anonymous_page
 def index(request, klass, my=False, order_by='-pub_date', filter_type=None):
     """Index/My page for section given by klass.
 
@@ -702,17 +735,21 @@ def index(request, klass, my=False, order_by='-pub_date', filter_type=None):
         objects = objects.filter(is_current=True, is_public=True)
         unapproved = None
         my_or_archive = _('Public Archive')
+        PageCache.allow(request)
 
-    objects = objects.order_by(order_by, '-pub_date')
+    objects = select_listing_related(objects.order_by(order_by, '-pub_date'))
 
     kname=klass.__name__.lower()
-    PER_PAGE = get_per_page(objects.count())
+    count = get_count(objects, cached=not my)
+    unapproved_count = unapproved.count() if unapproved is not None else 0
+    PER_PAGE = get_per_page(count)
     info_dict = {
         'request': request,
-        kname : get_page(request, objects, PER_PAGE),
+        kname : get_listing_page(request, objects, PER_PAGE, count),
         kname + '_per_page': PER_PAGE,
         'klass' : klass.__name__,
-        'unapproved': get_page(request, unapproved, PER_PAGE) if unapproved else [],
+        'unapproved': get_listing_page(request, select_listing_related(unapproved),
+            PER_PAGE, unapproved_count) if unapproved_count else [],
         'my_or_archive': my_or_archive,
         'tagcloud': get_tag_clouds(request),
         'section': 'repository',
@@ -723,6 +760,7 @@ def index(request, klass, my=False, order_by='-pub_date', filter_type=None):
     return render_to_response('repository/item_index.html',
             info_dict, context_instance=RequestContext(request))
 
+@cache_anonymous_page
 def tags_view(request, tag, klass):
     """View all items tagged by given tag in given klass.
 
@@ -738,19 +776,22 @@ def tags_view(request, tag, klass):
     """
     try:
         tag = Tag.objects.get(name=tag)
-        objects = klass.get_current_tagged_items(request.user, tag)
-        if not objects: raise Http404
+        objects = select_listing_related(
+            klass.get_current_tagged_items(request.user, tag))
+        count = get_count(objects)
+        if not count: raise Http404
     except Tag.DoesNotExist:
         raise Http404
 
-    PER_PAGE = get_per_page(len(objects))
+    PER_PAGE = get_per_page(count)
     kname = klass.__name__.lower()
+    PageCache.allow(request)
 
     info_dict = {
         'request': request,
         'tag': tag,
         'tagcloud': get_tag_clouds(request),
-        kname : get_page(request, objects, PER_PAGE),
+        kname : get_listing_page(request, objects, PER_PAGE, count),
         'klass' : klass.__name__,
         kname + '_per_page': PER_PAGE,
         'section': 'repository',
@@ -759,6 +800,7 @@ def tags_view(request, tag, klass):
     return render_to_response('repository/item_index.html', info_dict,
             context_instance=RequestContext(request))
 
+@transaction.commit_on_success
 def rate(request, klass, id):
     """Rate an item given by id and klass.
 
@@ -782,8 +824,10 @@ def rate(request, klass, id):
     if request.method == 'POST':
         form = RatingForm(request.POST)
         if form.is_valid():
-            r, fail = rklass.objects.get_or_create(user=request.user, repository=obj)
-            r.update(form.cleaned_data['interest'], form.cleaned_data['doc'])
+            current = klass.objects.filter(slug=obj.slug_id, is_current=True)[:1]
+            if not current: raise Http404
+            r, created = rklass.get_or_create_for(request.user, current[0])
+            r.update(form.cleaned_data['interest'], form.cleaned_data['doc'], created)
 
     return HttpResponseRedirect(obj.get_absolute_slugurl())
 
@@ -814,8 +858,9 @@ def search(request):
     @return: rendered response page
     @rtype: Django response
     """
-    if request.method == 'GET' and 'searchterm' in request.GET:
-        searchterm = request.GET['searchterm']
+    facet_filters, facet_params = DataShape.get_filters(request.GET)
+    if request.method == 'GET' and ('searchterm' in request.GET or facet_params):
+        searchterm = request.GET.get('searchterm', '')
 
         classes=[]
         for c in (Data, Task, Method, Challenge):
@@ -833,21 +878,39 @@ def search(request):
         }
 
         for klass in classes:
-            objects = klass.objects.filter(is_deleted=False, is_current=True, is_public=True)
+            objects = select_listing_related(klass.objects.filter(
+                is_deleted=False, is_current=True, is_public=True))
             if klass == Data:
-                objects = objects.filter(is_approved=True)
+                objects = objects.filter(is_approved=True, **facet_filters)
+                # links to a facet keep the filters of the other facets
+                info_dict['facets'] = [dict(f, query=urllib.urlencode(
+                    [(k, v) for k, v in facet_params.iteritems()
+                        if not k.startswith(f['name'] + '_')]))
+                    for f in DataShape.get_facet_counts()]
+                info_dict['facet_query'] = urllib.urlencode(facet_params)
 
             searcherror = True
 
             if searchterm:
                 info_dict['searchterm'] = searchterm
-                objects = objects.filter(Q(name__icontains=searchterm) |
-                        Q(summary__icontains=searchterm)).order_by('-pub_date')
-                searcherror = objects.count()==0
+                if SearchIndex.is_available():
+                    if facet_filters:
+                        ids = SearchIndex.search(klass, searchterm)
+                        matching = set(objects.filter(pk__in=ids).values_list('pk', flat=True))
+                        ids = [i for i in ids if i in matching]
+                    else:
+                        ids = SearchHits(klass, searchterm)
+                    objects = SearchResults(klass, ids, objects)
+                else:
+                    objects = objects.filter(Q(name__icontains=searchterm) |
+                            Q(summary__icontains=searchterm)).order_by('-pub_date')
+            count = get_count(objects)
+            if searchterm or facet_params:
+                searcherror = count==0
 
             kname=klass.__name__.lower()
-            PER_PAGE = get_per_page(objects.count())
-            info_dict[kname]=get_page(request, objects, PER_PAGE)
+            PER_PAGE = get_per_page(count)
+            info_dict[kname]=get_listing_page(request, objects, PER_PAGE, count)
             info_dict[kname + '_per_page']=PER_PAGE
             info_dict[kname + '_searcherror']=searcherror
 
@@ -5,17 +5,23 @@ from django.http import HttpResponse
 from django.http import HttpResponseForbidden
 from django.http import HttpResponseForbidden, Http404
 from django.shortcuts import get_object_or_404
+from django.core.cache import cache
 from django.core.files import File
+from django.utils.cache import patch_vary_headers
 from settings import CACHE_ROOT
 import cPickle as pickle
+from StringIO import StringIO
 
 from repository.models import *
 from repository.forms import *
 from repository.views.util import *
 import repository.views.base as base
-from repository.views.util import sendfile
+from repository.views.util import sendfile, simplify_curve
+from utils import compression
 import settings
 
+CURVES_CACHE_TIMEOUT = 60 * 60 * 24
+
 def index(request, order_by='-pub_date'):
     """Index page of Method section.
 
@@ -146,51 +152,44 @@ def score_download(request, slug):
     """
     return base.download(request, Method, slug)
 
-def plot_multiple_curves(request, id, resolution='medium'):
-    method=get_object_or_404(Method, pk=id)
-    results=Result.objects.filter(method=method)
-
-    try:
-        dpi=settings.RESOLUTIONS[resolution]
-    except KeyError:
-        raise Http404
+def _render_multiple_curves(results, dpi):
+    """Render the curves of given results into one PNG image.
 
-    num_col=float(results.count())
-    if num_col == 0.0:
-        raise Http404
+    Each curve is simplified to the resolution of the image first, so
+    rendering time doesn't depend on the number of points in a curve.
 
+    @param results: results to plot, with complex_result_type Curve
+    @type results: list of Result
+    @param dpi: resolution of the image
+    @type dpi: integer
+    @return: PNG image
+    @rtype: string
+    """
     from matplotlib.backends.backend_agg import FigureCanvasAgg as FigureCanvas
     #from matplotlib.backends.backend_cairo import FigureCanvasCairo as FigureCanvas
     from matplotlib.figure import Figure
     from matplotlib.cm import jet as col
 
-    #legend=list()
     if dpi<=40:
         bgcol='#f7f7f7'
     else:
         bgcol='#ffffff'
 
-    fig = Figure(figsize=(8,6), dpi=dpi, facecolor=bgcol)
+    figsize=(8,6)
+    fig = Figure(figsize=figsize, dpi=dpi, facecolor=bgcol)
     ax = fig.add_subplot(111)
+    num_col=float(len(results))
     i=0.0
 
     for result in results:
-        if result.complex_result_type!='Curve':
-            raise Http404
-
-        #legend.append(result.task.name)
         c=col((i+1)/num_col)
         i+=1
 
         r=pickle.loads(str(result.complex_result))
-        x=r['x']
-        y=r['y']
+        x, y=simplify_curve(r['x'], r['y'], figsize[0]*dpi, figsize[1]*dpi)
         x_name=r['x_name']
         y_name=r['y_name']
         ax.plot(x,y, alpha=0.5, marker='.', linewidth=5, color=c)
-        #ax.plot(x,y,'rx',linewidth=1, alpha=0.9)
-        #ax.bar(x,y)
-
 
     title=result.task.performance_measure + ' - auROC=%2.2f%%' % (100*result.aggregation_score)
 
@@ -201,9 +200,44 @@ def plot_multiple_curves(request, id, resolution='medium'):
     ax.axis("tight")
 
     canvas = FigureCanvas(fig)
-    response=HttpResponse(mimetype='image/png')
-    canvas.print_png(response)
-    return response
+    imdata=StringIO()
+    canvas.print_png(imdata)
+    return imdata.getvalue()
+
+def plot_multiple_curves(request, id, resolution='medium'):
+    """Plot the curves of all results of a Method in one image.
+
+    Results which are not curves are skipped. The image is cached per
+    Method and resolution until one of its results changes.
+
+    @param request: request data
+    @type request: Django request
+    @param id: id of the Method
+    @type id: integer
+    @param resolution: name of resolution, key of settings.RESOLUTIONS
+    @type resolution: string
+    @return: PNG image
+    @rtype: Django response
+    @raise Http404: if Method or resolution doesn't exist or there are no curves
+    """
+    method=get_object_or_404(Method, pk=id)
+
+    try:
+        dpi=settings.RESOLUTIONS[resolution]
+    except KeyError:
+        raise Http404
+
+    cache_key=Method.get_curves_cache_key(method.pk, resolution)
+    png=cache.get(cache_key)
+    if png is None:
+        results=list(Result.objects.filter(method=method,
+            complex_result_type='Curve').select_related('task'))
+        if not results:
+            raise Http404
+        png=_render_multiple_curves(results, dpi)
+        cache.set(cache_key, png, CURVES_CACHE_TIMEOUT)
+
+    return HttpResponse(png, mimetype='image/png')
 
 def plot_single_curve(request, id, resolution='tiny'):
     result=get_object_or_404(Result, pk=id)
@@ -251,11 +285,37 @@ def plot_single_curve(request, id, resolution='tiny'):
     return response
 
 def get_predictions(request, id):
-    """Extract the list of predictions from Result and return it"""
+    """Extract the list of predictions from Result and return it.
+
+    Gzipped files are sent as they are with a Content-Encoding if the
+    client accepts it, otherwise they are decompressed on the fly. bzip2
+    and xz aren't HTTP content codings, so such files are sent as
+    compressed files of their own content type.
+    """
     obj = get_object_or_404(Result, pk=id)
     fname = obj.get_output_filename()
-    fileobj = File(open(fname, 'r'))
+    fileobj = File(open(fname, 'rb'))
+    encoding = compression.get_file_encoding(fileobj)
     # create humanly readable export filename
-    fname_export_visible = os.path.basename(fname)
-    fileobj.name = fname_export_visible
-    return sendfile(fileobj, 'text')
+    fname_export_visible = compression.strip_suffix(os.path.basename(fname), encoding)
+
+    if not encoding:
+        fileobj.name = fname_export_visible
+        return sendfile(fileobj, 'text')
+
+    if encoding != 'gzip':
+        fileobj.name = fname_export_visible + compression.get_suffix(encoding)
+        return sendfile(fileobj, compression.get_content_type(encoding))
+
+    accepted = [e.split(';')[0].strip() for e in
+        request.META.get('HTTP_ACCEPT_ENCODING', '').split(',')]
+    if encoding in accepted:
+        fileobj.name = fname_export_visible
+        response = sendfile(fileobj, 'text')
+        response['Content-Encoding'] = encoding
+    else:
+        response = HttpResponse(compression.iter_decompressed(fileobj), mimetype='text')
+        response['Content-Disposition'] = 'attachment; filename=' + fname_export_visible
+    # caches must not serve either variant to the other kind of client
+    patch_vary_headers(response, ('Accept-Encoding',))
+    return response
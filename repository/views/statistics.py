@@ -0,0 +1,101 @@
+"""
+Views and downloads over time, for staff.
+"""
+
+from StringIO import StringIO
+from django.http import Http404, HttpResponse, HttpResponseForbidden
+from django.shortcuts import get_object_or_404, render_to_response
+from django.template import RequestContext
+
+from repository.models import Slug, ItemStatistics
+
+DEFAULT_DAYS = 30
+MAX_DAYS = 3 * 365
+
+
+def _get_days(request):
+    try:
+        days = int(request.GET.get('days', DEFAULT_DAYS))
+    except ValueError:
+        raise Http404
+    return max(1, min(days, MAX_DAYS))
+
+
+def index(request):
+    """Overview of views and downloads of the last days.
+
+    @param request: request data
+    @type request: Django request
+    @return: rendered response page
+    @rtype: Django response
+    """
+    if not request.user.is_staff:
+        return HttpResponseForbidden()
+
+    days = _get_days(request)
+    daily = ItemStatistics.get_daily(days)
+    info_dict = {
+        'days': days,
+        'hits': sum([d[1] for d in daily]),
+        'downloads': sum([d[2] for d in daily]),
+        'top_downloads': ItemStatistics.get_top(days, 'downloads'),
+        'top_hits': ItemStatistics.get_top(days, 'hits'),
+        'formats': ItemStatistics.get_formats(days),
+        'section': 'repository',
+    }
+    return render_to_response('repository/statistics.html', info_dict,
+        context_instance=RequestContext(request))
+
+
+def _render_daily(daily, title):
+    """Render views and downloads per day as PNG image.
+
+    @param daily: day, views and downloads as by ItemStatistics.get_daily
+    @type daily: list of tuples
+    @param title: title of the chart
+    @type title: string
+    @return: PNG image
+    @rtype: string
+    """
+    from matplotlib.backends.backend_agg import FigureCanvasAgg as FigureCanvas
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=(8, 3), dpi=80, facecolor='#ffffff')
+    ax = fig.add_subplot(111)
+    days = [d[0] for d in daily]
+    ax.plot(days, [d[1] for d in daily], marker='.', label='views')
+    ax.plot(days, [d[2] for d in daily], marker='.', label='downloads')
+    ax.set_title(title)
+    ax.legend(loc='upper left')
+    ax.grid(True)
+    fig.autofmt_xdate()
+
+    canvas = FigureCanvas(fig)
+    imdata = StringIO()
+    canvas.print_png(imdata)
+    return imdata.getvalue()
+
+
+def plot(request, slug=None):
+    """Plot views and downloads per day of one or all items.
+
+    @param request: request data
+    @type request: Django request
+    @param slug: slug text of the item, all items if None
+    @type slug: string
+    @return: PNG image
+    @rtype: Django response
+    @raise Http404: if the item doesn't exist
+    """
+    if not request.user.is_staff:
+        return HttpResponseForbidden()
+
+    days = _get_days(request)
+    if slug:
+        slug = get_object_or_404(Slug, text=slug)
+        daily = ItemStatistics.get_daily(days, slug.id)
+        title = slug.text
+    else:
+        daily = ItemStatistics.get_daily(days)
+        title = 'all items'
+    return HttpResponse(_render_daily(daily, title), mimetype='image/png')
@@ -43,6 +43,15 @@ def get_measure_help(request, type, name):
     data = json.dumps(helptxt)
     return HttpResponse(data, mimetype='text/plain')
 
+def get_test_rows(request, id):
+    """AJAX: Get the number of rows a Result's output file must have
+    """
+    obj = get_object_or_404(Task, pk=id)
+    if not obj.can_view(request.user):
+        return HttpResponseForbidden()
+    data = json.dumps({'rows': obj.get_test_rows()})
+    return HttpResponse(data, mimetype='text/plain')
+
 def index(request, order_by='-pub_date', filter_type=None):
     return base.index(request, Task, order_by=order_by, filter_type=filter_type)
 
@@ -1,7 +1,11 @@
+import hashlib
 import os
+import numpy
+from django.core.cache import cache
 from django.core.mail import mail_admins
 from django.core.paginator import Paginator, EmptyPage, InvalidPage
 from django.http import HttpResponse, HttpResponseRedirect, Http404
+from django.utils.functional import wraps
 from django.utils.translation import ugettext as _
 from django.core.urlresolvers import reverse
 
@@ -12,6 +16,9 @@ from preferences.models import Preferences
 
 NUM_HISTORY_PAGE = 20
 PER_PAGE_INTS = [10, 20, 50]
+COUNT_CACHE_TIMEOUT = 60
+# foreign keys shown per item in listings
+LISTING_RELATED = ('slug', 'user', 'license')
 
 def get_versions_paginator(request, obj):
     """Get a paginator for item versions.
@@ -27,15 +34,12 @@ def get_versions_paginator(request, obj):
     paginator = Paginator(items, NUM_HISTORY_PAGE)
 
     try:
-        # dunno a better way than looping thru, since index != obj.version
-        index = 0
-        for v in items:
-            if v.id == obj.id:
-                break
-            else:
-                index += 1
-        default_page = (index / NUM_HISTORY_PAGE) + 1
-        page = int(request.GET.get('page', str(default_page)))
+        if 'page' in request.GET:
+            page = int(request.GET['page'])
+        else:
+            # versions are numbered with gaps, e.g. after deletions
+            index = items.filter(version__lt=obj.version).count()
+            page = (index / NUM_HISTORY_PAGE) + 1
     except ValueError:
         page = 1
     try:
@@ -46,42 +50,177 @@ def get_versions_paginator(request, obj):
     return versions
 
 
+class LazyValue(object):
+    """Value computed when a template first looks into it.
+
+    Lets templates skip the work for fragments which come from the cache.
+    Items, attributes, iteration, length and truth are those of the value.
+    """
+
+    def __init__(self, func, *args):
+        self._func = func
+        self._args = args
+
+    def _get_value(self):
+        if not hasattr(self, '_value'):
+            self._value = self._func(*self._args)
+        return self._value
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return getattr(self._get_value(), name)
+
+    def __getitem__(self, key):
+        return self._get_value()[key]
+
+    def __iter__(self):
+        return iter(self._get_value())
+
+    def __len__(self):
+        return len(self._get_value())
+
+    def __nonzero__(self):
+        return bool(self._get_value())
+
+
+def _get_tag_clouds(user):
+    clouds = { 'Data': None, 'Task': None, 'Method': None, 'Challenge' : None}
+    for k in clouds.iterkeys():
+        klass = eval(k)
+        clouds[k] = klass.get_tag_cloud(user)
+    return clouds
+
 def get_tag_clouds(request):
     """Convenience function to retrieve tag clouds for all item types.
 
+    The clouds are fetched when the template shows them, not at all if
+    the sidebar comes from the fragment cache.
+
     @param request: request data
     @type request: Django request
     @return: list of tags with attributes font_size
-    @rtype: hash with keys 'Data', 'Task', 'Method' containing lists of tagging.Tag
+    @rtype: LazyValue of hash with keys 'Data', 'Task', 'Method' containing lists of tagging.Tag
     """
-    clouds = { 'Data': None, 'Task': None, 'Method': None, 'Challenge' : None}
-    for k in clouds.iterkeys():
-        klass = eval(k)
-        clouds[k] = klass.get_tag_cloud(request.user)
-    return clouds
+    return LazyValue(_get_tag_clouds, request.user)
+
+###############################################################################
+#
+# CURVES
+#
+
+def simplify_curve(x, y, width, height):
+    """Simplify a polyline to what can be told apart at given resolution.
+
+    Uses the Ramer-Douglas-Peucker algorithm in pixel space: a point is only
+    kept if dropping it would move the drawn line by more than half a pixel,
+    so the rendered curve is visually unchanged.
+
+    @param x: x coordinates of the curve
+    @type x: sequence of floats
+    @param y: y coordinates of the curve
+    @type y: sequence of floats
+    @param width: width of the plotting area in pixels
+    @type width: integer
+    @param height: height of the plotting area in pixels
+    @type height: integer
+    @return: simplified x and y coordinates
+    @rtype: tuple of numpy arrays
+    """
+    x = numpy.asarray(x, dtype=float)
+    y = numpy.asarray(y, dtype=float)
+    n = len(x)
+    if n < 3 or n != len(y):
+        return x, y
+
+    # scale to pixels so the tolerance is the same along both axes
+    span_x = x.max() - x.min() or 1.0
+    span_y = y.max() - y.min() or 1.0
+    px = (x - x.min()) * (width / span_x)
+    py = (y - y.min()) * (height / span_y)
+
+    keep = numpy.zeros(n, dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, n - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        dx = px[last] - px[first]
+        dy = py[last] - py[first]
+        seg_x = px[first+1:last] - px[first]
+        seg_y = py[first+1:last] - py[first]
+        norm = numpy.hypot(dx, dy)
+        if norm == 0:
+            dist = numpy.hypot(seg_x, seg_y)
+        else:
+            dist = numpy.abs(dx * seg_y - dy * seg_x) / norm
+        index = dist.argmax()
+        if dist[index] > 0.5:
+            index += first + 1
+            keep[index] = True
+            stack.append((first, index))
+            stack.append((index, last))
+
+    return x[keep], y[keep]
 
 ###############################################################################
 #
 # PAGINATION
 #
 
+class CountedPaginator(Paginator):
+    """Paginator which is given the number of items instead of counting them."""
+
+    def __init__(self, object_list, per_page, count, **kwargs):
+        super(CountedPaginator, self).__init__(object_list, per_page, **kwargs)
+        self._count = count
+
+def get_count(queryset, cached=True):
+    """Count items of given queryset.
+
+    The count is cached per query for COUNT_CACHE_TIMEOUT seconds, so
+    paging through a listing counts only once. Don't cache lists which
+    their users change themselves, like the My pages.
+
+    @param queryset: items to count
+    @type queryset: QuerySet or SearchResults
+    @param cached: if the count may be cached
+    @type cached: boolean
+    @return: number of items
+    @rtype: integer
+    """
+    if not cached or not hasattr(queryset, 'query'):
+        return queryset.count()
+    sql, params = queryset.query.get_compiler(queryset.db).as_sql()
+    key = 'count_' + hashlib.md5(repr((sql, params))).hexdigest()
+    count = cache.get(key)
+    if count is None:
+        count = queryset.count()
+        cache.set(key, count, COUNT_CACHE_TIMEOUT)
+    return count
+
 def get_per_page(count):
     PER_PAGE=[ p for p in PER_PAGE_INTS if p < count ]
     if not PER_PAGE:
         PER_PAGE.append(PER_PAGE_INTS[0])
     return PER_PAGE
 
-def get_page(request, queryset, PER_PAGE):
-    class dummy:
-        pass
+def get_page(request, queryset, PER_PAGE, count=None):
+    """Get paginator with the requested page of given items.
 
-    try:
-        klass=type(queryset[0])
-    except:
-        klass=dummy
-        pass
-    
-    kname=klass.__name__.lower()
+    @param request: request data
+    @type request: Django request
+    @param queryset: items to paginate
+    @type queryset: QuerySet or SearchResults
+    @param PER_PAGE: allowed numbers of items per page
+    @type PER_PAGE: list of integers
+    @param count: number of items, if known already
+    @type count: integer
+    @return: paginator with attribute page_obj
+    @rtype: Django paginator
+    """
+    kname=queryset.model.__name__.lower()
 
     perpage = PER_PAGE[0]
     try:
@@ -92,7 +231,11 @@ def get_page(request, queryset, PER_PAGE):
     if perpage not in PER_PAGE_INTS:
         perpage = PER_PAGE[0]
 
-    paginator = Paginator(queryset, perpage, allow_empty_first_page=True)
+    if count is None:
+        paginator = Paginator(queryset, perpage, allow_empty_first_page=True)
+    else:
+        paginator = CountedPaginator(queryset, perpage, count,
+            allow_empty_first_page=True)
 
     page = request.GET.get(kname + '_page', 1)
     try:
@@ -121,6 +264,65 @@ def get_page(request, queryset, PER_PAGE):
         paginator.search_challenge=True
     return paginator
 
+def get_listing_page(request, queryset, PER_PAGE, count=None):
+    """Get paginator with the requested page of an item listing.
+
+    Like get_page, but the items of the page are fetched along with what
+    the listing shows of them, see Repository.prefetch_listing.
+
+    @param request: request data
+    @type request: Django request
+    @param queryset: items to paginate, see select_listing_related
+    @type queryset: QuerySet or SearchResults
+    @param PER_PAGE: allowed numbers of items per page
+    @type PER_PAGE: list of integers
+    @param count: number of items, if known already
+    @type count: integer
+    @return: paginator with attribute page_obj
+    @rtype: Django paginator
+    """
+    paginator = get_page(request, queryset, PER_PAGE, count)
+    if paginator.page_obj:
+        paginator.page_obj.object_list = list(paginator.page_obj.object_list)
+        queryset.model.prefetch_listing(paginator.page_obj.object_list)
+    return paginator
+
+def select_listing_related(queryset):
+    """Join what item listings show of every item to given items.
+
+    @param queryset: items of a listing
+    @type queryset: QuerySet of Data, Task, Method or Challenge
+    @return: items with slug, user and license
+    @rtype: QuerySet
+    """
+    return queryset.select_related(*LISTING_RELATED)
+
+def cache_anonymous_page(view_func):
+    """Decorator answering anonymous GETs from PageCache.
+
+    The view decides whether its page may be cached by calling
+    PageCache.allow. Views of an item are counted for cached pages, too.
+
+    @param view_func: view to decorate
+    @type view_func: function
+    @return: decorated view
+    @rtype: function
+    """
+    @wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        if not PageCache.is_cacheable(request):
+            return view_func(request, *args, **kwargs)
+        page = PageCache.get(request)
+        if page is not None:
+            content, content_type, slug_id = page
+            if slug_id:
+                ItemCounter.record(slug_id, 'hits')
+            return HttpResponse(content, content_type=content_type)
+        response = view_func(request, *args, **kwargs)
+        PageCache.set(request, response)
+        return response
+    return wrapper
+
 def get_upload_limit():
     return Preferences.objects.get(pk=1).max_data_size
 
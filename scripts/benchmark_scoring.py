@@ -0,0 +1,309 @@
+#!/usr/bin/env python
+"""
+Benchmark scoring of Results on synthetic Data/Task files.
+
+Generates Data and Task HDF5 files of growing size for binary
+classification, multiclass classification and regression and times the
+stages of Result.predict: parsing predictions, loading the ground truth
+and every performance measure of the task type. The timings are written
+as JSON, so reports of different releases can be compared.
+"""
+
+import getopt, sys, os, time, json, tempfile, shutil, platform, datetime
+
+# adjust if you move this file elsewhere
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../..'))
+os.environ['DJANGO_SETTINGS_MODULE'] = 'mldata.settings'
+
+import numpy
+import ml2h5.converter, ml2h5.data, ml2h5.task
+from mleval import evaluation
+from django.core.files import File
+
+from repository.models import Data, Task, Result
+from settings import VERSION
+
+SIZES = [10**3, 10**4, 10**5, 10**6, 10**7]
+TYPES = ['Binary Classification', 'Multi Class Classification', 'Regression']
+NUM_FEATURES = 5
+NUM_CLASSES = 5
+
+
+class Options(object):
+    output = 'benchmark_scoring.json'
+    max_size = SIZES[-1]
+    repeat = 3
+    workdir = None
+    verbose = False
+
+
+def usage():
+    """Print usage of benchmark."""
+    print 'Usage: ' + sys.argv[0] + ''' [options]
+
+Options:
+
+-o, --output
+        file to write the JSON report to
+        default: ''' + Options.output + '''
+
+-m, --max-size
+        largest number of instances to benchmark
+        default: ''' + str(Options.max_size) + '''
+
+-r, --repeat
+        number of runs per measurement, the fastest one is reported
+        default: ''' + str(Options.repeat) + '''
+
+-w, --workdir
+        directory for the synthetic files, kept after the run
+        default: a temporary directory which is removed afterwards
+
+-v, --verbose
+        enable verbose mode
+        default: ''' + str(Options.verbose) + '''
+
+-h, --help
+        show this help message and exit
+'''
+
+
+def parse_options():
+    """Parse options given to benchmark."""
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], 'o:m:r:w:vh',
+            ['output=', 'max-size=', 'repeat=', 'workdir=', 'verbose', 'help'])
+    except getopt.GetoptError, err:
+        print str(err) + "\n"
+        usage()
+        sys.exit(1)
+
+    options = Options()
+    for o, a in opts:
+        if o in ('-o', '--output'):
+            options.output = a
+        elif o in ('-m', '--max-size'):
+            options.max_size = int(a)
+        elif o in ('-r', '--repeat'):
+            options.repeat = max(1, int(a))
+        elif o in ('-w', '--workdir'):
+            options.workdir = os.path.abspath(a)
+        elif o in ('-v', '--verbose'):
+            options.verbose = True
+        elif o in ('-h', '--help'):
+            usage()
+            sys.exit(0)
+        else:
+            print 'Unhandled option: ' + o
+            sys.exit(2)
+
+    return options
+
+
+def make_labels(ttype, num):
+    """Make random true labels for given task type.
+
+    @param ttype: task type
+    @type ttype: string
+    @param num: number of instances
+    @type num: integer
+    @return: labels
+    @rtype: numpy.array
+    """
+    if ttype == 'Binary Classification':
+        return numpy.sign(numpy.random.rand(num) - 0.5)
+    elif ttype == 'Multi Class Classification':
+        return numpy.random.randint(1, NUM_CLASSES + 1, num).astype(float)
+    return numpy.random.randn(num)
+
+
+def make_predictions(ttype, labels):
+    """Make noisy predictions for given labels, as a submission would contain.
+
+    @param ttype: task type
+    @type ttype: string
+    @param labels: true labels
+    @type labels: numpy.array
+    @return: contents of an output file
+    @rtype: string
+    """
+    noise = numpy.random.randn(len(labels))
+    if ttype == 'Binary Classification':
+        predicted = labels + 2 * noise
+    elif ttype == 'Multi Class Classification':
+        predicted = numpy.where(noise > 1, 1.0, labels)
+    else:
+        predicted = labels + 0.1 * noise
+    return '\n'.join(['%g' % p for p in predicted]) + '\n'
+
+
+def make_files(workdir, ttype, num):
+    """Write synthetic Data and Task files.
+
+    @param workdir: directory to write files to
+    @type workdir: string
+    @param ttype: task type
+    @type ttype: string
+    @param num: number of instances
+    @type num: integer
+    @return: Task object pointing to the files and the test labels
+    @rtype: tuple of Task and numpy.array
+    """
+    name = '%s_%d' % (ttype.split()[0].lower(), num)
+    fname_csv = os.path.join(workdir, name + '.csv')
+    fname_data = os.path.join(workdir, name + '.h5')
+    fname_task = os.path.join(workdir, name + '_task.h5')
+
+    labels = make_labels(ttype, num)
+    features = numpy.random.randn(num, NUM_FEATURES)
+    numpy.savetxt(fname_csv, numpy.column_stack((features, labels)),
+        fmt='%g', delimiter=',')
+    ml2h5.converter.Converter(fname_csv, fname_data).run()
+    os.remove(fname_csv)
+
+    data = Data(name=name, num_instances=num,
+        num_attributes=NUM_FEATURES + 1)
+    data.file.name = fname_data
+    task = Task(name='task_' + name, type=ttype, data=data,
+        performance_measure=evaluation.pm_hierarchy[ttype].keys()[0])
+    split = num / 2
+    taskinfo = {
+        'train_idx': [range(0, split)],
+        'val_idx': None,
+        'test_idx': [range(split, num)],
+        'input_variables': range(0, NUM_FEATURES),
+        'output_variables': [NUM_FEATURES],
+        'data_size': num,
+    }
+    ml2h5.task.update_or_create(fname_task, task, taskinfo)
+    task.file.name = fname_task
+
+    return task, labels[split:]
+
+
+def timeit(func, repeat):
+    """Time given function.
+
+    @param func: function to time
+    @type func: callable
+    @param repeat: number of runs
+    @type repeat: integer
+    @return: fastest run in seconds and return value of last run
+    @rtype: tuple of float and anything
+    """
+    best = None
+    for i in xrange(repeat):
+        start = time.time()
+        ret = func()
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best, ret
+
+
+def benchmark(options, workdir):
+    """Run all benchmarks.
+
+    @param options: runtime options
+    @type options: Options
+    @param workdir: directory for synthetic files
+    @type workdir: string
+    @return: timings
+    @rtype: list of dicts
+    """
+    timings = []
+    numpy.random.seed(0)
+    for ttype in TYPES:
+        for num in [s for s in SIZES if s <= options.max_size]:
+            task, labels = make_files(workdir, ttype, num)
+            fname_output = os.path.join(workdir, 'output_%d.txt' % num)
+            output = make_predictions(ttype, labels)
+            f = open(fname_output, 'w')
+            f.write(output)
+            f.close()
+
+            def record(stage, seconds, measure=None):
+                timings.append({'type': ttype, 'instances': num,
+                    'stage': stage, 'measure': measure, 'seconds': seconds})
+                if options.verbose:
+                    print '%-28s %9d %-20s %-40s %8.3fs' % \
+                        (ttype, num, stage, measure or '', seconds)
+
+            fname_task = task.get_task_filename()
+            fname_data = task.data.get_data_filename()
+
+            def load_correct():
+                test_idx, output_variables = ml2h5.task.get_test_output(fname_task)
+                correct = [ml2h5.data.get_correct(fname_data, test_idx[0], ov)
+                    for ov in output_variables]
+                return numpy.transpose(numpy.array(correct))
+            seconds, correct = timeit(load_correct, options.repeat)
+            record('ground_truth', seconds)
+
+            seconds, predicted = timeit(
+                lambda: Result.parse_predictions(output), options.repeat)
+            record('parse', seconds)
+            predicted = numpy.array(predicted)
+
+            for pm, entry in evaluation.pm_hierarchy[ttype].iteritems():
+                measure = entry[0]
+                try:
+                    seconds, score = timeit(
+                        lambda: measure(predicted, correct), options.repeat)
+                except Exception, e:
+                    if options.verbose:
+                        print 'Measure %s failed: %s' % (pm, e)
+                    continue
+                record('measure', seconds, pm)
+
+            def predict():
+                result = Result(task=task)
+                result.output_file = File(open(fname_output, 'r'))
+                try:
+                    return result.predict()
+                finally:
+                    result.output_file.close()
+            seconds, ret = timeit(predict, options.repeat)
+            record('predict', seconds, task.performance_measure)
+
+            # a given workdir is kept for inspection, large temporary
+            # files are removed as soon as they are measured
+            if not options.workdir:
+                for fname in (fname_output, fname_data, fname_task):
+                    os.remove(fname)
+
+    return timings
+
+
+if __name__ == '__main__':
+    options = parse_options()
+
+    if options.workdir:
+        workdir = options.workdir
+        if not os.path.exists(workdir):
+            os.makedirs(workdir)
+    else:
+        workdir = tempfile.mkdtemp()
+
+    try:
+        timings = benchmark(options, workdir)
+    finally:
+        if not options.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        'version': VERSION,
+        'date': datetime.datetime.now().isoformat(),
+        'python': platform.python_version(),
+        'numpy': numpy.__version__,
+        'platform': platform.platform(),
+        'repeat': options.repeat,
+        'timings': timings,
+    }
+    f = open(options.output, 'w')
+    json.dump(report, f, indent=1, sort_keys=True)
+    f.close()
+    print 'Wrote report to ' + options.output
+
+    sys.exit(0)
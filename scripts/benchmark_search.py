@@ -0,0 +1,222 @@
+#!/usr/bin/env python
+"""
+Benchmark full-text search against the LIKE scan it replaced.
+
+Creates a test database, fills it with synthetic Data items of growing
+number and times both ways to get the first page of search results for
+a few search terms: the LIKE scan over name and summary and the ranked
+lookup in the full-text index. The timings are written as JSON, so
+reports of different releases can be compared.
+"""
+
+import getopt, sys, os, time, json, random, platform, datetime
+
+# adjust if you move this file elsewhere
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../..'))
+os.environ['DJANGO_SETTINGS_MODULE'] = 'mldata.settings'
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.db.models import Q
+
+from repository.models import Data, License, SearchIndex, SearchHits, SearchResults
+from settings import VERSION
+
+SIZES = [10**2, 10**3, 10**4, 10**5]
+PAGE_SIZE = 10
+WORDS = ['regression', 'classification', 'images', 'text', 'genome',
+    'protein', 'sensor', 'speech', 'finance', 'weather', 'medical',
+    'benchmark', 'sparse', 'dense', 'synthetic', 'survey', 'network',
+    'clustering', 'timeseries', 'vision']
+TERMS = ['genome', 'protein sensor', 'clas', 'nonexistent']
+
+
+class Options(object):
+    output = 'benchmark_search.json'
+    max_size = SIZES[-1]
+    repeat = 3
+    verbose = False
+
+
+def usage():
+    """Print usage of benchmark."""
+    print 'Usage: ' + sys.argv[0] + ''' [options]
+
+Options:
+
+-o, --output
+        file to write the JSON report to
+        default: ''' + Options.output + '''
+
+-m, --max-size
+        largest number of Data items to benchmark
+        default: ''' + str(Options.max_size) + '''
+
+-r, --repeat
+        number of runs per measurement, the fastest one is reported
+        default: ''' + str(Options.repeat) + '''
+
+-v, --verbose
+        enable verbose mode
+        default: ''' + str(Options.verbose) + '''
+
+-h, --help
+        show this help message and exit
+'''
+
+
+def parse_options():
+    """Parse options given to benchmark."""
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], 'o:m:r:vh',
+            ['output=', 'max-size=', 'repeat=', 'verbose', 'help'])
+    except getopt.GetoptError, err:
+        print str(err) + "\n"
+        usage()
+        sys.exit(1)
+
+    options = Options()
+    for o, a in opts:
+        if o in ('-o', '--output'):
+            options.output = a
+        elif o in ('-m', '--max-size'):
+            options.max_size = int(a)
+        elif o in ('-r', '--repeat'):
+            options.repeat = max(1, int(a))
+        elif o in ('-v', '--verbose'):
+            options.verbose = True
+        elif o in ('-h', '--help'):
+            usage()
+            sys.exit(0)
+        else:
+            print 'Unhandled option: ' + o
+            sys.exit(2)
+
+    return options
+
+
+def make_text(num):
+    """Make random text from the benchmark vocabulary.
+
+    @param num: number of words
+    @type num: integer
+    @return: text
+    @rtype: string
+    """
+    return ' '.join([random.choice(WORDS) for i in xrange(num)])
+
+
+@transaction.commit_on_success
+def add_data(user, license, num):
+    """Add synthetic Data items.
+
+    @param user: owner of the items
+    @type user: Django User
+    @param license: license of the items
+    @type license: License
+    @param num: number of items to add
+    @type num: integer
+    """
+    start = Data.objects.count()
+    for i in xrange(start, start + num):
+        data = Data(name='data%d' % i,
+            summary=make_text(8), description=make_text(100),
+            source=make_text(5), tags=make_text(3), user=user,
+            license=license, is_current=True, is_public=True,
+            is_approved=True)
+        data.save()
+
+
+def like_scan(term):
+    """Get first page of results as the LIKE based search did."""
+    objects = Data.objects.filter(is_deleted=False, is_current=True,
+        is_public=True, is_approved=True)
+    objects = objects.filter(Q(name__icontains=term) |
+        Q(summary__icontains=term)).order_by('-pub_date')
+    return objects.count(), list(objects[:PAGE_SIZE])
+
+def index_search(term):
+    """Get first page of results from the full-text index."""
+    objects = Data.objects.filter(is_deleted=False, is_current=True,
+        is_public=True, is_approved=True)
+    objects = SearchResults(Data, SearchHits(Data, term), objects)
+    return objects.count(), objects[:PAGE_SIZE]
+
+
+def timeit(func, repeat):
+    """Time given function.
+
+    @param func: function to time
+    @type func: callable
+    @param repeat: number of runs
+    @type repeat: integer
+    @return: fastest run in seconds and return value of last run
+    @rtype: tuple of float and anything
+    """
+    best = None
+    for i in xrange(repeat):
+        start = time.time()
+        ret = func()
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best, ret
+
+
+def benchmark(options):
+    """Run all benchmarks.
+
+    @param options: runtime options
+    @type options: Options
+    @return: timings
+    @rtype: list of dicts
+    """
+    timings = []
+    random.seed(0)
+    user = User.objects.create_user('benchmark', 'benchmark@mldata.org', 'pass')
+    license = License.objects.create(name='benchmark', url='http://mldata.org')
+
+    for num in [s for s in SIZES if s <= options.max_size]:
+        add_data(user, license, num - Data.objects.count())
+        for term in TERMS:
+            for name, func in (('like', like_scan), ('index', index_search)):
+                seconds, (count, page) = timeit(lambda: func(term), options.repeat)
+                timings.append({'items': num, 'term': term, 'method': name,
+                    'results': count, 'seconds': seconds})
+                if options.verbose:
+                    print '%9d %-16s %-6s %7d %8.4fs' % \
+                        (num, term, name, count, seconds)
+
+    return timings
+
+
+if __name__ == '__main__':
+    options = parse_options()
+
+    old_name = settings.DATABASE_NAME
+    connection.creation.create_test_db(verbosity=0)
+    try:
+        if not SearchIndex.is_available():
+            print 'Full-text search is not supported by this database.'
+            sys.exit(1)
+        timings = benchmark(options)
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    report = {
+        'version': VERSION,
+        'date': datetime.datetime.now().isoformat(),
+        'python': platform.python_version(),
+        'database': connection.vendor,
+        'platform': platform.platform(),
+        'repeat': options.repeat,
+        'timings': timings,
+    }
+    f = open(options.output, 'w')
+    json.dump(report, f, indent=1, sort_keys=True)
+    f.close()
+    print 'Wrote report to ' + options.output
+
+    sys.exit(0)
@@ -0,0 +1,217 @@
+#!/usr/bin/env python
+"""
+Benchmark throughput of item views with different ways to count views.
+
+Creates a test database with a few Data items and requests their view
+pages through the Django test client, counting views like before write-
+behind counters (load and save the current version), with an UPDATE per
+view and buffered in the cache. Requests per second and database queries
+per view are written as JSON, so reports of different releases can be
+compared. Buffered counting needs a working cache, see CACHE_BACKEND.
+The page cache is turned off, it would serve the anonymous requests
+without counting them the way the mode under test does.
+"""
+
+import getopt, sys, os, time, json, platform, datetime
+
+# adjust if you move this file elsewhere
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../..'))
+os.environ['DJANGO_SETTINGS_MODULE'] = 'mldata.settings'
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.urlresolvers import reverse
+from django.db import connection, transaction
+from django.test.client import Client
+from django.test.utils import setup_test_environment
+
+from repository.models import Data, License, Repository, ItemCounter
+import repository.models.counter
+import repository.models.pagecache
+from settings import VERSION
+
+MODES = ['save', 'update', 'buffered']
+
+
+class Options(object):
+    output = 'benchmark_views.json'
+    items = 10
+    requests = 500
+    verbose = False
+
+
+def usage():
+    """Print usage of benchmark."""
+    print 'Usage: ' + sys.argv[0] + ''' [options]
+
+Options:
+
+-o, --output
+        file to write the JSON report to
+        default: ''' + Options.output + '''
+
+-i, --items
+        number of Data items to view
+        default: ''' + str(Options.items) + '''
+
+-n, --requests
+        number of requests per mode
+        default: ''' + str(Options.requests) + '''
+
+-v, --verbose
+        enable verbose mode
+        default: ''' + str(Options.verbose) + '''
+
+-h, --help
+        show this help message and exit
+'''
+
+
+def parse_options():
+    """Parse options given to benchmark."""
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], 'o:i:n:vh',
+            ['output=', 'items=', 'requests=', 'verbose', 'help'])
+    except getopt.GetoptError, err:
+        print str(err) + "\n"
+        usage()
+        sys.exit(1)
+
+    options = Options()
+    for o, a in opts:
+        if o in ('-o', '--output'):
+            options.output = a
+        elif o in ('-i', '--items'):
+            options.items = max(1, int(a))
+        elif o in ('-n', '--requests'):
+            options.requests = max(1, int(a))
+        elif o in ('-v', '--verbose'):
+            options.verbose = True
+        elif o in ('-h', '--help'):
+            usage()
+            sys.exit(0)
+        else:
+            print 'Unhandled option: ' + o
+            sys.exit(2)
+
+    return options
+
+
+def saving_update_current_hits(self):
+    """Count a view as it was done before ItemCounter."""
+    current = Repository.objects.get(slug=self.slug, is_current=True)
+    current.hits += 1
+    current.save(silent_update=True)
+    return current
+
+
+@transaction.commit_on_success
+def add_data(num):
+    """Add public Data items.
+
+    @param num: number of items to add
+    @type num: integer
+    @return: URLs of the items' view pages
+    @rtype: list of strings
+    """
+    user = User.objects.create_user('benchmark', 'benchmark@mldata.org', 'pass')
+    license = License.objects.create(name='benchmark', url='http://mldata.org')
+    urls = []
+    for i in xrange(num):
+        data = Data(name='data%d' % i, summary='benchmark', user=user,
+            license=license, is_current=True, is_public=True,
+            is_approved=True)
+        data.save()
+        urls.append(reverse('data_view_slug', args=[data.slug.text]))
+    return urls
+
+
+def run(urls, num):
+    """Request view pages in turn.
+
+    @param urls: URLs of the view pages
+    @type urls: list of strings
+    @param num: number of requests
+    @type num: integer
+    @return: seconds taken and number of queries
+    @rtype: tuple of float and integer
+    """
+    client = Client()
+    connection.queries = []
+    start = time.time()
+    for i in xrange(num):
+        response = client.get(urls[i % len(urls)])
+        if response.status_code != 200:
+            raise RuntimeError('%s returned %d' % (urls[i % len(urls)], response.status_code))
+    return time.time() - start, len(connection.queries)
+
+
+def benchmark(options):
+    """Run all benchmarks.
+
+    @param options: runtime options
+    @type options: Options
+    @return: timings
+    @rtype: list of dicts
+    """
+    timings = []
+    urls = add_data(options.items)
+    update_current_hits = Repository.update_current_hits
+    interval = repository.models.counter.COUNTER_FLUSH_INTERVAL or 60
+    # cached pages wouldn't run the view, so nothing would be counted
+    repository.models.pagecache.PAGE_CACHE_TIMEOUT = 0
+
+    for mode in MODES:
+        if mode == 'save':
+            Repository.update_current_hits = saving_update_current_hits
+        else:
+            Repository.update_current_hits = update_current_hits
+        if mode == 'buffered':
+            repository.models.counter.COUNTER_FLUSH_INTERVAL = interval
+        else:
+            repository.models.counter.COUNTER_FLUSH_INTERVAL = 0
+
+        run(urls, len(urls)) # warm up caches
+        seconds, queries = run(urls, options.requests)
+        ItemCounter.flush()
+        timings.append({'mode': mode, 'requests': options.requests,
+            'seconds': seconds,
+            'requests_per_second': options.requests / seconds,
+            'queries_per_request': float(queries) / options.requests})
+        if options.verbose:
+            print '%-9s %8.1f req/s %6.1f queries/req' % (mode,
+                options.requests / seconds, float(queries) / options.requests)
+
+    Repository.update_current_hits = update_current_hits
+    return timings
+
+
+if __name__ == '__main__':
+    options = parse_options()
+
+    setup_test_environment()
+    settings.DEBUG = True # record queries
+    old_name = settings.DATABASE_NAME
+    connection.creation.create_test_db(verbosity=0)
+    try:
+        timings = benchmark(options)
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    report = {
+        'version': VERSION,
+        'date': datetime.datetime.now().isoformat(),
+        'python': platform.python_version(),
+        'database': connection.vendor,
+        'cache': settings.CACHE_BACKEND,
+        'platform': platform.platform(),
+        'items': options.items,
+        'timings': timings,
+    }
+    f = open(options.output, 'w')
+    json.dump(report, f, indent=1, sort_keys=True)
+    f.close()
+    print 'Wrote report to ' + options.output
+
+    sys.exit(0)
@@ -58,6 +58,10 @@ Options:
         download even if file already exists
         default: ''' + str(Options.force_download) + '''
 
+-t, --threads
+        number of concurrent downloads, at most 2 from the same host
+        default: ''' + str(Options.threads) + '''
+
 -h, --help
         show this help message and exit
 '''
@@ -66,9 +70,10 @@ Options:
 def parse_options():
     """Parse options given to slurper."""
     try:
-        opts, args = getopt.getopt(sys.argv[1:], 'o:s:vdacfh',
+        opts, args = getopt.getopt(sys.argv[1:], 'o:s:vdacft:h',
             ['output=', 'source=', 'verbose', 'download-only',
-            'add-only', 'convert-exist', 'force-download', 'help'])
+            'add-only', 'convert-exist', 'force-download', 'threads=',
+            'help'])
     except getopt.GetoptError, err: # print help information and exit
         print str(err) + "\n"
         usage()
@@ -98,6 +103,8 @@ def parse_options():
             options.convert_exist = True
         elif o in ('-f', '--force-download'):
             options.force_download = True
+        elif o in ('-t', '--threads'):
+            options.threads = int(a)
         elif o in ('-h', '--help'):
             usage()
             sys.exit(0)
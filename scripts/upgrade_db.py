@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+"""
+Upgrade the database schema of an existing installation.
+
+syncdb creates new tables, but doesn't touch existing ones. Columns added
+to existing models and composite indexes are added here. Every step checks whether it is needed
+first, so the script can be run repeatedly. Run syncdb before it.
+"""
+
+import sys, os
+
+# adjust if you move this file elsewhere
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../..'))
+os.environ['DJANGO_SETTINGS_MODULE'] = 'mldata.settings'
+
+from django.db import connection, transaction
+
+from repository.models.indexes import create_indexes
+
+# table, column, column definition
+COLUMNS = [
+    ('repository_challenge', 'max_daily_submissions', 'integer NOT NULL DEFAULT 0'),
+    ('repository_repository', 'rating_sum_interest', 'integer NOT NULL DEFAULT 0'),
+    ('repository_repository', 'rating_sum_doc', 'integer NOT NULL DEFAULT 0'),
+]
+
+# statements run once after given column was added: table, column, statement
+FILL = [
+    # running sums of ratings from the averages, which are exact for
+    # integer ratings
+    ('repository_repository', 'rating_sum_interest',
+        'UPDATE repository_repository SET '
+        'rating_sum_interest = ROUND(rating_avg_interest * rating_votes), '
+        'rating_sum_doc = ROUND(rating_avg_doc * rating_votes) '
+        'WHERE rating_votes > 0'),
+]
+
+
+def get_columns(cursor, table):
+    """Get the names of the columns of given table.
+
+    @param cursor: database cursor
+    @type cursor: DB-API cursor
+    @param table: name of the table
+    @type table: string
+    @return: column names
+    @rtype: list of strings
+    """
+    return [c[0] for c in connection.introspection.get_table_description(cursor, table)]
+
+
+def add_columns(cursor):
+    """Add missing columns to existing tables.
+
+    Columns are filled by the statements in FILL after they were added.
+
+    @param cursor: database cursor
+    @type cursor: DB-API cursor
+    """
+    qn = connection.ops.quote_name
+    added = []
+    for table, column, definition in COLUMNS:
+        if column in get_columns(cursor, table):
+            continue
+        print 'Adding column %s.%s' % (table, column)
+        cursor.execute('ALTER TABLE %s ADD COLUMN %s %s' %
+            (qn(table), qn(column), definition))
+        added.append((table, column))
+
+    for table, column, statement in FILL:
+        if (table, column) in added:
+            print 'Filling column %s.%s' % (table, column)
+            cursor.execute(statement)
+
+
+if __name__ == '__main__':
+    cursor = connection.cursor()
+    add_columns(cursor)
+    transaction.commit_unless_managed()
+
+    create_indexes(verbose=True)
+    print 'Done!'
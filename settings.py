@@ -3,7 +3,8 @@
 import os
 from django.conf import global_settings 
 
-FILE_UPLOAD_HANDLERS = ('mldata.utils.uploadprogresscachedhandler.UploadProgressCachedHandler', ) + \
+FILE_UPLOAD_HANDLERS = ('mldata.utils.uploadprogresscachedhandler.UploadProgressCachedHandler',
+        'mldata.utils.resultuploadhandler.ResultUploadHandler', ) + \
         global_settings.FILE_UPLOAD_HANDLERS
 
 VERSION = "r0000"
@@ -87,6 +88,59 @@ ADMIN_MEDIA_PREFIX = '/media_admin/'
 
 RESOLUTIONS = { 'tiny' : 5, 'small' : 20, 'medium' : 50, 'large' : 100, 'huge': 200 }
 
+# throttling of Result submissions: token bucket per user, refilled with
+# SUBMISSION_RATE tokens per hour up to SUBMISSION_BURST tokens, and the
+# default daily quota per user and challenge (0 = unlimited)
+SUBMISSION_RATE = 30
+SUBMISSION_BURST = 5
+SUBMISSION_DAILY_QUOTA = 0
+
+# views and downloads of items are counted in the cache and written to the
+# database every COUNTER_FLUSH_INTERVAL seconds (0 = write every count)
+COUNTER_FLUSH_INTERVAL = 60
+
+# ratio of requests whose queries, HDF5 opens, cache hits and render time
+# are logged to mldata.instrumentation, all if DEBUG; the figures are also
+# sent in the response header X-Request-Stats if INSTRUMENTATION_HEADER
+INSTRUMENTATION_SAMPLE_RATE = 0.01
+INSTRUMENTATION_HEADER = False
+
+# seconds pages of public items, indexes and tags are cached for anonymous
+# users at most, they are dropped earlier on changes (0 = no caching)
+PAGE_CACHE_TIMEOUT = 60*60
+
+# seconds the parts of pages which are the same for all users, e.g. the data
+# extract or the tag clouds, are cached at most; they are rendered again on
+# changes like the anonymous pages
+FRAGMENT_CACHE_TIMEOUT = 60*60
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'mail_admins': {
+            'level': 'ERROR',
+            'class': 'django.utils.log.AdminEmailHandler',
+        },
+        'console': {
+            'level': 'INFO',
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'django.request': {
+            'handlers': ['mail_admins'],
+            'level': 'ERROR',
+            'propagate': True,
+        },
+        'mldata.instrumentation': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+    },
+}
+
 # needed for registration
 SITE_ID = 1
 LOGIN_REDIRECT_URL='/'
@@ -112,6 +166,7 @@ TEMPLATE_LOADERS = (
 )
 
 MIDDLEWARE_CLASSES = (
+    'repository.middleware.InstrumentationMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -136,6 +191,7 @@ TEMPLATE_CONTEXT_PROCESSORS = (
     'django.core.context_processors.request',
     'django.core.context_processors.auth',
     'mldata.django_authopenid.context_processors.authopenid',
+    'repository.context_processors.fragment_cache',
 )
 
 INSTALLED_APPS = (
@@ -56,6 +56,8 @@ class TagField(CharField):
         if instance is None:
             return edit_string_for_tags(Tag.objects.usage_for_model(owner))
 
+        if not self._is_instance_tag_cache_loaded(instance):
+            self._update_instance_tag_cache(instance)
         return self._get_instance_tag_cache(instance)
 
     def __set__(self, instance, value):
@@ -72,15 +74,20 @@ class TagField(CharField):
         """
         Save tags back to the database
         """
+        if not self._is_instance_tag_cache_loaded(kwargs['instance']):
+            return # neither read nor changed
         tags = self._get_instance_tag_cache(kwargs['instance'])
         if tags is not None:
             Tag.objects.update_tags(kwargs['instance'], tags)
     def _update(self, **kwargs): #signal, sender, instance):
         """
-        Update tag cache from TaggedItem objects.
+        Mark tag cache to be updated from TaggedItem objects on first access,
+        so loading many objects doesn't query their tags one by one.
         """
         instance = kwargs['instance']
-        self._update_instance_tag_cache(instance)
+        # for an unsaved object, leave the default value alone
+        if instance.pk is not None:
+            setattr(instance, '_%s_loaded' % self.attname, False)
 
     def __delete__(self, instance):
         """
@@ -99,6 +106,13 @@ class TagField(CharField):
         Helper: set an instance's tag cache.
         """
         setattr(instance, '_%s_cache' % self.attname, tags)
+        setattr(instance, '_%s_loaded' % self.attname, True)
+
+    def _is_instance_tag_cache_loaded(self, instance):
+        """
+        Helper: check whether an instance's tag cache is set or loaded.
+        """
+        return getattr(instance, '_%s_loaded' % self.attname, True)
 
     def _update_instance_tag_cache(self, instance):
         """
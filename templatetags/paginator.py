@@ -63,6 +63,8 @@ def paginator(context, adjacent_pages=5):
             r['searchterm']=quote(context['searchterm'],'')
             if context.has_key('klass'):
                 r['klass']=quote(context['klass'],'')
+        if context.has_key('facet_query'):
+            r['facet_query']=context['facet_query']
         if context.has_key('selecttab'):
             r['selecttab']=context['selecttab']
 
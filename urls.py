@@ -13,6 +13,7 @@ urlpatterns = patterns('',
     (r'^blog/', include('blog.urls')),
     (r'^forum/', include('forum.urls')),
     (r'^repository/', include('repository.urls')),
+    (r'^api/v1.0/', include('repository.api_urls')),
 
     # somewhat util
     #(r'^accounts/', include('registration.urls')),
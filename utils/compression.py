@@ -0,0 +1,239 @@
+"""
+Compression helpers for files which are stored compressed, like the
+output files of Results.
+
+The compression of a file is detected from its first bytes, not from its
+name, so renamed files are handled as well.
+"""
+
+import bz2, gzip, os, tempfile, zlib
+from django.core.files import File
+
+try:
+    import lzma
+except ImportError:
+    try:
+        from backports import lzma
+    except ImportError: # xz files are rejected
+        lzma = None
+
+# magic bytes, file suffix, name and content type of supported formats,
+# only gzip is also an HTTP content coding
+FORMATS = (
+    ('\x1f\x8b', '.gz', 'gzip', 'application/x-gzip'),
+    ('BZh', '.bz2', 'bzip2', 'application/x-bzip2'),
+    ('\xfd7zXZ\x00', '.xz', 'xz', 'application/x-xz'),
+)
+MAGIC_LENGTH = max([len(f[0]) for f in FORMATS])
+CHUNK_SIZE = 64 * 2 ** 10
+# longest line accepted in an output file, guards against binary uploads
+MAX_LINE_LENGTH = 1048576
+
+
+def get_encoding(head):
+    """Get the compression of data starting with given bytes.
+
+    @param head: first bytes of the data, at least MAGIC_LENGTH if available
+    @type head: string
+    @return: compression, e.g. gzip, or None if not compressed
+    @rtype: string
+    """
+    for magic, suffix, encoding, ctype in FORMATS:
+        if head.startswith(magic):
+            return encoding
+    return None
+
+
+def get_suffix(encoding):
+    """Get the file suffix of given compression.
+
+    @param encoding: compression, e.g. gzip
+    @type encoding: string
+    @return: file suffix, e.g. .gz
+    @rtype: string
+    """
+    for magic, suffix, enc, ctype in FORMATS:
+        if enc == encoding:
+            return suffix
+    return ''
+
+
+def get_content_type(encoding):
+    """Get the content type of a file with given compression.
+
+    @param encoding: compression, e.g. bzip2
+    @type encoding: string
+    @return: content type, e.g. application/x-bzip2
+    @rtype: string
+    """
+    for magic, suffix, enc, ctype in FORMATS:
+        if enc == encoding:
+            return ctype
+    return 'application/octet-stream'
+
+
+def strip_suffix(name, encoding):
+    """Strip the suffix of given compression from a filename.
+
+    @param name: filename
+    @type name: string
+    @param encoding: compression, e.g. gzip
+    @type encoding: string
+    @return: filename without compression suffix
+    @rtype: string
+    """
+    suffix = get_suffix(encoding)
+    if suffix and name.endswith(suffix):
+        return name[:-len(suffix)]
+    return name
+
+
+class Decompressor(object):
+    """Decompress data which is fed in chunks.
+
+    The compression is detected from the first bytes, uncompressed data is
+    passed through unchanged.
+    """
+
+    def __init__(self):
+        self.head = ''
+        self.encoding = None
+        self.decompressor = None
+        self.started = False
+
+    def _start(self):
+        self.started = True
+        self.encoding = get_encoding(self.head)
+        if self.encoding == 'gzip':
+            self.decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        elif self.encoding == 'bzip2':
+            self.decompressor = bz2.BZ2Decompressor()
+        elif self.encoding == 'xz':
+            if not lzma:
+                raise IOError('xz compressed files are not supported')
+            self.decompressor = lzma.LZMADecompressor()
+        data = self.head
+        self.head = ''
+        return data
+
+    def decompress(self, data):
+        """Decompress next chunk.
+
+        @param data: next chunk of (compressed) data
+        @type data: string
+        @return: decompressed data, may be empty
+        @rtype: string
+        @raise IOError: if compressed data is broken or unsupported
+        """
+        if not self.started:
+            self.head += data
+            if len(self.head) < MAGIC_LENGTH:
+                return ''
+            data = self._start()
+        if not self.decompressor:
+            return data
+        try:
+            return self.decompressor.decompress(data)
+        except Exception, e:
+            raise IOError('Broken %s data: %s' % (self.encoding, e))
+
+    def _is_complete(self):
+        """Check whether the end of the compressed stream was reached."""
+        if self.encoding == 'gzip':
+            # zlib of Python 2 has no eof flag, but bytes fed after the end
+            # of the stream are left over as unused data
+            probe = self.decompressor.copy()
+            sentinel = '\0' * 16
+            try:
+                probe.decompress(sentinel)
+            except zlib.error:
+                return False
+            return probe.unused_data.endswith(sentinel)
+        elif self.encoding == 'bzip2':
+            # only a complete stream refuses further data
+            try:
+                self.decompressor.decompress('\0')
+            except EOFError:
+                return True
+            except IOError:
+                pass
+            return False
+        return self.decompressor.eof
+
+    def flush(self):
+        """Return data still buffered after the last chunk.
+
+        @return: decompressed data, may be empty
+        @rtype: string
+        @raise IOError: if compressed data is truncated
+        """
+        data = ''
+        if not self.started:
+            data = self.decompress(self._start())
+        if not self.decompressor:
+            return data
+        if not self._is_complete():
+            raise IOError('Truncated %s data' % self.encoding)
+        if self.encoding == 'gzip':
+            data += self.decompressor.flush()
+        return data
+
+
+def iter_decompressed(fileobj, chunk_size=CHUNK_SIZE):
+    """Iterate over the decompressed contents of given file.
+
+    @param fileobj: (compressed) file, read from its current position
+    @type fileobj: file-like object
+    @param chunk_size: size of chunks to read
+    @type chunk_size: integer
+    @return: decompressed chunks
+    @rtype: generator of strings
+    @raise IOError: if compressed data is broken, truncated or unsupported
+    """
+    decompressor = Decompressor()
+    while True:
+        chunk = fileobj.read(chunk_size)
+        if not chunk:
+            break
+        data = decompressor.decompress(chunk)
+        if data:
+            yield data
+    data = decompressor.flush()
+    if data:
+        yield data
+
+
+def get_file_encoding(fileobj):
+    """Get the compression of given file, without moving its position.
+
+    @param fileobj: file to check
+    @type fileobj: file-like object
+    @return: compression, e.g. gzip, or None if not compressed
+    @rtype: string
+    """
+    pos = fileobj.tell()
+    head = fileobj.read(MAGIC_LENGTH)
+    fileobj.seek(pos)
+    return get_encoding(head)
+
+
+def compress(fileobj):
+    """Gzip given file unless it is compressed already.
+
+    @param fileobj: file to compress, e.g. an UploadedFile
+    @type fileobj: django.core.files.File
+    @return: compressed file, named like the original plus suffix .gz
+    @rtype: django.core.files.File
+    """
+    fileobj.seek(0)
+    if get_file_encoding(fileobj):
+        return fileobj
+
+    name = os.path.basename(fileobj.name)
+    tmp = tempfile.TemporaryFile()
+    gz = gzip.GzipFile(filename=name, mode='wb', fileobj=tmp)
+    for chunk in fileobj.chunks():
+        gz.write(chunk)
+    gz.close()
+    tmp.seek(0)
+    return File(tmp, name=name + get_suffix('gzip'))
@@ -0,0 +1,120 @@
+from django.core.files.uploadhandler import FileUploadHandler, StopUpload
+from django.core.cache import cache
+from django.utils.translation import ugettext as _
+from utils.compression import Decompressor, MAX_LINE_LENGTH
+
+class ResultUploadHandler(FileUploadHandler):
+    """
+    Validates the output file of a Result while it is uploaded.
+
+    The http post request must contain a header or query parameter,
+    'X-Task-ID', which identifies the Task the Result is submitted for.
+    Rows are counted as the data streams in and the upload is stopped as
+    soon as there are more rows than the Task has test instances or a row
+    has a different number of columns than the first one. Compressed files
+    are decompressed on the fly for that.
+
+    The error is stored as request.result_upload_error for the view and,
+    if the upload is tracked by UploadProgressCachedHandler, in the cache
+    next to the progress, so it can be shown while the upload is running.
+    """
+    field_name = 'output_file'
+
+    def __init__(self, request=None):
+        super(ResultUploadHandler, self).__init__(request)
+        self.expected = None
+        self.active = False
+        self.cache_key = None
+
+    def handle_raw_input(self, input_data, META, content_length, boundary, encoding=None):
+        if 'X-Task-ID' in self.request.GET:
+            task_id = self.request.GET['X-Task-ID']
+        else:
+            task_id = META.get('HTTP_X_TASK_ID')
+        if not task_id:
+            return
+
+        from repository.models import Task
+        try:
+            task = Task.objects.get(pk=int(task_id))
+        except (ValueError, Task.DoesNotExist):
+            return
+        self.expected = task.get_test_rows()
+
+        if 'X-Progress-ID' in self.request.GET:
+            progress_id = self.request.GET['X-Progress-ID']
+        else:
+            progress_id = META.get('HTTP_X_PROGRESS_ID')
+        if progress_id:
+            self.cache_key = "%s_%s_error" % (self.request.META['REMOTE_ADDR'], progress_id)
+
+    def new_file(self, field_name, file_name, content_type, content_length, charset=None):
+        self.active = self.expected is not None and field_name == self.field_name
+        self.rows = 0
+        self.columns = None
+        self.tail = ''
+        self.decompressor = Decompressor()
+
+    def receive_data_chunk(self, raw_data, start):
+        if self.active:
+            try:
+                data = self.decompressor.decompress(raw_data)
+            except IOError, e:
+                self._fail(_("Failed to read predictions") + ': ' + str(e))
+            self._check_lines(data)
+        return raw_data
+
+    def file_complete(self, file_size):
+        if not self.active:
+            return None
+        self.active = False
+
+        # the last file is completed outside of the parser's error handling,
+        # so don't stop the upload here, just record the error
+        try:
+            self._check_lines(self.decompressor.flush())
+            self._check_line(self.tail)
+        except IOError, e:
+            self._set_error(_("Failed to read predictions") + ': ' + str(e))
+            return None
+        except StopUpload:
+            return None
+        if self.rows < self.expected:
+            self._set_error(_("Length of correct results and submitted results doesn't match, expected %d, got %d") % (self.expected, self.rows))
+        return None
+
+    def _check_lines(self, data):
+        """Check all complete rows in given data, keep the incomplete rest."""
+        lines = (self.tail + data).split('\n')
+        self.tail = lines.pop()
+        for line in lines:
+            self._check_line(line)
+        if len(self.tail) > MAX_LINE_LENGTH:
+            self._fail(_("Row %d is too long, is this a text file?") % (self.rows + 1))
+
+    def _check_line(self, line):
+        """Count and check one row of the output file.
+
+        Empty lines are skipped, as Result.parse_predictions does.
+        """
+        if not line:
+            return
+        self.rows += 1
+        if self.rows > self.expected:
+            self._fail(_("Submitted results have more rows than the %d test instances of the Task") % self.expected)
+
+        columns = line.count(',') + 1
+        if self.columns is None:
+            self.columns = columns
+        elif columns != self.columns:
+            self._fail(_("Format of given results is wrong! Row %d has %d columns, expected %d") % (self.rows, columns, self.columns))
+
+    def _set_error(self, msg):
+        self.request.result_upload_error = msg
+        if self.cache_key:
+            cache.set(self.cache_key, msg)
+
+    def _fail(self, msg):
+        self._set_error(msg)
+        self.active = False
+        raise StopUpload(connection_reset=True)
@@ -26,6 +26,8 @@ class Options(object):
     @type force_download: boolean
     @cvar source: active source to slurp from
     @type source: int
+    @cvar threads: number of concurrent downloads
+    @type threads: int
     """
     output = os.path.join(os.getcwd(), 'slurped')
     verbose = False
@@ -34,3 +36,4 @@ class Options(object):
     convert_exist = False
     force_download = False
     source = None
+    threads = 8
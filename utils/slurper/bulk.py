@@ -0,0 +1,316 @@
+"""
+Bulk import of many Data items from a manifest.
+
+Slurper.create_data saves an item three times, converts its file in
+between and commits every statement on its own, so importing a few
+thousand datasets takes hours. The bulk import converts the files of all
+items in a pool of processes first and then creates the items in batches,
+one transaction per batch, with a single save per item. Django 1.3 has no
+bulk_create, which couldn't insert inherited models anyway, so the rows
+are still inserted one by one, but without the commits and repeated saves.
+
+A manifest is a JSON list of datasets, e.g.
+
+    [{"name": "iris", "file": "/tmp/iris.arff", "summary": "Fisher's iris",
+      "tags": ["uci", "classification"], "publications": []}]
+
+Besides name and file, an entry may contain format, source, description,
+summary, license (id), tags and publications.
+"""
+
+import datetime
+import multiprocessing
+import os
+import shutil
+
+import ml2h5.converter, ml2h5.data, ml2h5.fileformat
+from django.db import connection, transaction
+from tagging.models import Tag
+
+from repository.models import Repository, Slug, Data, DataShape, Publication
+from preferences.models import Preferences
+from settings import MEDIA_ROOT, DATAPATH
+from utils import slugify
+
+# number of items created in one transaction
+BATCH_SIZE = 100
+
+
+def _convert(fname, fname_orig, format, max_data_size):
+    shutil.copy(fname, fname_orig)
+    if os.path.getsize(fname_orig) > max_data_size:
+        return (os.path.join(DATAPATH, os.path.basename(fname_orig)), -1, -1,
+            'size > %d, not converted' % max_data_size)
+
+    fname_h5 = ml2h5.fileformat.get_filename(fname_orig)
+    error = None
+    try:
+        c = ml2h5.converter.Converter(fname_orig, fname_h5, format_in=format,
+            seperator=ml2h5.fileformat.infer_seperator(fname_orig))
+        c.run(verify=(format != 'uci'))
+    except Exception, e: # the item is still imported with its original file
+        error = 'Error converting to HDF5: %s' % str(e)
+
+    if os.path.isfile(fname_h5):
+        try:
+            num_instances, num_attributes = ml2h5.data.get_num_instattr(fname_h5)
+        except Exception, e: # broken HDF5 file, keep the original one
+            os.remove(fname_h5)
+            error = 'Error reading HDF5 file: %s' % str(e)
+        else:
+            return (os.path.join(DATAPATH, os.path.basename(fname_h5)),
+                num_instances, num_attributes, error)
+    return (os.path.join(DATAPATH, os.path.basename(fname_orig)), -1, -1, error)
+
+
+def convert(job):
+    """Copy a Data file into the repository and convert it to HDF5.
+
+    Runs in the worker processes, so it mustn't touch the database. It
+    never raises, as one broken file would abort the whole pool otherwise.
+
+    @param job: source filename, name of the copy, format and max size
+    @type job: tuple
+    @return: file name relative to MEDIA_ROOT or None if the file couldn't
+        be imported, number of instances and attributes and the error, if any
+    @rtype: tuple
+    """
+    fname_orig = job[1]
+    try:
+        return _convert(*job)
+    except Exception, e:
+        if os.path.isfile(fname_orig):
+            os.remove(fname_orig)
+        return (None, -1, -1, 'Error importing file: %s' % str(e))
+
+
+class BulkImport(object):
+    """Import of Data items listed in a manifest.
+
+    @ivar processes: number of processes converting files, None for one
+        per CPU
+    @type processes: integer
+    @ivar batch_size: number of items created in one transaction
+    @type batch_size: integer
+    @ivar user_id: id of the user owning the items
+    @type user_id: integer
+    @ivar max_data_size: files larger than this aren't converted
+    @type max_data_size: integer
+    """
+
+    def __init__(self, processes=None, batch_size=BATCH_SIZE, user_id=1):
+        self.processes = processes
+        self.batch_size = batch_size
+        self.user_id = user_id
+        self.max_data_size = Preferences.objects.get(pk=1).max_data_size
+        self._publications = {}
+
+
+    def _prepare(self, manifest, report):
+        """Check the manifest entries and determine the items' slugs.
+
+        @param manifest: datasets to import
+        @type manifest: list of dicts
+        @param report: report entry per dataset, failures are recorded
+        @type report: list of dicts
+        @return: indexes and slugs of the datasets to import
+        @rtype: list of tuples
+        """
+        maxlen = Slug._meta.get_field('text').max_length
+        slugs = {}
+        for i, entry in enumerate(manifest):
+            if not entry.get('name') or not entry.get('file'):
+                report[i]['error'] = 'Name or file missing'
+            elif not os.path.isfile(entry['file']):
+                report[i]['error'] = 'No such file: %s' % entry['file']
+            else:
+                slug = slugify(entry['name'])[:maxlen]
+                if not slug:
+                    report[i]['error'] = 'No slug for name %s' % entry['name']
+                elif slug in slugs:
+                    report[i]['error'] = 'Slug %s used twice in manifest' % slug
+                else:
+                    slugs[slug] = i
+
+        existing = set()
+        names = slugs.keys()
+        for start in xrange(0, len(names), self.batch_size):
+            existing.update(Slug.objects.filter(
+                text__in=names[start:start + self.batch_size]
+            ).values_list('text', flat=True))
+        for slug in existing:
+            report[slugs.pop(slug)]['error'] = 'Slug %s already exists' % slug
+
+        return sorted([(i, slug) for slug, i in slugs.iteritems()])
+
+
+    def _convert(self, jobs):
+        """Convert the files of all items.
+
+        @param jobs: arguments of convert per item
+        @type jobs: list of tuples
+        @return: results of convert per item
+        @rtype: list of tuples
+        """
+        if self.processes == 1 or len(jobs) < 2:
+            return map(convert, jobs)
+
+        # the workers inherit the connection otherwise
+        connection.close()
+        pool = multiprocessing.Pool(self.processes)
+        try:
+            return pool.map(convert, jobs)
+        finally:
+            pool.close()
+            pool.join()
+
+
+    def _get_publication(self, content):
+        """Get publication with given content, created once per import.
+
+        @param content: publication text
+        @type content: string
+        @return: the publication
+        @rtype: Publication
+        """
+        if content not in self._publications:
+            title = content.strip()[:Publication._meta.get_field('title').max_length]
+            self._publications[content], created = \
+                Publication.objects.get_or_create(content=content, title=title)
+        return self._publications[content]
+
+
+    def _create(self, entry, slug, converted):
+        """Create a Data item from a manifest entry.
+
+        @param entry: dataset from the manifest
+        @type entry: dict
+        @param slug: text of the item's slug
+        @type slug: string
+        @param converted: result of convert for the item's file
+        @type converted: tuple
+        @return: the created item
+        @rtype: Data
+        """
+        fname, num_instances, num_attributes, error = converted
+        tags = entry.get('tags', [])
+        if not isinstance(tags, basestring):
+            tags = ', '.join([t.replace('.', '-') for t in tags])
+
+        slug = Slug(text=slug)
+        slug.save()
+        obj = Data(
+            pub_date=datetime.datetime.now(),
+            name=entry['name'][:Repository._meta.get_field('name').max_length],
+            slug=slug,
+            source=entry.get('source', ''),
+            description=entry.get('description', ''),
+            summary=entry.get('summary', ''),
+            version=1,
+            is_public=True,
+            is_current=True,
+            is_approved=True,
+            user_id=self.user_id,
+            license_id=entry.get('license', 1),
+            format=entry['format'],
+            num_instances=num_instances,
+            num_attributes=num_attributes,
+            tags=tags,
+        )
+        obj.file.name = fname
+        obj.save()
+        for content in entry.get('publications', []):
+            obj.publications.add(self._get_publication(content))
+        DataShape.update_for(obj)
+        return obj
+
+
+    def _delete_partial(self, slug):
+        """Delete the rows a failed item left behind.
+
+        Django 1.3 doesn't use savepoints on MySQL and SQLite, so rolling
+        back to the item's savepoint removes nothing there.
+
+        @param slug: text of the item's slug
+        @type slug: string
+        """
+        for obj in Data.objects.filter(slug__text=slug):
+            Tag.objects.update_tags(obj, None)
+        # cascades to the item, its shape and its publication links
+        Slug.objects.filter(text=slug).delete()
+
+
+    @transaction.commit_manually
+    def _create_batch(self, batch, report):
+        """Create the items of a batch in one transaction.
+
+        An item which can't be created is rolled back to its savepoint and
+        its rows are deleted, so the others are still committed.
+
+        @param batch: manifest entry, slug, result of convert and original
+            file name per item
+        @type batch: list of tuples
+        @param report: report entry per dataset
+        @type report: list of dicts
+        """
+        try:
+            for i, entry, slug, converted, fname_orig in batch:
+                sid = transaction.savepoint()
+                try:
+                    obj = self._create(entry, slug, converted)
+                except Exception, e:
+                    transaction.savepoint_rollback(sid)
+                    self._delete_partial(slug)
+                    # may have been created by the rolled back item
+                    self._publications = {}
+                    for f in set([fname_orig, os.path.join(MEDIA_ROOT, converted[0])]):
+                        if os.path.isfile(f):
+                            os.remove(f)
+                    report[i]['error'] = str(e)
+                else:
+                    transaction.savepoint_commit(sid)
+                    report[i]['slug'] = slug
+                    report[i]['id'] = obj.pk
+        except:
+            transaction.rollback()
+            raise
+        else:
+            transaction.commit()
+
+
+    def run(self, manifest):
+        """Import the datasets of given manifest.
+
+        @param manifest: datasets to import
+        @type manifest: list of dicts
+        @return: per dataset its name, the id and slug of the created item
+            or None, a conversion warning and the error if it failed
+        @rtype: list of dicts
+        """
+        report = [{'name': e.get('name'), 'id': None, 'slug': None,
+            'warning': None, 'error': None} for e in manifest]
+
+        jobs = []
+        items = []
+        for i, slug in self._prepare(manifest, report):
+            entry = dict(manifest[i])
+            if not entry.get('format'):
+                entry['format'] = ml2h5.fileformat.get(entry['file'])
+            fname_orig = os.path.join(MEDIA_ROOT, DATAPATH, slug + '.' + entry['format'])
+            jobs.append((entry['file'], fname_orig, entry['format'], self.max_data_size))
+            items.append((i, entry, slug, fname_orig))
+
+        batch = []
+        for (i, entry, slug, fname_orig), converted in zip(items, self._convert(jobs)):
+            if not converted[0]:
+                report[i]['error'] = converted[-1]
+                continue
+            report[i]['warning'] = converted[-1]
+            batch.append((i, entry, slug, converted, fname_orig))
+            if len(batch) == self.batch_size:
+                self._create_batch(batch, report)
+                batch = []
+        if batch:
+            self._create_batch(batch, report)
+
+        return report
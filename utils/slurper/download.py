@@ -0,0 +1,319 @@
+"""
+Concurrent, resumable downloads for the slurpers.
+
+Files are downloaded by a pool of threads, with at most PER_HOST
+downloads from the same host at a time. A file is written to
+<name>.part first. If the download breaks off, the next attempt, or the
+next run, asks the server for the rest with a Range request. Completed
+files are moved to their name and recorded with their size and SHA-1
+checksum in a manifest in the output directory. A slurp run which crashed
+or was stopped therefore only downloads what's missing when run again.
+"""
+
+import hashlib
+import httplib
+import os
+import Queue
+import threading
+import time
+import urllib2
+import urlparse
+
+from django.utils import simplejson
+
+# name of the manifest of completed downloads in the output directory
+MANIFEST = 'downloads.json'
+PART = '.part'
+THREADS = 8
+PER_HOST = 2
+# seconds to wait for the server to connect or send data
+TIMEOUT = 60
+RETRIES = 3
+# seconds to wait before the first retry, doubled for every further one
+RETRY_DELAY = 2
+CHUNK_SIZE = 64*1024
+
+
+class DownloadError(IOError):
+    """A download failed, e.g. it was incomplete or the server refused it."""
+
+
+def get_checksum(fname):
+    """Compute the SHA-1 checksum of a file.
+
+    @param fname: name of the file
+    @type fname: string
+    @return: hex digest
+    @rtype: string
+    """
+    sha1 = hashlib.sha1()
+    f = open(fname, 'rb')
+    try:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), ''):
+            sha1.update(chunk)
+    finally:
+        f.close()
+    return sha1.hexdigest()
+
+
+class Downloader(object):
+    """Download files into an output directory, keeping a manifest.
+
+    @ivar output: output directory, containing the manifest
+    @type output: string
+    @ivar threads: number of concurrent downloads
+    @type threads: integer
+    @ivar per_host: number of concurrent downloads from the same host
+    @type per_host: integer
+    @ivar timeout: seconds to wait for a server
+    @type timeout: integer
+    @ivar retries: number of retries of a failed download
+    @type retries: integer
+    @ivar force: download even if a file is complete already
+    @type force: boolean
+    @ivar manifest: size, checksum and URL per completed file, relative to
+        output
+    @type manifest: dict
+    """
+
+    def __init__(self, output, threads=THREADS, per_host=PER_HOST,
+            timeout=TIMEOUT, retries=RETRIES, force=False, progress=None):
+        """Construct a downloader.
+
+        @param progress: function called with a message and its level
+        @type progress: function
+        """
+        self.output = output
+        self.threads = threads
+        self.per_host = per_host
+        self.timeout = timeout
+        self.retries = retries
+        self.force = force
+        self.progress = progress or (lambda msg, lvl=0: None)
+        self.manifest = self._load_manifest()
+        self._lock = threading.Lock()
+        self._hosts = {}
+
+
+    def _load_manifest(self):
+        try:
+            f = open(os.path.join(self.output, MANIFEST), 'r')
+        except IOError: # first run
+            return {}
+        try:
+            try:
+                return simplejson.load(f)
+            except ValueError: # broken, files are checked again
+                return {}
+        finally:
+            f.close()
+
+
+    def _save_manifest(self):
+        """Write the manifest, replacing the old one only when complete.
+
+        Must be called with the lock held.
+        """
+        fname = os.path.join(self.output, MANIFEST)
+        f = open(fname + PART, 'w')
+        try:
+            simplejson.dump(self.manifest, f, indent=1, sort_keys=True)
+        finally:
+            f.close()
+        os.rename(fname + PART, fname)
+
+
+    def _get_key(self, dst):
+        return os.path.relpath(dst, self.output)
+
+
+    def is_complete(self, dst):
+        """Check whether given file was downloaded completely.
+
+        @param dst: destination filename
+        @type dst: string
+        @return: if the file is in the manifest and has the recorded size
+        @rtype: boolean
+        """
+        entry = self.manifest.get(self._get_key(dst))
+        return bool(entry) and os.path.isfile(dst) and \
+            os.path.getsize(dst) == entry['size']
+
+
+    def _record(self, src, dst):
+        """Add a completed file to the manifest.
+
+        @param src: URL the file was downloaded from
+        @type src: string
+        @param dst: destination filename
+        @type dst: string
+        """
+        entry = {'url': src, 'size': os.path.getsize(dst),
+            'sha1': get_checksum(dst)}
+        self._lock.acquire()
+        try:
+            self.manifest[self._get_key(dst)] = entry
+            self._save_manifest()
+        finally:
+            self._lock.release()
+
+
+    def _get_host_slot(self, src):
+        """Get the semaphore limiting the downloads from the host of a URL.
+
+        @param src: URL to download
+        @type src: string
+        @return: semaphore of the host
+        @rtype: threading.Semaphore
+        """
+        host = urlparse.urlparse(src)[1]
+        self._lock.acquire()
+        try:
+            if host not in self._hosts:
+                self._hosts[host] = threading.Semaphore(self.per_host)
+            return self._hosts[host]
+        finally:
+            self._lock.release()
+
+
+    def _fetch_once(self, src, part):
+        """Download a file or the rest of it to given partial file.
+
+        @param src: URL to download
+        @type src: string
+        @param part: partial file, appended to if it exists
+        @type part: string
+        @raise DownloadError: if the download was incomplete
+        """
+        offset = 0
+        if os.path.isfile(part):
+            offset = os.path.getsize(part)
+        request = urllib2.Request(src)
+        if offset:
+            request.add_header('Range', 'bytes=%d-' % offset)
+        try:
+            response = urllib2.urlopen(request, timeout=self.timeout)
+        except urllib2.HTTPError, e:
+            if e.code == 416:
+                # nothing left to download if the partial file is complete
+                if e.info().getheader('Content-Range') == 'bytes */%d' % offset:
+                    return
+                os.remove(part) # broken, start again
+            raise
+
+        try:
+            if offset and response.getcode() == 206:
+                self.progress('Resuming %s at byte %d.' % (src, offset), 4)
+                f = open(part, 'ab')
+            else: # new download, or the server ignored the range
+                offset = 0
+                f = open(part, 'wb')
+            try:
+                for chunk in iter(lambda: response.read(CHUNK_SIZE), ''):
+                    f.write(chunk)
+            finally:
+                f.close()
+            length = response.info().getheader('Content-Length')
+        finally:
+            response.close()
+
+        if length is not None and os.path.getsize(part) < offset + int(length):
+            raise DownloadError('incomplete, %d of %d bytes' %
+                (os.path.getsize(part), offset + int(length)))
+
+
+    def fetch(self, src, dst):
+        """Download a file unless it is complete already.
+
+        Failed downloads are retried after a delay, continuing the partial
+        file.
+
+        @param src: URL to download
+        @type src: string
+        @param dst: destination filename
+        @type dst: string
+        @return: error message or None if the file is complete
+        @rtype: string
+        """
+        if dst.endswith('/'): # directory in a listing
+            if not os.path.isdir(dst):
+                os.makedirs(dst)
+            return None
+        if not self.force and self.is_complete(dst):
+            self.progress(dst + ' already exists, skipping download.', 3)
+            return None
+
+        dst_dir = os.path.dirname(dst)
+        if not os.path.isdir(dst_dir):
+            try:
+                os.makedirs(dst_dir)
+            except OSError: # created by another thread meanwhile
+                pass
+        part = dst + PART
+        if self.force and os.path.isfile(part):
+            os.remove(part)
+        elif os.path.isfile(dst) and not os.path.isfile(part):
+            # not in the manifest, e.g. downloaded before there was one, so
+            # it may be incomplete; resume it, which verifies its size
+            os.rename(dst, part)
+
+        self.progress('Downloading ' + src + ' to ' + dst + '.', 3)
+        slot = self._get_host_slot(src)
+        for attempt in xrange(self.retries + 1):
+            if attempt:
+                time.sleep(RETRY_DELAY * 2**(attempt - 1))
+            slot.acquire()
+            try:
+                try:
+                    self._fetch_once(src, part)
+                except urllib2.HTTPError, e:
+                    error = 'HTTP error %d for %s' % (e.code, src)
+                    # only server errors and timeouts may go away
+                    if e.code < 500 and e.code not in (408, 416):
+                        break
+                except (IOError, httplib.HTTPException), e:
+                    error = 'Error downloading %s: %s' % (src, e)
+                else:
+                    os.rename(part, dst)
+                    self._record(src, dst)
+                    return None
+            finally:
+                slot.release()
+            self.progress(error, 4)
+        return error
+
+
+    def fetch_all(self, files):
+        """Download files concurrently.
+
+        @param files: URL and destination filename per file
+        @type files: list of tuples
+        @return: error message per destination filename of failed downloads
+        @rtype: dict
+        """
+        queue = Queue.Queue()
+        for src, dst in files:
+            queue.put((src, dst))
+        errors = {}
+
+        def work():
+            while True:
+                try:
+                    src, dst = queue.get_nowait()
+                except Queue.Empty:
+                    return
+                try:
+                    error = self.fetch(src, dst)
+                except Exception, e: # keep the thread for the other files
+                    error = 'Error downloading %s: %s' % (src, e)
+                if error:
+                    errors[dst] = error
+
+        workers = [threading.Thread(target=work)
+            for i in xrange(min(self.threads, len(files)))]
+        for w in workers:
+            w.setDaemon(True)
+            w.start()
+        for w in workers:
+            w.join()
+        return errors
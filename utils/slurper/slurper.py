@@ -5,6 +5,7 @@ from django.core.files import File
 from django.db import IntegrityError
 
 from repository.models import Repository, Data, Task, Publication
+from download import Downloader
 from preferences.models import Preferences
 from settings import MEDIA_ROOT, DATAPATH
 
@@ -31,10 +32,13 @@ class Slurper(object):
         @type problematic: list of strings
         @ivar max_data_size: max size of Data file
         @type max_data_size: integer
+        @ivar downloader: downloader into output, set by run
+        @type downloader: download.Downloader
         """
         self.options = kwargs['options']
         self.problematic = []
         self.max_data_size = Preferences.objects.get(pk=1).max_data_size
+        self.downloader = None
 
 
     def fromfile(self, name):
@@ -123,23 +127,31 @@ class Slurper(object):
 
 
 
-    def _download(self, filename):
-        """Download helper function.
+    def _download_all(self, datasets):
+        """Download the files of given datasets concurrently.
 
-        @param filename: filename to download
-        @type: string
+        @param datasets: datasets to download files of
+        @type datasets: list of dicts
+        @return: datasets whose files were downloaded completely
+        @rtype: list of dicts
         """
-        src = self.get_src(filename)
-        dst = self.get_dst(filename)
-        if not self.options.force_download and os.path.exists(dst):
-            self.progress(dst + ' already exists, skipping download.', 3)
-        else:
-            dst_dir = os.path.dirname(dst)
-            if not os.path.exists(dst_dir):
-                os.makedirs(dst_dir)
-            if not os.path.isdir(dst):
-                self.progress('Downloading ' + src + ' to ' + dst + '.', 3)
-                urllib.urlretrieve(src, dst)
+        files = []
+        for d in datasets:
+            files.extend([(self.get_src(f), self.get_dst(f)) for f in d['files']])
+        errors = self.downloader.fetch_all(files)
+
+        complete = []
+        for d in datasets:
+            failed = [errors[self.get_dst(f)] for f in d['files']
+                if self.get_dst(f) in errors]
+            if failed:
+                for error in failed:
+                    self.warn(error)
+                self.warn('Download of dataset ' + d['name'] + ' failed, skipping!')
+                self.problematic.append(d['name'])
+            else:
+                complete.append(d)
+        return complete
 
 
     def _add_slug(self, obj):
@@ -527,6 +539,7 @@ class Slurper(object):
             self.warn('HTMLParseError: ' + str(err))
             return
 
+        datasets = []
         for d in parser.datasets:
             if self.skippable(d['name']):
                 self.progress('Skipped dataset ' + d['name'], 2)
@@ -544,10 +557,13 @@ class Slurper(object):
 
             if not self.options.add_only:
                 d['files'] = self.expand_dir(d['files']) # due to UCI
-                for f in d['files']:
-                    self._download(f)
+            datasets.append(d)
+
+        if not self.options.add_only:
+            datasets = self._download_all(datasets)
 
-            if not self.options.download_only:
+        if not self.options.download_only:
+            for d in datasets:
                 if not d['task']:
                     d['task'] = task
                 for i in xrange(len(d['files'])): # get destination file names
@@ -601,6 +617,8 @@ class Slurper(object):
         self.output = os.path.join(self.options.output, self.__class__.__name__)
         if not os.path.exists(self.output):
             os.makedirs(self.output)
+        self.downloader = Downloader(self.output, threads=self.options.threads,
+            force=self.options.force_download, progress=self.progress)
 
         self.slurp() # implemented in child class
 